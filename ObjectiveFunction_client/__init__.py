@@ -5,3 +5,4 @@ from .parameter import *   # noqa: F401, F403
 from .objective_function_misfit import *  # noqa: F401,F403
 from .objective_function_residual import *  # noqa: F401,F403
 from .objective_function_simobs import *  # noqa: F401,F403
+from .aggregate import *  # noqa: F401,F403
@@ -0,0 +1,132 @@
+__all__ = ['AggregateObjectiveFunction']
+
+import logging
+import numpy
+
+from .common import PreliminaryRun, NewRun, Waiting
+
+
+class AggregateObjectiveFunction:
+    """combine the results of a parameter set in several scenarios
+
+    :param objfun: the objective function
+    :type objfun: ObjectiveFunction
+    :param scenarios: the names of the scenarios
+    :param weights: the weights of the scenarios, by default all scenarios
+                    have a weight of 1
+
+    The misfit is the weighted sum of the misfits of the scenarios. The
+    residuals of the scenarios are multiplied by the square roots of the
+    weights and concatenated so that their sum of squares is the misfit.
+    Simulated observations without targets are concatenated.
+    """
+
+    # the order in which lookup events of the scenarios are reported
+    EVENTS = (PreliminaryRun, NewRun, Waiting)
+
+    def __init__(self, objfun, scenarios, weights=None) -> None:
+        """constructor"""
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+        if len(scenarios) == 0:
+            raise ValueError('no scenarios given')
+        if weights is None:
+            weights = numpy.ones(len(scenarios))
+        weights = numpy.asarray(weights, dtype=float)
+        if weights.shape != (len(scenarios),):
+            raise ValueError('number of weights does not match scenarios')
+        if numpy.any(weights < 0):
+            raise ValueError('weights must not be negative')
+
+        self._objfun = objfun
+        self._weights = weights
+        try:
+            default = objfun.scenario_name()
+        except RuntimeError:
+            default = None
+        self._scenarios = []
+        for s in scenarios:
+            # make sure the scenario exists
+            objfun.setDefaultScenario(s)
+            self._scenarios.append(objfun.scenario_name(s))
+        if default is not None:
+            objfun.setDefaultScenario(default)
+
+    @property
+    def objectiveFunction(self):
+        """the objective function"""
+        return self._objfun
+
+    @property
+    def scenarios(self):
+        """the names of the scenarios"""
+        return self._scenarios
+
+    @property
+    def weights(self):
+        """the weights of the scenarios"""
+        return self._weights
+
+    def get_result(self, parameters):
+        """look up parameters in all scenarios
+
+        :param parameters: dictionary containing parameter values
+        :raises PreliminaryRun: when lookup fails in any scenario
+        :raises NewRun: when preliminary runs have been called again
+        :raises Waiting: when completed entries are required
+        :return: dictionary with the runs of the scenarios and the combined
+                 misfit, residual or simobs
+
+        The scenarios are looked up concurrently so that provisional runs
+        are registered in all scenarios at once.
+        """
+        runs = self._objfun.lookup_runs(parameters, self.scenarios)
+        results = {}
+        events = []
+        for scenario, run in zip(self.scenarios, runs):
+            try:
+                results[scenario] = self._objfun.run_result(
+                    run, scenario=scenario)
+            except self.EVENTS as e:
+                events.append(e)
+        for event in self.EVENTS:
+            if any(isinstance(e, event) for e in events):
+                raise event
+        return self._combine(results)
+
+    def _combine(self, results):
+        runs = [results[s] for s in self.scenarios]
+        combined = {'runs': results}
+        if all('residual' in r for r in runs):
+            combined['residual'] = numpy.concatenate(
+                [numpy.sqrt(w) * numpy.asarray(r['residual'])
+                 for w, r in zip(self.weights, runs)])
+            combined['misfit'] = float(
+                numpy.sum(numpy.square(combined['residual'])))
+        elif all('misfit' in r for r in runs):
+            combined['misfit'] = float(numpy.dot(
+                self.weights, [r['misfit'] for r in runs]))
+        else:
+            combined['simobs'] = numpy.concatenate(
+                [numpy.asarray(r['simobs']) for r in runs])
+        return combined
+
+    def __call__(self, x, grad=None):
+        """look up parameters in all scenarios
+
+        :param x: vector containing parameter values
+        :param grad: vector of length 0
+        :type grad: numpy.ndarray
+        :raises NewRun: when lookup fails
+        :raises Waiting: when completed entries are required
+        :return: the combined residuals if the objective function computes
+                 residuals, otherwise the combined misfit or simobs
+        """
+        if grad is not None and grad.size > 0:
+            raise RuntimeError(
+                'AggregateObjectiveFunction only supports derivative '
+                'free optimisations')
+        result = self.get_result(self._objfun.coarse_params(x))
+        for key in ['residual', 'misfit', 'simobs']:
+            if key in result:
+                return result[key]
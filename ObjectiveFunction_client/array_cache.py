@@ -0,0 +1,102 @@
+__all__ = ['ArrayCache']
+
+from collections import OrderedDict
+import threading
+import numpy
+
+
+class ArrayCache:
+    """a least recently used cache of arrays bounded by size
+
+    :param max_bytes: the maximum number of bytes held by the cache
+    :type max_bytes: int
+
+    Arrays larger than max_bytes are not cached. The cache can be shared
+    between threads, eg with the background uploader which invalidates
+    arrays of runs whose results are replaced.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """constructor"""
+        if max_bytes < 0:
+            raise ValueError('max_bytes must not be negative')
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._arrays = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        """the maximum number of bytes held by the cache"""
+        return self._max_bytes
+
+    @property
+    def nbytes(self) -> int:
+        """the number of bytes held by the cache"""
+        return self._nbytes
+
+    @property
+    def hits(self) -> int:
+        """the number of successful lookups"""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """the number of failed lookups"""
+        return self._misses
+
+    def __len__(self) -> int:
+        return len(self._arrays)
+
+    def __contains__(self, key) -> bool:
+        return key in self._arrays
+
+    def get(self, key) -> numpy.ndarray:
+        """get an array and mark it as most recently used
+
+        :param key: the key of the array
+        :raises KeyError: if the array is not cached
+        """
+        with self._lock:
+            try:
+                array = self._arrays[key]
+            except KeyError:
+                self._misses += 1
+                raise
+            self._arrays.move_to_end(key)
+            self._hits += 1
+            return array
+
+    def put(self, key, array: numpy.ndarray) -> None:
+        """add an array, evicting least recently used arrays
+
+        :param key: the key of the array
+        :param array: the array to store
+        """
+        with self._lock:
+            self._pop(key)
+            if array.nbytes > self._max_bytes:
+                return
+            self._arrays[key] = array
+            self._nbytes += array.nbytes
+            while self._nbytes > self._max_bytes:
+                k, a = self._arrays.popitem(last=False)
+                self._nbytes -= a.nbytes
+
+    def _pop(self, key) -> None:
+        array = self._arrays.pop(key, None)
+        if array is not None:
+            self._nbytes -= array.nbytes
+
+    def pop(self, key) -> None:
+        """remove an array from the cache if present"""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        """remove all arrays"""
+        with self._lock:
+            self._arrays.clear()
+            self._nbytes = 0
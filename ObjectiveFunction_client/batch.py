@@ -0,0 +1,421 @@
+__all__ = ['AskTellOptimiser', 'CMAES', 'BatchDriver', 'BatchConfig']
+
+from abc import ABC, abstractmethod
+import argparse
+import logging
+import os
+from pathlib import Path
+import pickle
+import sys
+import numpy
+
+from .config import ObjFunConfig
+from .surrogate import GaussianProcess
+
+
+class AskTellOptimiser(ABC):
+    """an optimiser that proposes batches of points
+
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+
+    The optimiser is driven by asking for a batch of points and telling it
+    the values of the objective function at these points.
+    """
+
+    def __init__(self, lower, upper) -> None:
+        """constructor"""
+        self._lower = numpy.asarray(lower, dtype=float)
+        self._upper = numpy.asarray(upper, dtype=float)
+        if self._lower.shape != self._upper.shape:
+            raise ValueError('lower and upper bounds differ in shape')
+        self._best_x = None
+        self._best_f = numpy.inf
+
+    @property
+    def num_params(self) -> int:
+        """the number of parameters"""
+        return len(self._lower)
+
+    @property
+    def best(self):
+        """the best point found so far and its value"""
+        return self._best_x, self._best_f
+
+    @abstractmethod
+    def ask(self):
+        """the next batch of points
+
+        :return: array of shape (number of points, number of parameters)
+        """
+        pass  # pragma: no cover
+
+    def tell(self, X, values):
+        """update the optimiser with the values of a batch of points
+
+        :param X: the points returned by :meth:`ask`
+        :param values: the values of the objective function at X
+        """
+        values = numpy.asarray(values, dtype=float)
+        i = numpy.argmin(values)
+        if values[i] < self._best_f:
+            self._best_f = values[i]
+            self._best_x = numpy.array(X[i])
+
+    @property
+    @abstractmethod
+    def done(self) -> bool:
+        """whether the optimiser has converged"""
+        pass  # pragma: no cover
+
+
+class CMAES(AskTellOptimiser):
+    """covariance matrix adaptation evolution strategy
+
+    :param x0: the initial mean
+    :param sigma: the initial step size relative to the parameter ranges
+    :type sigma: float
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+    :param popsize: the number of points per generation, by default
+                    4 + 3 ln(number of parameters)
+    :type popsize: int
+    :param max_generations: the maximum number of generations
+    :type max_generations: int
+    :param xtol: stop when the step size relative to the parameter ranges
+                 drops below xtol
+    :type xtol: float
+    :param seed: seed of the random number generator
+    :type seed: int
+
+    The strategy operates on the unit cube spanned by the bounds. Points
+    outside the bounds are moved onto the bounds.
+    """
+
+    def __init__(self, x0, sigma, lower, upper, popsize=None,
+                 max_generations=100, xtol=1e-3, seed=None) -> None:
+        """constructor"""
+        super().__init__(lower, upper)
+        n = self.num_params
+        self._rng = numpy.random.default_rng(seed)
+        self._mean = self._to_unit(numpy.asarray(x0, dtype=float))
+        self._sigma = float(sigma)
+        self._max_generations = max_generations
+        self._xtol = xtol
+        self._generation = 0
+
+        if popsize is None:
+            popsize = 4 + int(3 * numpy.log(n))
+        self._popsize = popsize
+        self._mu = popsize // 2
+        weights = numpy.log(self._mu + 0.5) - \
+            numpy.log(numpy.arange(1, self._mu + 1))
+        self._weights = weights / weights.sum()
+        self._mueff = 1 / numpy.sum(self._weights ** 2)
+
+        # strategy parameters
+        self._cc = (4 + self._mueff / n) / (n + 4 + 2 * self._mueff / n)
+        self._cs = (self._mueff + 2) / (n + self._mueff + 5)
+        self._c1 = 2 / ((n + 1.3) ** 2 + self._mueff)
+        cmu = 2 * (self._mueff - 2 + 1 / self._mueff)
+        self._cmu = min(1 - self._c1, cmu / ((n + 2) ** 2 + self._mueff))
+        self._damps = 1 + self._cs + \
+            2 * max(0, numpy.sqrt((self._mueff - 1) / (n + 1)) - 1)
+        self._chin = numpy.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        # dynamic state
+        self._pc = numpy.zeros(n)
+        self._ps = numpy.zeros(n)
+        self._C = numpy.eye(n)
+        self._B = numpy.eye(n)
+        self._D = numpy.ones(n)
+
+    def _to_unit(self, x):
+        return (x - self._lower) / (self._upper - self._lower)
+
+    def _from_unit(self, u):
+        return self._lower + u * (self._upper - self._lower)
+
+    @property
+    def popsize(self) -> int:
+        """the number of points per generation"""
+        return self._popsize
+
+    @property
+    def generation(self) -> int:
+        """the number of generations that have been evaluated"""
+        return self._generation
+
+    @property
+    def sigma(self) -> float:
+        """the step size relative to the parameter ranges"""
+        return self._sigma
+
+    @property
+    def mean(self):
+        """the mean of the search distribution"""
+        return self._from_unit(self._mean)
+
+    @property
+    def done(self) -> bool:
+        if self._generation >= self._max_generations:
+            return True
+        return self._sigma * numpy.max(self._D) < self._xtol
+
+    def ask(self):
+        z = self._rng.standard_normal((self._popsize, self.num_params))
+        u = self._mean + self._sigma * (z * self._D) @ self._B.T
+        return self._from_unit(numpy.clip(u, 0, 1))
+
+    def tell(self, X, values):
+        super().tell(X, values)
+        n = self.num_params
+        self._generation += 1
+
+        order = numpy.argsort(values)[:self._mu]
+        u = self._to_unit(numpy.asarray(X, dtype=float))[order]
+        old = self._mean
+        self._mean = self._weights @ u
+        y = (u - old) / self._sigma
+        step = self._weights @ y
+
+        invsqrtC = self._B @ numpy.diag(1 / self._D) @ self._B.T
+        self._ps = (1 - self._cs) * self._ps + \
+            numpy.sqrt(self._cs * (2 - self._cs) * self._mueff) * \
+            invsqrtC @ step
+        norm_ps = numpy.linalg.norm(self._ps)
+        hsig = norm_ps / numpy.sqrt(
+            1 - (1 - self._cs) ** (2 * self._generation)) / self._chin \
+            < 1.4 + 2 / (n + 1)
+        self._pc = (1 - self._cc) * self._pc + \
+            hsig * numpy.sqrt(self._cc * (2 - self._cc) * self._mueff) * step
+
+        rank_one = numpy.outer(self._pc, self._pc) + \
+            (1 - hsig) * self._cc * (2 - self._cc) * self._C
+        rank_mu = (y.T * self._weights) @ y
+        self._C = (1 - self._c1 - self._cmu) * self._C + \
+            self._c1 * rank_one + self._cmu * rank_mu
+        self._sigma *= numpy.exp(
+            (self._cs / self._damps) * (norm_ps / self._chin - 1))
+
+        self._C = numpy.triu(self._C) + numpy.triu(self._C, 1).T
+        D2, self._B = numpy.linalg.eigh(self._C)
+        self._D = numpy.sqrt(numpy.maximum(D2, 1e-20))
+
+
+class BatchDriver:
+    """drive an ask/tell optimiser using an objective function
+
+    :param objfun: the objective function
+    :param optimiser: the optimiser used when there is no checkpoint
+    :type optimiser: AskTellOptimiser
+    :param checkpoint: the name of the checkpoint file
+    :type checkpoint: Path
+    :param surrogate: when not None the surrogate used to screen the points
+                      of each batch if there is no checkpoint
+    :type surrogate: GaussianProcess
+    :param screen: the number of points of each batch that are evaluated
+                   using the model, the values of the remaining points are
+                   predicted by the surrogate
+    :type screen: int
+    :param kappa: the number of standard deviations subtracted from the
+                  predicted values when ranking points
+    :type kappa: float
+
+    The state of the optimiser, the batch of points under evaluation and
+    the surrogate are checkpointed so that the driver can be restarted
+    without repeating previous evaluations or refitting the surrogate.
+    """
+
+    def __init__(self, objfun, optimiser: AskTellOptimiser,
+                 checkpoint: Path, surrogate=None, screen=None,
+                 kappa=2.) -> None:
+        """constructor"""
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+        self._objfun = objfun
+        self._checkpoint = Path(checkpoint)
+        self._surrogate = surrogate
+        self._screen = screen
+        self._kappa = kappa
+        self._batch = None
+        self._screened = None
+        if self._checkpoint.exists():
+            with self._checkpoint.open('rb') as f:
+                state = pickle.load(f)
+            self._optimiser, self._batch = state[:2]
+            if len(state) > 2:
+                self._screened = state[2]
+            if len(state) > 3:
+                self._surrogate = state[3]
+            self._log.info(f'resuming from {self._checkpoint}')
+        else:
+            self._optimiser = optimiser
+
+    @property
+    def optimiser(self) -> AskTellOptimiser:
+        """the optimiser"""
+        return self._optimiser
+
+    @property
+    def surrogate(self):
+        """the surrogate used for screening or None"""
+        return self._surrogate
+
+    @surrogate.setter
+    def surrogate(self, surrogate):
+        self._surrogate = surrogate
+
+    @property
+    def batch(self):
+        """the batch of points under evaluation"""
+        return self._batch
+
+    def _save(self):
+        tmpname = self._checkpoint.with_suffix('.tmp')
+        with tmpname.open('wb') as f:
+            pickle.dump((self._optimiser, self._batch, self._screened,
+                         self._surrogate), f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmpname.replace(self._checkpoint)
+
+    def _screen_batch(self):
+        """select the points of the batch that are evaluated by the model
+
+        The selection and the predicted values are stored with the batch
+        since the surrogate changes as runs complete.
+        """
+        self._screened = None
+        if self._surrogate is None or len(self._surrogate) == 0 or \
+           self._screen is None or self._screen >= len(self._batch):
+            return
+        order = self._surrogate.rank(self._batch, kappa=self._kappa)
+        mask = numpy.zeros(len(self._batch), dtype=bool)
+        mask[order[:self._screen]] = True
+        predicted, sigma = self._surrogate.predict(self._batch)
+        self._screened = (mask, predicted)
+        self._log.info(f'evaluating {self._screen} of {len(mask)} points')
+
+    def step(self):
+        """evaluate batches until the optimiser is done or runs are pending
+
+        :return: one of done, new when new runs were registered or waiting
+                 when runs registered previously are not completed
+        """
+        while not self._optimiser.done:
+            status = 'waiting'
+            if self._batch is None:
+                self._batch = self._optimiser.ask()
+                self._screen_batch()
+                self._save()
+                status = 'new'
+            mask = None
+            if self._screened is not None:
+                mask, predicted = self._screened
+            values, runs = self._objfun.evaluate_batch(self._batch,
+                                                       mask=mask)
+            if mask is None:
+                mask = numpy.ones(len(values), dtype=bool)
+            pending = numpy.isnan(values) & mask
+            if pending.any():
+                self._log.info(f'{pending.sum()} of {mask.sum()} runs '
+                               'are not completed')
+                return status
+            if self._surrogate is not None:
+                for x, v in zip(self._batch[mask], values[mask]):
+                    self._surrogate.add(x, v)
+            if not mask.all():
+                values[~mask] = predicted[~mask]
+            self._optimiser.tell(self._batch, values)
+            self._batch = None
+            self._screened = None
+            self._save()
+            x, f = self._optimiser.best
+            self._log.info(f'best value {f} at {x}')
+        return 'done'
+
+
+class BatchConfig(ObjFunConfig):
+    batchCfgStr = """
+    [batch]
+    strategy = option('cmaes', default='cmaes')
+    popsize = integer(min=2, default=None)
+    sigma = float(min=0, default=0.3)
+    max_generations = integer(min=1, default=100)
+    xtol = float(min=0, default=1e-3)
+    seed = integer(default=1)
+    # the number of points per generation run by the model, 0 for all
+    screen = integer(min=0, default=0)
+    # length scale of the surrogate relative to the parameter ranges
+    lengthscale = float(min=0, default=0.2)
+    # weight of the uncertainty of the surrogate when ranking points
+    kappa = float(min=0, default=2)
+    """
+
+    @property
+    def defaultCfgStr(self):
+        return super().defaultCfgStr + '\n' + self.batchCfgStr
+
+    @property
+    def optimiser(self):
+        """the ask/tell optimiser configured in the batch section"""
+        batch = self.cfg['batch']
+        objfun = self.objectiveFunction
+        return CMAES(
+            objfun.params2values(self.values, include_constant=False),
+            batch['sigma'], objfun.lower_bounds, objfun.upper_bounds,
+            popsize=batch['popsize'],
+            max_generations=batch['max_generations'],
+            xtol=batch['xtol'], seed=batch['seed'])
+
+    @property
+    def surrogate(self):
+        """the surrogate used for screening or None"""
+        if self.cfg['batch']['screen'] == 0:
+            return None
+        return GaussianProcess.from_objective(
+            self.objectiveFunction,
+            lengthscale=self.cfg['batch']['lengthscale'])
+
+    @property
+    def checkpoint(self) -> Path:
+        """the name of the checkpoint file"""
+        scenario = self.objectiveFunction.scenario_name(self.scenario)
+        return self.basedir / \
+            f'batch_{scenario}_{self.cfg["batch"]["strategy"]}.pickle'
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger('ObjectiveFunction_client.batch')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=Path,
+                        help='name of configuration file')
+    args = parser.parse_args()
+
+    cfg = BatchConfig(args.config)
+    driver = BatchDriver(cfg.objectiveFunction, cfg.optimiser,
+                         cfg.checkpoint,
+                         screen=cfg.cfg['batch']['screen'],
+                         kappa=cfg.cfg['batch']['kappa'])
+    if driver.surrogate is None:
+        # only fit the surrogate when it is not restored from the checkpoint
+        driver.surrogate = cfg.surrogate
+    status = driver.step()
+    if status == 'new':
+        print('new')
+        sys.exit(1)
+    elif status == 'waiting':
+        print('waiting')
+        sys.exit(2)
+
+    x, f = driver.optimiser.best
+    log.info(f'minimum value {f}')
+    log.info(f'optimum at {x}')
+    print('done')
+
+
+if __name__ == '__main__':
+    main()
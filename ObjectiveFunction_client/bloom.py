@@ -0,0 +1,114 @@
+__all__ = ['BloomFilter']
+
+import math
+import numpy
+
+
+class BloomFilter:
+    """a Bloom filter of integer parameter vectors
+
+    :param capacity: the number of keys the filter is sized for
+    :type capacity: int
+    :param error_rate: the target false positive rate at capacity
+    :type error_rate: float
+
+    Keys are 2D integer arrays with one row per key. A key that is not in
+    the filter is definitely not present, a key that is in the filter is
+    present with a probability given by the false positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """constructor"""
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self._capacity = int(capacity)
+        self._error_rate = error_rate
+        self._num_bits = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._num_hashes = max(1, int(round(
+            self._num_bits / capacity * math.log(2))))
+        self._bits = numpy.zeros(self._num_bits // 8 + 1, dtype=numpy.uint8)
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        """the number of keys the filter is sized for"""
+        return self._capacity
+
+    @property
+    def error_rate(self) -> float:
+        """the target false positive rate"""
+        return self._error_rate
+
+    @property
+    def num_bits(self) -> int:
+        """the size of the filter in bits"""
+        return self._num_bits
+
+    @property
+    def num_hashes(self) -> int:
+        """the number of hash functions"""
+        return self._num_hashes
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def full(self) -> bool:
+        """whether the filter holds more keys than it is sized for"""
+        return self._count > self._capacity
+
+    @property
+    def false_positive_rate(self) -> float:
+        """the expected false positive rate given the number of keys"""
+        return (1 - math.exp(
+            -self._num_hashes * self._count / self._num_bits)) \
+            ** self._num_hashes
+
+    @staticmethod
+    def _mix(h):
+        # splitmix64 finaliser, wraps around modulo 2**64
+        h = (h ^ (h >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+        h = (h ^ (h >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+        return h ^ (h >> numpy.uint64(31))
+
+    def _indices(self, keys):
+        keys = numpy.atleast_2d(numpy.asarray(keys, dtype=numpy.int64))
+        h = numpy.full(keys.shape[0], 0x9e3779b97f4a7c15, dtype=numpy.uint64)
+        for c in range(keys.shape[1]):
+            h = self._mix(h ^ keys[:, c].astype(numpy.uint64))
+        h1 = self._mix(h)
+        h2 = self._mix(h1 ^ numpy.uint64(0x632be59bd9b4e019)) \
+            | numpy.uint64(1)
+        i = numpy.arange(self._num_hashes, dtype=numpy.uint64)
+        # double hashing, one row of bit indices per key
+        return (h1[:, None] + i[None, :] * h2[:, None]) \
+            % numpy.uint64(self._num_bits)
+
+    def add(self, keys) -> None:
+        """add keys to the filter
+
+        :param keys: a 2D array of integers with one row per key
+        """
+        idx = self._indices(keys)
+        numpy.bitwise_or.at(
+            self._bits, (idx >> numpy.uint64(3)).ravel(),
+            (numpy.uint8(1) << (idx & numpy.uint64(7)).astype(
+                numpy.uint8)).ravel())
+        self._count += idx.shape[0]
+
+    def contains(self, keys):
+        """check whether keys might be in the filter
+
+        :param keys: a 2D array of integers with one row per key
+        :return: boolean array, False if a key is definitely not present
+        """
+        idx = self._indices(keys)
+        bits = self._bits[idx >> numpy.uint64(3)] \
+            >> (idx & numpy.uint64(7)).astype(numpy.uint8)
+        return numpy.all(bits & 1, axis=1)
+
+    def __contains__(self, key) -> bool:
+        return bool(self.contains(key)[0])
@@ -1,15 +1,62 @@
-__all__ = ['ObjFunCache']
+__all__ = ['ObjFunCache', 'ObjFunStudyCache']
 
 import logging
 import sqlite3
+import time
 from pathlib import Path
 from collections.abc import MutableMapping
+import numpy
 
 from .common import LookupState
+from .bloom import BloomFilter
+from .columnar import ObjFunColumnarCache
 
 
 class ObjFunCache(MutableMapping):
-    def __init__(self, dbName, parameters, result_type: str):
+    """sqlite cache of lookup table entries in the COMPLETED state
+
+    :param dbName: the name of the sqlite database file or :memory:
+    :param parameters: sequence of parameter names
+    :param result_type: the type of the value column, real or text
+    :type result_type: str
+    :param max_entries: when not None the maximum number of entries kept in
+                        the cache
+    :type max_entries: int
+    :param max_size: when not None the maximum size of the cache in bytes
+    :type max_size: int
+    :param con: when not None use this sqlite connection instead of
+                opening dbName
+    :param table: the name of the lookup table or view
+    :type table: str
+    :param payloads: when True keep binary payloads of text results
+    :type payloads: bool
+
+    When the cache exceeds one of its limits the least recently looked up
+    entries are evicted. The access times of lookups are buffered and
+    written in batches so that lookups do not write to the database.
+
+    Caches of text results, ie paths to result files, can additionally
+    hold the decoded result as a binary payload so that cache hits do not
+    need to read the result file.
+
+    The keys of the cache are held in an in-memory Bloom filter so that
+    lookups of keys that are definitely not cached do not query the
+    database. Entries added by other connections are recorded in a journal
+    table. At most every FILTER_REFRESH seconds a lookup that misses the
+    filter adds the keys of the new journal entries to the filter.
+    """
+
+    FILTER_ERROR_RATE = 0.01
+    FILTER_MIN_CAPACITY = 1024
+    FILTER_REFRESH = 1.
+    # write buffered access times once there are this many of them or
+    # after this many seconds
+    ACCESS_BATCH = 1000
+    ACCESS_INTERVAL = 60.
+
+    def __init__(self, dbName, parameters, result_type: str,
+                 max_entries=None, max_size=None, con=None, table='lookup',
+                 payloads=False):
         self._log = logging.getLogger(
             f'ObjectiveFunction_client.{self.__class__.__name__}')
 
@@ -17,13 +64,45 @@ class ObjFunCache(MutableMapping):
             raise ValueError(f'wrong result_type {result_type}')
         if len(parameters) == 0:
             raise ValueError('number of parameters must be larger than 0')
+        if payloads and result_type != 'text':
+            raise ValueError('payloads require result_type text')
 
         self._parameters = tuple(sorted(parameters))
+        self._result_type = result_type
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._table = table
+        self._access = f'{table}_access'
+        self._payloads = payloads
+        self._payload = f'{table}_payload'
+        self._inserted = f'{table}_inserted'
 
-        if dbName == ':memory:' or not dbName.exists():
+        if con is not None:
+            self._con = con
+            self._check_columns()
+        elif dbName == ':memory:' or not dbName.exists():
             self._create_cache(dbName, parameters, result_type)
         else:
             self._check_cache(dbName, parameters, result_type)
+        # the access times are kept in a separate table so that caches
+        # created before eviction was supported remain valid
+        self.con.execute(
+            f'create table if not exists {self._access} ('
+            'id integer primary key, accessed real);')
+        if self.payloads:
+            self.con.execute(
+                f'create table if not exists {self._payload} ('
+                'id integer primary key, data blob);')
+        # the order in which entries were added, used to update the filter
+        self.con.execute(
+            f'create table if not exists {self._inserted} ('
+            'seq integer primary key autoincrement, id integer);')
+        self.con.commit()
+        self._last_access = self.con.execute(
+            f'select max(accessed) from {self._access};').fetchone()[0] \
+            or 0.
+        self._accessed = {}
+        self._access_written = time.time()
 
         slct = []
         insrt = [':id']
@@ -31,10 +110,26 @@ class ObjFunCache(MutableMapping):
             slct.append(f'{p}=:{p}')
             insrt.append(f':{p}')
         insrt.append(f':value')
-        self._select_query = \
-            'select id, value from lookup where ' + ' and '.join(slct) + ';'
+        if self.payloads:
+            self._select_query = \
+                f'select l.id, l.value, p.data from {self._table} as l ' \
+                f'left join {self._payload} as p on l.id = p.id where ' \
+                + ' and '.join(slct) + ';'
+        else:
+            self._select_query = \
+                f'select id, value from {self._table} where ' \
+                + ' and '.join(slct) + ';'
         self._insert_query = \
-            'insert into lookup values (' + ', '.join(insrt) + ')'
+            f'insert into {self._table} values (' + ', '.join(insrt) + ')'
+        # the run ID is the primary key of the lookup table
+        self._select_id_query = 'select {0}, value from {1} ' \
+            'where id=?;'.format(', '.join(self.parameters), self._table)
+        self._delete_query = \
+            f'delete from {self._table} where ' + ' and '.join(slct) + ';'
+
+        self._filter_negatives = 0
+        self._filter_false_positives = 0
+        self._load_filter()
 
     @property
     def con(self):
@@ -44,6 +139,28 @@ class ObjFunCache(MutableMapping):
     def parameters(self):
         return self._parameters
 
+    @property
+    def result_type(self):
+        return self._result_type
+
+    @property
+    def payloads(self):
+        """whether the cache holds binary payloads"""
+        return self._payloads
+
+    @property
+    def limited(self):
+        """whether the size of the cache is limited"""
+        return self._max_entries is not None or self._max_size is not None
+
+    @property
+    def size(self):
+        """the number of bytes used by the cache"""
+        page_size = self.con.execute('pragma page_size;').fetchone()[0]
+        pages = self.con.execute('pragma page_count;').fetchone()[0]
+        free = self.con.execute('pragma freelist_count;').fetchone()[0]
+        return (pages - free) * page_size
+
     def _create_cache(self, dbName, parameters, result_type):
         self._log.info('create db')
         self._con = sqlite3.connect(dbName)
@@ -67,9 +184,12 @@ class ObjFunCache(MutableMapping):
     def _check_cache(self, dbName, parameters, result_type):
         self._log.info('checking db')
         self._con = sqlite3.connect(dbName)
+        self._check_columns()
+
+    def _check_columns(self):
         # check parameter names
         # see https://stackoverflow.com/questions/7831371/is-there-a-way-to-get-a-list-of-column-names-in-sqlite
-        cursor = self.con.execute('select * from lookup')
+        cursor = self.con.execute(f'select * from {self._table}')
         names = list(map(lambda x: x[0], cursor.description))
         if len(names) != len(self.parameters) + 2:
             msg = "number of parameters in cache does not match"
@@ -87,22 +207,172 @@ class ObjFunCache(MutableMapping):
         if error:
             raise RuntimeError('columns in cache do not match')
 
+    def _load_filter(self, capacity=None):
+        """populate the Bloom filter with all keys in the cache"""
+        n = len(self)
+        if capacity is None:
+            capacity = max(2 * n, self.FILTER_MIN_CAPACITY)
+        self._filter = BloomFilter(capacity, self.FILTER_ERROR_RATE)
+        # entries added while scanning are added again by the next update
+        self._data_version = self._get_data_version()
+        self._filter_seq = self.journal_position
+        self._filter_checked = time.time()
+        cur = self.con.cursor()
+        cur.execute('select {0} from {1};'.format(
+            ', '.join(self.parameters), self._table))
+        while True:
+            rows = cur.fetchmany(100000)
+            if len(rows) == 0:
+                break
+            self._filter.add(numpy.array(rows, dtype=numpy.int64))
+
+    def _inserted_rows(self, seq):
+        """arrays of the journal positions and keys of entries added after
+        position seq"""
+        cur = self.con.cursor()
+        cur.execute(
+            'select j.seq, {0} from {1} as j join {2} as l on j.id = l.id '
+            'where j.seq > ? order by j.seq;'.format(
+                ', '.join(f'l.{p}' for p in self.parameters),
+                self._inserted, self._table), (seq, ))
+        while True:
+            rows = cur.fetchmany(100000)
+            if len(rows) == 0:
+                break
+            yield numpy.array(rows, dtype=numpy.int64)
+
+    @property
+    def data_version(self):
+        """changes whenever another connection modifies the database"""
+        return self._get_data_version()
+
+    @property
+    def journal_position(self):
+        """the position of the last entry of the insertion journal"""
+        return self.con.execute(
+            f'select max(seq) from {self._inserted};').fetchone()[0] or 0
+
+    def inserted(self, position):
+        """the keys of the entries added after a journal position
+
+        :param position: the position in the insertion journal
+        :type position: int
+        :return: the position of the last entry and list of keys
+
+        Entries that have been removed since are skipped.
+        """
+        keys = []
+        for rows in self._inserted_rows(position):
+            position = int(rows[-1, 0])
+            keys += [dict(zip(self.parameters, (int(v) for v in r[1:])))
+                     for r in rows]
+        return position, keys
+
+    def refresh(self):
+        """add the keys of entries added by other connections to the
+        filter"""
+        self._filter_checked = time.time()
+        version = self._get_data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        for rows in self._inserted_rows(self._filter_seq):
+            self._filter_seq = int(rows[-1, 0])
+            self._filter.add(rows[:, 1:])
+        if self._filter.full:
+            self._load_filter(capacity=2 * self._filter.capacity)
+
+    def _get_data_version(self):
+        return self.con.execute('pragma data_version;').fetchone()[0]
+
+    def _key_array(self, key):
+        return numpy.array([[key[p] for p in self.parameters]],
+                           dtype=numpy.int64)
+
     def _check_key(self, key):
         if self.parameters != tuple(sorted(key.keys())):
             raise KeyError(f'expected dictionary with keys {self.parameters}')
 
     def __getitem__(self, key):
         self._check_key(key)
+        if self._key_array(key) not in self._filter:
+            if time.time() - self._filter_checked < self.FILTER_REFRESH:
+                self._filter_negatives += 1
+                raise LookupError
+            # another connection may have added the entry
+            self.refresh()
+            if self._key_array(key) not in self._filter:
+                self._filter_negatives += 1
+                raise LookupError
         cur = self.con.cursor()
         cur.execute(self._select_query, key)
         r = cur.fetchone()
         if r is None:
+            self._filter_false_positives += 1
             raise LookupError
         run = {'id': r[0],
                'value': r[1],
                'state': LookupState.COMPLETED}
+        if self.payloads and r[2] is not None:
+            run['payload'] = r[2]
+        if self.limited:
+            self._touch(run['id'])
+            if len(self._accessed) >= self.ACCESS_BATCH or \
+               time.time() - self._access_written > self.ACCESS_INTERVAL:
+                self.flush()
         return run
 
+    def set_payload(self, runid, data: bytes):
+        """store the binary payload of a run
+
+        :param runid: the run ID
+        :type runid: int
+        :param data: the payload
+        :type data: bytes
+        """
+        if not self.payloads:
+            raise RuntimeError('cache does not hold payloads')
+        self.con.execute(
+            f'insert or replace into {self._payload} values (?, ?);',
+            (runid, sqlite3.Binary(data)))
+        self.con.commit()
+        if self.limited:
+            self.evict()
+
+    def set_value(self, runid, value):
+        """replace the value of a cached run, eg when its result was moved
+
+        :param runid: the run ID
+        :type runid: int
+        :param value: the new value
+        :raises LookupError: if there is no entry with that ID
+        """
+        # the row count of updates of views is always 0, check first
+        self.get_by_id(runid)
+        self.con.execute(
+            f'update {self._table} set value=? where id=?;', (value, runid))
+        self.con.commit()
+
+    def get_by_id(self, runid):
+        """look up an entry by its run ID
+
+        :param runid: the run ID
+        :type runid: int
+        :return: tuple of the key and the run
+        :raises LookupError: if there is no entry with that ID
+        """
+        cur = self.con.cursor()
+        cur.execute(self._select_id_query, (runid, ))
+        r = cur.fetchone()
+        if r is None:
+            raise LookupError
+        n = len(self.parameters)
+        key = dict(zip(self.parameters, r[:n]))
+        run = {'id': runid,
+               'value': r[n],
+               'state': LookupState.COMPLETED}
+        return key, run
+
     def __setitem__(self, key, run):
         self._check_key(key)
         values = dict(key)
@@ -113,20 +383,261 @@ class ObjFunCache(MutableMapping):
             cur.execute(self._insert_query, values)
         except sqlite3.IntegrityError:
             raise RuntimeError('entry already exists')
+        cur.execute(f'insert into {self._inserted} (id) values (?);',
+                    (run['id'], ))
+        self._touch(run['id'])
+        self._write_access()
+        self.con.commit()
+        self._filter.add(self._key_array(key))
+        if self._filter.full:
+            self._load_filter(capacity=2 * self._filter.capacity)
+        if self.limited:
+            self.evict()
+
+    def _touch(self, runid):
+        # make sure access times are strictly increasing
+        self._last_access = max(time.time(), self._last_access + 1e-6)
+        self._accessed[runid] = self._last_access
+
+    def _write_access(self):
+        """write the buffered access times without committing"""
+        if len(self._accessed) > 0:
+            self.con.executemany(
+                f'insert or replace into {self._access} values (?, ?);',
+                list(self._accessed.items()))
+            self._accessed = {}
+        self._access_written = time.time()
+
+    def flush(self):
+        """write the buffered access times to the database"""
+        if len(self._accessed) > 0:
+            self._write_access()
+            self.con.commit()
+
+    def _evict_oldest(self, num):
+        cur = self.con.cursor()
+        cur.execute(
+            f'select l.id from {self._table} as l '
+            f'left join {self._access} as a on l.id = a.id '
+            'order by coalesce(a.accessed, 0) limit ?;', (num, ))
+        ids = [(r[0], ) for r in cur.fetchall()]
+        cur.executemany(f'delete from {self._table} where id=?;', ids)
+        cur.executemany(f'delete from {self._access} where id=?;', ids)
+        if self.payloads:
+            cur.executemany(f'delete from {self._payload} where id=?;', ids)
         self.con.commit()
+        return len(ids)
+
+    def evict(self):
+        """evict least recently looked up entries until within limits
+
+        :return: the number of evicted entries
+        """
+        # the eviction order depends on all access times
+        self.flush()
+        evicted = 0
+        if self._max_entries is not None:
+            excess = len(self) - self._max_entries
+            if excess > 0:
+                evicted += self._evict_oldest(excess)
+        if self._max_size is not None:
+            while self.size > self._max_size:
+                n = len(self)
+                if n == 0:
+                    break
+                # freed pages are reused by sqlite, evict in batches
+                evicted += self._evict_oldest(max(1, n // 10))
+        if evicted > 0:
+            self._log.info(f'evicted {evicted} entries')
+        return evicted
+
+    def vacuum(self):
+        """compact the database file"""
+        self.flush()
+        self.con.execute(
+            f'delete from {self._access} where id not in '
+            f'(select id from {self._table});')
+        if self.payloads:
+            self.con.execute(
+                f'delete from {self._payload} where id not in '
+                f'(select id from {self._table});')
+        self.con.execute(
+            f'delete from {self._inserted} where id not in '
+            f'(select id from {self._table});')
+        self.con.commit()
+        self.con.execute('vacuum;')
+
+    def stats(self):
+        """a dictionary of cache statistics"""
+        page_size = self.con.execute('pragma page_size;').fetchone()[0]
+        pages = self.con.execute('pragma page_count;').fetchone()[0]
+        misses = self._filter_negatives + self._filter_false_positives
+        if misses > 0:
+            fpr = self._filter_false_positives / misses
+        else:
+            fpr = None
+        return {'entries': len(self),
+                'size': self.size,
+                'file_size': pages * page_size,
+                'max_entries': self._max_entries,
+                'max_size': self._max_size,
+                'filter_capacity': self._filter.capacity,
+                'filter_expected_fpr': self._filter.false_positive_rate,
+                'filter_negatives': self._filter_negatives,
+                'filter_false_positives': self._filter_false_positives,
+                'filter_fpr': fpr}
+
+    def entries(self, sample=None):
+        """iterate over all entries
+
+        :param sample: when not None only iterate over a random sample of
+                       this size
+        :type sample: int
+        :return: generator of key, run tuples
+        """
+        cur = self.con.cursor()
+        query = 'select {0}, id, value from {1}'.format(
+            ', '.join(self.parameters), self._table)
+        if sample is None:
+            cur.execute(query + ';')
+        else:
+            cur.execute(query + ' order by random() limit ?;', (sample, ))
+        n = len(self.parameters)
+        for r in cur:
+            key = dict(zip(self.parameters, r[:n]))
+            run = {'id': r[n],
+                   'value': r[n + 1],
+                   'state': LookupState.COMPLETED}
+            yield key, run
+
+    def snapshot(self, path: Path):
+        """write a memory-mapped columnar snapshot of the cache
+
+        :param path: the directory in which to store the snapshot
+        :type path: Path
+        :return: the read-only snapshot
+        :rtype: ObjFunColumnarCache
+        """
+        self._log.info(f'writing columnar snapshot to {path}')
+        return ObjFunColumnarCache.create(
+            path, self.con, self.parameters, self.result_type,
+            table=self._table)
 
     def __delitem__(self, key):
-        raise NotImplementedError
+        self._check_key(key)
+        run = self[key]
+        cur = self.con.cursor()
+        cur.execute(self._delete_query, key)
+        cur.execute(f'delete from {self._access} where id=?;', (run['id'], ))
+        self._accessed.pop(run['id'], None)
+        if self.payloads:
+            cur.execute(f'delete from {self._payload} where id=?;',
+                        (run['id'], ))
+        self.con.commit()
 
     def __iter__(self):
-        raise NotImplementedError
+        for key, run in self.entries():
+            yield key
 
     def __len__(self):
         cur = self.con.cursor()
-        cur.execute("select count(*) from lookup;")
+        cur.execute(f'select count(*) from {self._table};')
         return cur.fetchone()[0]
 
 
+class ObjFunStudyCache:
+    """a single sqlite database caching the entries of all scenarios
+
+    :param dbName: the name of the sqlite database file or :memory:
+    :param parameters: sequence of parameter names
+    :param result_type: the type of the value column, real or text
+    :type result_type: str
+
+    All scenarios share one lookup table with an additional scenario column
+    and one connection. Each scenario is accessed via a view which behaves
+    like the lookup table of a per-scenario :class:`ObjFunCache`.
+    """
+
+    def __init__(self, dbName, parameters, result_type: str):
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+
+        if result_type not in ['real', 'text']:
+            raise ValueError(f'wrong result_type {result_type}')
+        if len(parameters) == 0:
+            raise ValueError('number of parameters must be larger than 0')
+        self._parameters = tuple(sorted(parameters))
+        self._result_type = result_type
+
+        self._con = sqlite3.connect(dbName)
+        cols = []
+        for p in self.parameters:
+            if not p.isalnum():
+                raise ValueError(f'wrong parameter name {p}')
+            cols.append(f'{p} integer')
+        cols.append(f'value {result_type}')
+        self.con.execute(
+            "create table if not exists lookup ("
+            "scenario text not null, id integer not null, "
+            "{0}, primary key(scenario, id), unique(scenario, {1}));".format(
+                ",".join(cols), ",".join(self.parameters)))
+        self.con.commit()
+
+    @property
+    def con(self):
+        return self._con
+
+    @property
+    def parameters(self):
+        return self._parameters
+
+    @property
+    def scenarios(self):
+        """the names of the scenarios in the cache"""
+        cur = self.con.execute(
+            'select distinct scenario from lookup order by scenario;')
+        return [r[0] for r in cur.fetchall()]
+
+    def scenario(self, name, **kwds):
+        """get the cache of a particular scenario
+
+        :param name: the name of the scenario, must only contain
+                     alpha-numeric characters and '_'
+        :type name: str
+        :param kwds: further keyword arguments passed to ObjFunCache
+        :return: the cache
+        :rtype: ObjFunCache
+        """
+        if not name.replace('_', '').isalnum():
+            raise ValueError(f'wrong scenario name {name}')
+        view = f'lookup_{name}'
+        cols = ', '.join(self.parameters)
+        new = ', '.join(f'new.{p}' for p in self.parameters)
+        cur = self.con.cursor()
+        cur.execute(
+            f"create view if not exists {view} as "
+            f"select id, {cols}, value from lookup "
+            f"where scenario='{name}';")
+        cur.execute(
+            f"create trigger if not exists {view}_insert "
+            f"instead of insert on {view} begin "
+            f"insert into lookup values ('{name}', new.id, {new}, "
+            "new.value); end;")
+        cur.execute(
+            f"create trigger if not exists {view}_delete "
+            f"instead of delete on {view} begin "
+            f"delete from lookup where scenario='{name}' and id=old.id; "
+            "end;")
+        cur.execute(
+            f"create trigger if not exists {view}_update "
+            f"instead of update of value on {view} begin "
+            f"update lookup set value=new.value "
+            f"where scenario='{name}' and id=old.id; end;")
+        self.con.commit()
+        return ObjFunCache(None, self.parameters, self._result_type,
+                           con=self.con, table=view, **kwds)
+
+
 if __name__ == '__main__':
     cache = ObjFunCache(Path('/tmp/c.db'), ['a', 'b'], 'real')
 
@@ -0,0 +1,240 @@
+__all__ = ['ObjFunColumnarCache']
+
+import json
+import logging
+import shutil
+from pathlib import Path
+from collections.abc import Mapping
+import numpy
+from numpy.lib.format import open_memmap
+
+from .common import LookupState
+
+
+class ObjFunColumnarCache(Mapping):
+    """read-only, memory-mapped columnar snapshot of an ObjFunCache
+
+    The snapshot is a directory containing one .npy file per column. The
+    rows are sorted by the parameter columns (in the order given by the
+    sorted parameter names) so that the parameter columns themselves form
+    the key index. All columns are memory-mapped read-only so that many
+    processes can share a single copy in the page cache.
+
+    :param path: the directory containing the snapshot
+    :type path: Path
+    """
+
+    META = 'meta.json'
+    CHUNK = 100000
+
+    def __init__(self, path: Path):
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+        self._path = Path(path)
+
+        meta = self._path / self.META
+        if not meta.is_file():
+            msg = f'no columnar cache in {self._path}'
+            self._log.error(msg)
+            raise RuntimeError(msg)
+        with meta.open('r') as f:
+            meta = json.load(f)
+        self._parameters = tuple(meta['parameters'])
+        self._result_type = meta['result_type']
+        self._size = meta['size']
+
+        self._columns = {}
+        for c in self._parameters + ('id', 'value'):
+            self._columns[c] = self._load_column(c)
+
+    def _load_column(self, name):
+        fname = self._path / f'{name}.npy'
+        if self._size == 0:
+            # numpy cannot memory-map empty files
+            return numpy.load(fname)
+        return numpy.load(fname, mmap_mode='r')
+
+    @classmethod
+    def create(cls, path: Path, con, parameters, result_type: str,
+               table='lookup'):
+        """create a columnar snapshot from a sqlite lookup table
+
+        :param path: the directory to store the snapshot in
+        :type path: Path
+        :param con: sqlite connection
+        :param parameters: sorted sequence of parameter names
+        :param result_type: the type of the value column, real or text
+        :param table: the name of the lookup table
+        :return: the snapshot
+        :rtype: ObjFunColumnarCache
+
+        The snapshot is written to a temporary directory which replaces
+        any existing snapshot once complete.
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+
+        cur = con.cursor()
+        cur.execute(f'select count(*) from {table};')
+        size = cur.fetchone()[0]
+
+        dtypes = {'id': numpy.int64}
+        for p in parameters:
+            dtypes[p] = numpy.int64
+        if result_type == 'real':
+            dtypes['value'] = numpy.float64
+        else:
+            cur.execute(f'select max(length(value)) from {table};')
+            width = cur.fetchone()[0] or 1
+            dtypes['value'] = numpy.dtype(f'U{width}')
+
+        names = tuple(parameters) + ('id', 'value')
+        columns = {}
+        for c in names:
+            columns[c] = open_memmap(tmp / f'{c}.npy', mode='w+',
+                                     dtype=dtypes[c], shape=(size,))
+
+        # the unique index on the parameters makes this an ordered scan
+        cur.execute('select {0} from {1} order by {2};'.format(
+            ', '.join(names), table, ', '.join(parameters)))
+        start = 0
+        while True:
+            rows = cur.fetchmany(cls.CHUNK)
+            if len(rows) == 0:
+                break
+            end = start + len(rows)
+            for i, c in enumerate(names):
+                columns[c][start:end] = [r[i] for r in rows]
+            start = end
+        for c in names:
+            columns[c].flush()
+        del columns
+
+        with (tmp / cls.META).open('w') as f:
+            json.dump({'parameters': list(parameters),
+                       'result_type': result_type,
+                       'size': size}, f)
+
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+        return cls(path)
+
+    @property
+    def path(self):
+        """the directory containing the snapshot"""
+        return self._path
+
+    @property
+    def parameters(self):
+        """the sorted parameter names"""
+        return self._parameters
+
+    @property
+    def ids(self):
+        """array of run IDs"""
+        return self._columns['id']
+
+    @property
+    def values(self):
+        """array of values"""
+        return self._columns['value']
+
+    def column(self, name):
+        """get a column of the snapshot
+
+        :param name: the name of the parameter or id or value
+        :return: read-only memory-mapped array
+        """
+        return self._columns[name]
+
+    def keys_array(self):
+        """a 2D array of the integer parameter values, one row per entry"""
+        return numpy.stack(
+            [self._columns[p] for p in self.parameters], axis=-1)
+
+    def _find(self, key):
+        # binary search one column at a time, each slice of a column is
+        # sorted within the range matching the previous columns
+        lo = 0
+        hi = self._size
+        for p in self.parameters:
+            col = self._columns[p][lo:hi]
+            v = key[p]
+            left = int(numpy.searchsorted(col, v, side='left'))
+            right = int(numpy.searchsorted(col, v, side='right'))
+            if left == right:
+                return None
+            lo, hi = lo + left, lo + right
+        return lo
+
+    def _less(self, rows, keys):
+        """compare rows with keys in the order of the parameters
+
+        :return: boolean array, True where the row sorts before the key
+        """
+        less = numpy.zeros(len(rows), dtype=bool)
+        equal = numpy.ones(len(rows), dtype=bool)
+        for p, k in zip(self.parameters, keys):
+            col = self._columns[p][rows]
+            less |= equal & (col < k)
+            equal &= col == k
+        return less
+
+    def find(self, keys):
+        """find the rows of a batch of keys
+
+        :param keys: a dictionary mapping parameter names to arrays of
+                     integer parameter values
+        :return: array of row indices, -1 where a key is missing
+
+        All keys are located at once by a vectorised binary search over
+        the rows which are sorted by the parameter columns.
+        """
+        keys = [numpy.asarray(keys[p], dtype=numpy.int64)
+                for p in self.parameters]
+        n = len(keys[0])
+        lo = numpy.zeros(n, dtype=numpy.int64)
+        hi = numpy.full(n, self._size, dtype=numpy.int64)
+        # find the first row that does not sort before each key
+        while True:
+            active = numpy.flatnonzero(lo < hi)
+            if len(active) == 0:
+                break
+            mid = (lo[active] + hi[active]) // 2
+            less = self._less(mid, [k[active] for k in keys])
+            lo[active[less]] = mid[less] + 1
+            hi[active[~less]] = mid[~less]
+
+        rows = numpy.full(n, -1, dtype=numpy.int64)
+        candidates = numpy.flatnonzero(lo < self._size)
+        match = numpy.ones(len(candidates), dtype=bool)
+        for p, k in zip(self.parameters, keys):
+            match &= self._columns[p][lo[candidates]] == k[candidates]
+        rows[candidates[match]] = lo[candidates[match]]
+        return rows
+
+    def __getitem__(self, key):
+        if self.parameters != tuple(sorted(key.keys())):
+            raise KeyError(f'expected dictionary with keys {self.parameters}')
+        r = self._find(key)
+        if r is None:
+            raise LookupError
+        value = self.values[r]
+        if self._result_type == 'real':
+            value = float(value)
+        else:
+            value = str(value)
+        return {'id': int(self.ids[r]),
+                'value': value,
+                'state': LookupState.COMPLETED}
+
+    def __iter__(self):
+        for r in range(self._size):
+            yield {p: int(self._columns[p][r]) for p in self.parameters}
+
+    def __len__(self):
+        return self._size
@@ -7,6 +7,7 @@ from pathlib import Path
 from os.path import expandvars
 from io import StringIO
 from functools import partial
+import numpy
 import pandas
 
 from .objective_function_misfit import ObjectiveFunctionMisfit
@@ -39,7 +40,46 @@ class ObjFunConfig:
       study = string() # the name of the study
       scenario = string() # the name of the scenario
       basedir = string() # the base directory
+      # the directory holding the caches, defaults to basedir
+      cachedir = string(default=None)
+      # seed empty caches with the completed runs stored on the server
+      warm_cache = boolean(default=False)
+      # finite difference scheme used to compute gradients
+      fd_scheme = option('none', 'forward', 'central', default='none')
+      # finite difference step in units of the parameter resolution
+      fd_step = integer(min=1, default=1)
+      # coarse to fine lattice spacings relative to the parameter ranges
+      coarsening = float_list(default=list())
       objfun = string(default=misfit)
+      # maximum number of entries in each scenario cache, 0 for no limit
+      cache_max_entries = integer(min=0, default=0)
+      # maximum size of each scenario cache in MB, 0 for no limit
+      cache_max_size = float(min=0, default=0)
+      # keep the caches of all scenarios in a single database
+      study_cache = boolean(default=False)
+      # store results of completed runs in the cache
+      inline_results = boolean(default=False)
+      # upload results in the background
+      write_behind = boolean(default=False)
+      # number of directory levels used to spread the files of runs
+      fanout = integer(min=0, max=4, default=0)
+      # format of stored simulated observations
+      simobs_format = option('json', 'binary', default='json')
+      # return simulated observations as arrays instead of pandas Series
+      simobs_numpy = boolean(default=False)
+      # gzip the observation names sent to the server
+      compress_requests = boolean(default=False)
+      # compute residuals from the simulated observations and the targets
+      simobs_residuals = boolean(default=False)
+      # .npy file containing the covariance matrix of the observations
+      covariance = string(default=None)
+      # memory in MB used for caching residual arrays
+      residual_cache_size = float(min=0, default=100)
+      # store residuals in one file per run or one chunked file per scenario
+      result_store = option('file', 'chunked', default='file')
+      # precision and compression of stored residuals
+      result_precision = option('full', 'float32', 'float16', default='full')
+      result_compression = option('none', 'deflate', 'shuffle', default='none')
     """
 
     parametersCfgStr = """
@@ -52,6 +92,8 @@ class ObjFunConfig:
           resolution = float(default=1e-6) # the resolution of the parameter
           constant = boolean(default=False) # if set to True the parameter is
                                              # not optimised for
+          # reuse completed runs whose value differs by at most tolerance
+          tolerance = float(min=0, default=0)
       [[integer_parameters]]
         [[[__many__]]]
           value = integer() # the default value
@@ -59,11 +101,15 @@ class ObjFunConfig:
           max = integer() # the maximum value allowed
           constant = boolean(default=False) # if set to True the parameter is
                                             # not optimised for
+          # reuse completed runs whose value differs by at most tolerance
+          tolerance = integer(min=0, default=0)
     """
 
     targetsCfgStr = """
     [targets]
       __many__ = float
+    [weights]
+      __many__ = float
     """
 
     def __init__(self,
@@ -74,6 +120,7 @@ class ObjFunConfig:
         self._log = logging.getLogger('ObjectiveFunction.config')
 
         self._basedir = None
+        self._cachedir = None
         self._path = Path.cwd()
         self._cfg = None
         self._params = None
@@ -81,6 +128,8 @@ class ObjFunConfig:
         self._values = None
         self._objfun = None
         self._obsNames = None
+        self._targets = None
+        self._weights = None
         self._proxy = None
 
         if fname is not None:
@@ -124,6 +173,10 @@ class ObjFunConfig:
                 else:
                     errors.append(
                         f'{key} in section {section}: {error}')
+        if len(errors) == 0 and self.cfg['setup']['study_cache'] \
+           and self.cfg['setup']['cache_max_size'] > 0:
+            errors.append('cache_max_size in section setup: not supported '
+                          'with study_cache')
         if len(errors) > 0:
             msg = f'could not read configuration file {fname}'
             self._log.error(msg)
@@ -143,6 +196,7 @@ class ObjFunConfig:
     def _get_params(self):
         self._params = {}
         self._values = {}
+        self._tolerances = {}
 
         PARAMS = {'float_parameters': ParameterFloat,
                   'integer_parameters': ParameterInt}
@@ -164,6 +218,9 @@ class ObjFunConfig:
                     self._log.error(msg)
                     raise RuntimeError(msg)
                 self._values[p] = self.cfg['parameters'][t][p]['value']
+                tolerance = self.cfg['parameters'][t][p]['tolerance']
+                if tolerance > 0 and not self._params[p].constant:
+                    self._tolerances[p] = tolerance
 
     @property
     def cfg(self):
@@ -225,6 +282,13 @@ class ObjFunConfig:
             self._get_params()
         return self._params
 
+    @property
+    def tolerances(self):
+        """a dictionary of the tolerances of the parameters"""
+        if self._params is None:
+            self._get_params()
+        return self._tolerances
+
     @property
     def optimise_parameters(self):
         """a dictionary of parameters that should be optimised"""
@@ -246,6 +310,21 @@ class ObjFunConfig:
                 self._basedir.mkdir(parents=True)
         return self._basedir
 
+    @property
+    def cachedir(self):
+        """the directory holding the caches, defaults to the base directory"""
+        if self._cachedir is None:
+            if self.cfg['setup']['cachedir'] is None:
+                self._cachedir = self.basedir
+            else:
+                self._cachedir = self.expand_path(
+                    Path(self.cfg['setup']['cachedir']))
+                if not self._cachedir.exists():
+                    self._log.info(
+                        f'creating cache directory {self._cachedir}')
+                    self._cachedir.mkdir(parents=True)
+        return self._cachedir
+
     @property
     def study(self):
         """the name of the study"""
@@ -261,6 +340,61 @@ class ObjFunConfig:
         """the objective function type"""
         return self.cfg['setup']['objfun']
 
+    @property
+    def cache_max_entries(self):
+        """the maximum number of entries in a cache or None"""
+        n = self.cfg['setup']['cache_max_entries']
+        if n == 0:
+            return None
+        return n
+
+    @property
+    def cache_max_size(self):
+        """the maximum size of a cache in bytes or None"""
+        size = self.cfg['setup']['cache_max_size']
+        if size == 0:
+            return None
+        return int(size * 1024 * 1024)
+
+    @property
+    def result_dtype(self):
+        """the dtype used for storing results or None for full precision"""
+        precision = self.cfg['setup']['result_precision']
+        if precision == 'full':
+            return None
+        return precision
+
+    @property
+    def fd_scheme(self):
+        """the finite difference scheme, None if gradients are disabled"""
+        scheme = self.cfg['setup']['fd_scheme']
+        if scheme == 'none':
+            return None
+        return scheme
+
+    def _simobs_residual_options(self):
+        """keyword arguments used to compute residuals from simobs"""
+        if not self.cfg['setup']['simobs_residuals']:
+            return {}
+        return {'targets': self.targets,
+                'weights': self.weights,
+                'covariance': self.covariance}
+
+    def _objfun_options(self):
+        """keyword arguments used to instantiate the ObjectiveFunction"""
+        return {'cache_max_entries': self.cache_max_entries,
+                'cache_max_size': self.cache_max_size,
+                'study_cache': self.cfg['setup']['study_cache'],
+                'inline_results': self.cfg['setup']['inline_results'],
+                'write_behind': self.cfg['setup']['write_behind'],
+                'fanout': self.cfg['setup']['fanout'],
+                'cachedir': self.cachedir,
+                'warm_cache': self.cfg['setup']['warm_cache'],
+                'fd_scheme': self.fd_scheme,
+                'fd_step': self.cfg['setup']['fd_step'],
+                'tolerance': self.tolerances,
+                'coarsening': self.cfg['setup']['coarsening']}
+
     @property
     def objectiveFunction(self):
         """intantiate a ObjectiveFunction object from config object"""
@@ -268,14 +402,26 @@ class ObjFunConfig:
             if self.objfunType == 'misfit':
                 objfun = ObjectiveFunctionMisfit
             elif self.objfunType == 'residual':
-                objfun = ObjectiveFunctionResidual
+                cache_size = self.cfg['setup']['residual_cache_size']
+                objfun = partial(
+                    ObjectiveFunctionResidual,
+                    residual_cache_size=int(cache_size * 1024 * 1024),
+                    result_store=self.cfg['setup']['result_store'],
+                    result_dtype=self.result_dtype,
+                    result_compression=self.cfg['setup'][
+                        'result_compression'])
             elif self.objfunType == 'simobs':
                 if len(self.targets) == 0:
                     msg = 'targets required for simobs'
                     self._log.error(msg)
                     raise RuntimeError(msg)
-                objfun = partial(ObjectiveFunctionSimObs,
-                                 observationNames=self.observationNames)
+                objfun = partial(
+                    ObjectiveFunctionSimObs,
+                    observationNames=self.observationNames,
+                    simobs_format=self.cfg['setup']['simobs_format'],
+                    return_numpy=self.cfg['setup']['simobs_numpy'],
+                    compress_requests=self.cfg['setup']['compress_requests'],
+                    **self._simobs_residual_options())
             else:
                 msg = 'wrong type of objective function: ' + self.objfunType
                 self._log.error(msg)
@@ -284,7 +430,8 @@ class ObjFunConfig:
                                   self.study, self.basedir,
                                   self.parameters,
                                   scenario=self.scenario,
-                                  url_base=self.baseurl)
+                                  url_base=self.baseurl,
+                                  **self._objfun_options())
         return self._objfun
 
     @property
@@ -296,8 +443,42 @@ class ObjFunConfig:
 
     @property
     def targets(self):
-        """the targets"""
-        return pandas.Series(self.cfg['targets'])
+        """the targets in the order of the observation names"""
+        if self._targets is None:
+            targets = self.cfg['targets']
+            self._targets = pandas.Series(
+                [targets[n] for n in self.observationNames],
+                index=pandas.Index(self.observationNames))
+        return self._targets
+
+    @property
+    def weights(self):
+        """the weights of the observations or None if no weights are set
+
+        observations without a weight get a weight of 1
+        """
+        if self._weights is None and len(self.cfg['weights']) > 0:
+            weights = self.cfg['weights']
+            for n in weights:
+                if n not in self.cfg['targets']:
+                    msg = f'weight for unknown observation {n}'
+                    self._log.error(msg)
+                    raise RuntimeError(msg)
+            self._weights = pandas.Series(
+                [weights.get(n, 1.) for n in self.observationNames],
+                index=self.targets.index)
+        return self._weights
+
+    @property
+    def covariance(self):
+        """the covariance matrix of the observations or None
+
+        the matrix is ordered like the observation names
+        """
+        if self.cfg['setup']['covariance'] is None:
+            return None
+        return numpy.load(
+            self.expand_path(Path(self.cfg['setup']['covariance'])))
 
 
 if __name__ == '__main__':
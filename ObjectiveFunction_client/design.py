@@ -0,0 +1,198 @@
+__all__ = ['latin_hypercube', 'halton', 'DESIGNS', 'lattice_points',
+           'design']
+
+import argparse
+from collections import Counter
+import logging
+from pathlib import Path
+import numpy
+
+from .config import ObjFunConfig
+from .parameter import ParameterInt
+
+
+def latin_hypercube(num, lower, upper, seed=None):
+    """generate a Latin hypercube sample
+
+    :param num: the number of points
+    :type num: int
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+    :param seed: seed of the random number generator, use a fixed seed
+                 to generate the same points each time
+    :type seed: int
+    :return: array of shape (num, number of parameters)
+
+    Each parameter range is divided into num strata of equal width. Each
+    stratum of each parameter contains exactly one point.
+    """
+    lower = numpy.asarray(lower, dtype=float)
+    upper = numpy.asarray(upper, dtype=float)
+    if lower.shape != upper.shape:
+        raise ValueError('lower and upper bounds differ in shape')
+    if num < 1:
+        raise ValueError('number of points must be positive')
+    rng = numpy.random.default_rng(seed)
+    nparams = len(lower)
+    # one random stratum per point and parameter
+    strata = numpy.argsort(rng.random((num, nparams)), axis=0)
+    unit = (strata + rng.random((num, nparams))) / num
+    return lower + unit * (upper - lower)
+
+
+def _primes(num):
+    """the first num prime numbers"""
+    primes = []
+    candidate = 2
+    while len(primes) < num:
+        if all(candidate % p != 0 for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def halton(num, lower, upper, seed=None):
+    """generate points of the Halton sequence
+
+    :param num: the number of points
+    :type num: int
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+    :param seed: the number of leading points of the sequence to skip,
+                 use different values to extend a design
+    :type seed: int
+    :return: array of shape (num, number of parameters)
+
+    The coordinates of the points are the radical inverses of the point
+    indices in the bases given by the first prime numbers. The sequence
+    starts at index 1 to avoid the lower corner.
+    """
+    lower = numpy.asarray(lower, dtype=float)
+    upper = numpy.asarray(upper, dtype=float)
+    if lower.shape != upper.shape:
+        raise ValueError('lower and upper bounds differ in shape')
+    if num < 1:
+        raise ValueError('number of points must be positive')
+    start = 1 + (seed or 0)
+    index = numpy.arange(start, start + num)
+    unit = numpy.zeros((num, len(lower)))
+    for j, base in enumerate(_primes(len(lower))):
+        i = index.copy()
+        f = 1.
+        while numpy.any(i > 0):
+            f /= base
+            unit[:, j] += f * (i % base)
+            i //= base
+    return lower + unit * (upper - lower)
+
+
+DESIGNS = {'lhs': latin_hypercube,
+           'halton': halton}
+
+
+def lattice_points(objfun, X):
+    """map points onto the lattice of the stored parameter values
+
+    :param objfun: the objective function
+    :param X: array of shape (number of points, number of active
+              parameters)
+    :return: list of dictionaries of parameter values
+
+    Float parameters are rounded to their resolution and integer parameters
+    to the nearest integer. Points that map to the same lattice point are
+    only returned once.
+    """
+    points = []
+    seen = set()
+    for x in X:
+        params = {}
+        key = []
+        for p, v in objfun.values2params(x).items():
+            param = objfun.parameters[p]
+            if isinstance(param, ParameterInt):
+                v = int(round(v))
+            dbval = param.transform(v)
+            params[p] = param.inv_transform(dbval)
+            key.append((p, dbval))
+        key = tuple(sorted(key))
+        if key not in seen:
+            seen.add(key)
+            points.append(params)
+    return points
+
+
+def design(objfun, num, method='lhs', seed=None, scenario=None,
+           register=True):
+    """generate a space-filling design and register its runs
+
+    :param objfun: the objective function
+    :param num: the number of points
+    :type num: int
+    :param method: the design, one of the keys of DESIGNS
+    :type method: str
+    :param seed: the seed of the design
+    :type seed: int
+    :param scenario: when not None override default scenario
+    :type scenario: str
+    :param register: when False only generate the points
+    :type register: bool
+    :return: list of parameter sets and list of runs (None when the runs
+             are not registered)
+
+    Points that are not known yet are registered as new runs using
+    concurrent requests.
+    """
+    try:
+        generate = DESIGNS[method]
+    except KeyError:
+        raise ValueError(f'unknown design {method}')
+    X = generate(num, objfun.lower_bounds, objfun.upper_bounds, seed=seed)
+    points = lattice_points(objfun, X)
+    runs = None
+    if register:
+        runs = objfun.get_runs(points, scenario=scenario)
+    return points, runs
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=Path,
+                        help='name of configuration file')
+    parser.add_argument('-S', '--scenario',
+                        help="the scenario, defaults to the configured one")
+    parser.add_argument('-d', '--dry-run', action='store_true',
+                        default=False,
+                        help='print the points without registering them')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for method, hlp in [('lhs', 'Latin hypercube design'),
+                        ('halton', 'Halton sequence design')]:
+        p = subparsers.add_parser(method, help=hlp)
+        p.add_argument('-n', '--number', type=int, required=True,
+                       help='the number of points')
+        p.add_argument('--seed', type=int,
+                       help='the random seed or, for the Halton sequence, '
+                       'the number of points to skip')
+        p.set_defaults(method=method)
+    args = parser.parse_args()
+
+    if args.number < 1:
+        parser.error('the number of points must be positive')
+
+    cfg = ObjFunConfig(args.config)
+    objfun = cfg.objectiveFunction
+    points, runs = design(objfun, args.number, method=args.method,
+                          seed=args.seed, scenario=args.scenario,
+                          register=not args.dry_run)
+    if runs is None:
+        for p in points:
+            print(p)
+        return
+    states = Counter(r['state'].name for r in runs)
+    counts = ', '.join(f'{n} {s}' for s, n in sorted(states.items()))
+    print(f'{len(points)} distinct points of {args.number}: {counts}')
+
+
+if __name__ == '__main__':
+    main()
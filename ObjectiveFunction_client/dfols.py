@@ -17,6 +17,46 @@ class DFOLSConfig(ObjFunConfig):
             msg = 'objective function type must be either residual or simobs'
             self._log.error(msg)
             raise RuntimeError(msg)
+        if self.objfunType == 'simobs' and \
+           not self.cfg['setup']['simobs_residuals']:
+            self._log.warning('using simulated observations as residuals, '
+                              'set simobs_residuals to use the targets')
+
+
+# the initial trust region radius relative to the parameter ranges
+RHOBEG = 0.1
+
+
+def initial_points(x0, lower, upper, rhobeg=RHOBEG):
+    """the initial interpolation points used by DFO-LS
+
+    :param x0: the starting point
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+    :param rhobeg: the initial trust region radius relative to the
+                   parameter ranges
+    :type rhobeg: float
+    :return: array of the starting point followed by one point per
+             parameter
+
+    DFO-LS moves the starting point onto the bounds or at least rhobeg
+    away from them. With scaling within bounds and coordinate initial
+    directions it then steps by rhobeg along each coordinate, towards the
+    lower bound if the point is on the upper bound.
+    """
+    lower = numpy.asarray(lower, dtype=float)
+    upper = numpy.asarray(upper, dtype=float)
+    xs = (numpy.asarray(x0, dtype=float) - lower) / (upper - lower)
+    xs = numpy.where((0 < xs) & (xs <= rhobeg), rhobeg, xs)
+    xs = numpy.where(xs <= 0, 0., xs)
+    xs = numpy.where((1 - rhobeg <= xs) & (xs < 1), 1 - rhobeg, xs)
+    xs = numpy.where(xs >= 1, 1., xs)
+    points = [xs]
+    for i in range(len(xs)):
+        p = xs.copy()
+        p[i] += -rhobeg if xs[i] >= 1 else rhobeg
+        points.append(p)
+    return lower + numpy.array(points) * (upper - lower)
 
 
 def main():
@@ -26,23 +66,40 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('config', type=Path,
                         help='name of configuration file')
+    parser.add_argument('--no-replay', action='store_true', default=False,
+                        help='do not replay results of previous runs')
+    parser.add_argument('-w', '--warm-start', action='store_true',
+                        default=False,
+                        help='start from the best completed run')
     args = parser.parse_args()
 
     cfg = DFOLSConfig(args.config)
+    objfun = cfg.objectiveFunction
+    x0 = objfun.params2values(cfg.values, include_constant=False)
+    if args.warm_start:
+        x0 = objfun.warm_start('dfols', x0)
+
+    # register the initial points in one go so that they can be run
+    # concurrently, the points are mapped onto the lattice in the order
+    # they are evaluated to match the proposals of the optimiser
+    objfun.reset_coarsening()
+    objfun.get_runs([objfun.coarse_params(x) for x in initial_points(
+        x0, objfun.lower_bounds, objfun.upper_bounds)])
 
     # run optimiser twice to detect whether new parameter set is stable
     for i in range(2):
+        if not args.no_replay:
+            objfun.start_replay('dfols')
+        else:
+            objfun.reset_coarsening()
         # start with lower bounds
         try:
             x = solve(
-                lambda x: cfg.objectiveFunction(x, numpy.array([])),
-                cfg.objectiveFunction.params2values(cfg.values,
-                                                    include_constant=False),
-                bounds=(
-                    cfg.objectiveFunction.lower_bounds,
-                    cfg.objectiveFunction.upper_bounds),
-                scaling_within_bounds=True
-            )
+                lambda x: objfun(x, numpy.array([])), x0,
+                bounds=(objfun.lower_bounds, objfun.upper_bounds),
+                rhobeg=RHOBEG, scaling_within_bounds=True,
+                user_params={'init.random_initial_directions': False,
+                             'init.run_in_parallel': True})
         except PreliminaryRun:
             log.info('new parameter set')
             continue
@@ -115,6 +115,8 @@ def main():
 
         # store results for parameter set in lookup table
         objfun.set_result(params, result)
+        # wait for the result to be uploaded
+        objfun.flush()
 
 
 if __name__ == '__main__':
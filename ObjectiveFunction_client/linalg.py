@@ -0,0 +1,28 @@
+__all__ = ['solve_lower']
+
+import numpy
+
+
+def solve_lower(L, b, block=256):
+    """solve L x = b for a lower triangular matrix L
+
+    :param L: lower triangular matrix of shape (n, n)
+    :param b: array of shape (n, ) or (n, m)
+    :param block: the number of rows solved at a time
+    :type block: int
+    :return: the solution x with the shape of b
+
+    Blocked forward substitution, the off-diagonal blocks are eliminated
+    using matrix products so that the work is O(n^2) per right-hand side.
+    """
+    L = numpy.asarray(L, dtype=float)
+    b = numpy.asarray(b, dtype=float)
+    n = L.shape[0]
+    if L.shape != (n, n) or b.shape[0] != n:
+        raise ValueError('shapes of matrix and right-hand side do not match')
+    x = numpy.empty_like(b)
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        rhs = b[start:end] - L[start:end, :start] @ x[:start]
+        x[start:end] = numpy.linalg.solve(L[start:end, start:end], rhs)
+    return x
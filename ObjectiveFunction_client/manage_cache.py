@@ -0,0 +1,182 @@
+import argparse
+from pathlib import Path
+import json
+import sys
+import logging
+
+from .config import ObjFunConfig
+from .common import LookupState
+from .storage import FileStore, load_result, locate, relayout
+
+
+def stats(objfun, scenario, args):
+    """print cache statistics"""
+    for k, v in objfun.cache(scenario).stats().items():
+        print(f'{k}: {v}')
+
+
+def vacuum(objfun, scenario, args):
+    """evict entries exceeding the limits and compact the cache"""
+    cache = objfun.cache(scenario)
+    before = cache.stats()['file_size']
+    cache.evict()
+    cache.vacuum()
+    after = cache.stats()['file_size']
+    print(f'reduced cache from {before} to {after} bytes')
+
+
+def verify(objfun, scenario, args):
+    """spot-check a random sample of cache entries against the server"""
+    errors = 0
+    checked = 0
+    for key, entry in list(
+            objfun.cache(scenario).entries(sample=args.number)):
+        runid = entry['id']
+        value = entry['value']
+        run = objfun.get_run_by_id(runid, scenario=scenario,
+                                   use_cache=False)
+        checked += 1
+        state = run.get('state')
+        if state is not None and state != LookupState.COMPLETED.name:
+            print(f'run {runid} is in state {state}')
+            errors += 1
+        elif 'value' in run and run['value'] != value:
+            print(f'value of run {runid} does not match')
+            errors += 1
+    print(f'checked {checked} entries, {errors} errors')
+    return errors == 0
+
+
+def export_cache(objfun, scenario, args):
+    """export the cache as JSON lines"""
+    if args.output is None:
+        out = sys.stdout
+    else:
+        out = args.output.open('w')
+    for key, run in objfun.cache(scenario).entries():
+        out.write(json.dumps({'id': run['id'],
+                              'value': run['value'],
+                              'parameters': key}) + '\n')
+    if args.output is not None:
+        out.close()
+
+
+def import_cache(objfun, scenario, args):
+    """import entries from JSON lines"""
+    cache = objfun.cache(scenario)
+    added = 0
+    skipped = 0
+    with args.input.open('r') as inp:
+        for line in inp:
+            entry = json.loads(line)
+            try:
+                cache[entry['parameters']] = {'id': entry['id'],
+                                              'value': entry['value']}
+                added += 1
+            except RuntimeError:
+                skipped += 1
+    print(f'imported {added} entries, skipped {skipped} existing entries')
+
+
+def migrate_results(objfun, scenario, args):
+    """move the results of completed runs stored one file per run to the
+    result store"""
+    if not hasattr(objfun, 'store'):
+        print('objective function does not store results in files')
+        return False
+    if isinstance(objfun.store(scenario), FileStore):
+        print('result store is file per run, set result_store=chunked')
+        return False
+    scenario = objfun.scenario_name(scenario)
+    store = objfun.store(scenario)
+    cache = objfun.cache(scenario)
+    migrated = 0
+    # the server knows all completed runs, the cache may only hold some
+    for run in objfun.completed_runs(scenario):
+        ref = run['value']
+        if not FileStore.handles(ref):
+            continue
+        # the file may have been moved to a different fan-out layout
+        path = locate(ref)
+        new_ref = store.save(run['id'], load_result(path, mmap=False))
+        objfun._put_value(scenario, run['id'],
+                          {'value': new_ref, 'force': True})
+        # the run stays completed, only its reference changes
+        try:
+            cache.set_value(run['id'], new_ref)
+        except LookupError:
+            # the run is not cached
+            pass
+        if args.remove:
+            Path(path).unlink()
+        migrated += 1
+    print(f'migrated {migrated} results')
+
+
+def warm(objfun, scenario, args):
+    """seed the cache with the completed runs stored on the server"""
+    added = objfun.warm_cache(scenario)
+    print(f'added {added} runs to the cache')
+
+
+def relayout_results(objfun, scenario, args):
+    """move the files of runs to a different fan-out layout"""
+    levels = objfun.fanout if args.levels is None else args.levels
+    moved = relayout(objfun.scenario_dir(scenario), levels)
+    print(f'moved {moved} files')
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=Path,
+                        help='name of configuration file')
+    parser.add_argument('-S', '--scenario',
+                        help="the scenario, defaults to the configured one")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('stats', help='show cache statistics')
+    p.set_defaults(func=stats)
+    p = subparsers.add_parser(
+        'vacuum', help='evict entries exceeding limits and compact cache')
+    p.set_defaults(func=vacuum)
+    p = subparsers.add_parser(
+        'verify', help='spot-check cache entries against the server')
+    p.add_argument('-n', '--number', type=int, default=10,
+                   help='the number of entries to check, default=10')
+    p.set_defaults(func=verify)
+    p = subparsers.add_parser('export', help='export cache as JSON lines')
+    p.add_argument('-o', '--output', type=Path,
+                   help='the output file, defaults to stdout')
+    p.set_defaults(func=export_cache)
+    p = subparsers.add_parser('import', help='import cache from JSON lines')
+    p.add_argument('input', type=Path, help='the input file')
+    p.set_defaults(func=import_cache)
+    p = subparsers.add_parser(
+        'migrate-results',
+        help='move results stored one file per run to the result store')
+    p.add_argument('-r', '--remove', action='store_true', default=False,
+                   help='remove the migrated files')
+    p.set_defaults(func=migrate_results)
+    p = subparsers.add_parser(
+        'warm', help='seed the cache with the completed runs on the server')
+    p.set_defaults(func=warm)
+    p = subparsers.add_parser(
+        'relayout',
+        help='move the files of runs to a different fan-out layout')
+    p.add_argument('-l', '--levels', type=int,
+                   help='the number of directory levels, '
+                   'defaults to the configured fanout')
+    p.set_defaults(func=relayout_results)
+
+    args = parser.parse_args()
+
+    cfg = ObjFunConfig(args.config)
+    objfun = cfg.objectiveFunction
+    if args.func(objfun, args.scenario, args) is False:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+__all__ = ['NeighbourIndex']
+
+import itertools
+import numpy
+
+
+class NeighbourIndex:
+    """index of transformed parameter sets for tolerance based lookups
+
+    :param parameters: the names of the parameters
+    :param tolerance: the tolerance of each parameter in units of the
+                      transformed (integer) parameter values
+
+    Two parameter sets are neighbours if none of their transformed values
+    differ by more than the tolerance of the parameter.
+
+    The parameter sets are hashed into a grid whose cells are one larger
+    than the tolerances so that the neighbours of a parameter set lie in
+    the adjacent cells along the parameters with a non-zero tolerance.
+    When there are more adjacent cells than occupied cells all cells are
+    searched instead.
+    """
+
+    def __init__(self, parameters, tolerance) -> None:
+        """constructor"""
+        self._parameters = tuple(parameters)
+        self._tolerance = numpy.asarray(tolerance, dtype=numpy.int64)
+        if self._tolerance.shape != (len(self._parameters),):
+            raise ValueError('number of tolerances does not match parameters')
+        self._width = self._tolerance + 1
+        self._cells = {}
+        self._size = 0
+        # the offsets of the adjacent cells
+        steps = [(-1, 0, 1) if t > 0 else (0, ) for t in self._tolerance]
+        self._offsets = numpy.array(list(itertools.product(*steps)),
+                                    dtype=numpy.int64)
+
+    def _key_array(self, key):
+        return numpy.array([key[p] for p in self._parameters],
+                           dtype=numpy.int64)
+
+    def _cell(self, k):
+        return tuple(int(c) for c in k // self._width)
+
+    @property
+    def keys(self):
+        """array of the indexed transformed parameter sets"""
+        keys = [k for cell in self._cells.values() for k in cell]
+        return numpy.array(keys, dtype=numpy.int64).reshape(
+            len(keys), len(self._parameters))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key):
+        """add a transformed parameter set, adding it again has no effect
+
+        :param key: dictionary of transformed parameter values
+        """
+        k = self._key_array(key)
+        cell = self._cells.setdefault(self._cell(k), set())
+        n = len(cell)
+        cell.add(tuple(int(v) for v in k))
+        self._size += len(cell) - n
+
+    def remove(self, key):
+        """remove a transformed parameter set if present
+
+        :param key: dictionary of transformed parameter values
+        """
+        k = self._key_array(key)
+        c = self._cell(k)
+        cell = self._cells.get(c)
+        if cell is None:
+            return
+        n = len(cell)
+        cell.discard(tuple(int(v) for v in k))
+        self._size -= n - len(cell)
+        if len(cell) == 0:
+            del self._cells[c]
+
+    def candidates(self, key):
+        """the neighbours of a transformed parameter set
+
+        :param key: dictionary of transformed parameter values
+        :return: list of the neighbours starting with the nearest one
+        """
+        k = self._key_array(key)
+        if len(self._offsets) > len(self._cells):
+            cells = self._cells.values()
+        else:
+            base = k // self._width
+            cells = [self._cells.get(tuple(int(c) for c in base + o))
+                     for o in self._offsets]
+        keys = [n for cell in cells if cell is not None for n in cell]
+        if len(keys) == 0:
+            return []
+        keys = numpy.array(keys, dtype=numpy.int64)
+        diff = numpy.abs(keys - k)
+        match = numpy.all(diff <= self._tolerance, axis=1)
+        keys = keys[match]
+        # distance relative to the tolerances
+        scaled = diff[match] / numpy.maximum(self._tolerance, 1)
+        order = numpy.argsort(numpy.sum(scaled ** 2, axis=1), kind='stable')
+        return [dict(zip(self._parameters, (int(v) for v in keys[i])))
+                for i in order]
+
+    def query(self, key):
+        """find the nearest neighbour of a transformed parameter set
+
+        :param key: dictionary of transformed parameter values
+        :return: the nearest neighbour or None if there is no neighbour
+                 within the tolerance
+        """
+        candidates = self.candidates(key)
+        if len(candidates) == 0:
+            return None
+        return candidates[0]
@@ -1,13 +1,18 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Mapping
 from pathlib import Path
 import numpy
 
 from .proxy import Proxy
-from .parameter import Parameter
+from .parameter import Parameter, ParameterInt
 from .common import RunType, LookupState
 from .common import PreliminaryRun, NewRun, Waiting, NoNewRun
-from .cache import ObjFunCache
+from .cache import ObjFunCache, ObjFunStudyCache
+from .uploader import ResultUploader
+from .storage import partitioned_path
+from .replay import ReplayJournal
+from .neighbours import NeighbourIndex
 
 
 class ObjectiveFunction:
@@ -33,17 +38,72 @@ class ObjectiveFunction:
     :type prelim: bool
     :param url_base: base URL for ObjectiveFunction server API,
                      defaults to 'http://localhost:5000/api/'
+    :param cache_max_entries: when not None limit the number of entries
+                              in each scenario cache
+    :type cache_max_entries: int
+    :param cache_max_size: when not None limit the size of each scenario
+                           cache (in bytes), not supported with study_cache
+    :type cache_max_size: int
+    :param study_cache: when True keep the caches of all scenarios in a
+                        single database in basedir
+    :type study_cache: bool
+    :param inline_results: when True store the decoded results of
+                           completed runs in the cache if the result type
+                           is text
+    :type inline_results: bool
+    :param write_behind: when True results are staged in basedir and
+                         uploaded in a background thread, call
+                         :meth:`flush` or use the object as a context
+                         manager to wait for the uploads
+    :type write_behind: bool
+    :param fanout: the number of directory levels used to spread the files
+                   of individual runs in the scenario directory, 0 for a
+                   flat directory
+    :type fanout: int
+    :param cachedir: the directory in which the caches are kept, defaults
+                     to basedir
+    :type cachedir: Path
+    :param warm_cache: when True seed empty caches with the completed runs
+                       stored on the server
+    :type warm_cache: bool
+    :param fd_scheme: the finite difference scheme used to compute
+                      gradients, one of 'forward' or 'central'. When None
+                      gradients are not supported
+    :type fd_scheme: str
+    :param fd_step: the finite difference step in units of the resolution
+                    of float parameters, integer parameters use steps of 1
+    :type fd_step: int
+    :param tolerance: dictionary mapping parameter names to tolerances.
+                      When set, a parameter set that is not found in the
+                      cache is matched with the nearest completed run in
+                      the cache whose parameters differ by no more than
+                      the tolerances
     """
 
     RESULT_TYPE = "real"
+    # the maximum size in bytes of results stored inline in the cache
+    INLINE_MAX_SIZE = 1024 * 1024
+    # the maximum number of concurrent requests used to register runs
+    MAX_WORKERS = 8
+    FD_SCHEMES = ('forward', 'central')
+    # refine the lattice once the coarse spacing exceeds this fraction of
+    # the step between successive points
+    COARSEN_RATIO = 0.1
 
     def __init__(self, appname: str, secret: str,
                  study: str, basedir: Path,  # noqa C901
                  parameters: Mapping[str, Parameter],
                  scenario=None, runtype=RunType.MISFIT, prelim=True,
-                 url_base='http://localhost:5000/api/'):
+                 url_base='http://localhost:5000/api/',
+                 cache_max_entries=None, cache_max_size=None,
+                 study_cache=False, inline_results=False,
+                 write_behind=False, fanout=0, cachedir=None,
+                 warm_cache=False, fd_scheme=None, fd_step=1,
+                 tolerance=None, coarsening=None):
         """constructor"""
 
+        self._check_options(fd_scheme, fd_step, study_cache, cache_max_size)
+
         self._proxy = Proxy(appname, secret, url_base=url_base)
 
         if len(parameters) == 0:
@@ -82,6 +142,27 @@ class ObjectiveFunction:
                 response.status_code, response.content))
 
         self._cache = {}
+        self._cache_max_entries = cache_max_entries
+        self._cache_max_size = cache_max_size
+        self._use_study_cache = study_cache
+        self._inline_results = inline_results and self.RESULT_TYPE == 'text'
+        self._study_cache = None
+        self._cachedir = cachedir
+        self._warm_cache = warm_cache
+        self._fanout = fanout
+        self._fd_scheme = fd_scheme
+        self._fd_step = fd_step
+        self._tolerance = self._lattice_tolerance(tolerance)
+        self._neighbours = {}
+        self._neighbours_journal = {}
+        self._coarsening = self._lattice_coarsening(coarsening)
+        self.reset_coarsening()
+
+        self._replay = None
+
+        self._uploader = None
+        if write_behind:
+            self._uploader = ResultUploader(self, self.basedir / 'uploads')
 
         self._lb = None
         self._ub = None
@@ -91,6 +172,57 @@ class ObjectiveFunction:
         if scenario is not None:
             self.setDefaultScenario(scenario)
 
+    def _check_options(self, fd_scheme, fd_step, study_cache,
+                       cache_max_size):
+        """check options that depend on each other"""
+        if fd_scheme not in (None,) + self.FD_SCHEMES or fd_step < 1:
+            raise ValueError('wrong finite difference scheme {0} or step '
+                             '{1}'.format(fd_scheme, fd_step))
+        if study_cache and cache_max_size is not None:
+            # the size of the shared database cannot be bounded by
+            # evicting the entries of a single scenario
+            raise ValueError('cache_max_size is not supported with '
+                             'study_cache')
+
+    def _lattice_tolerance(self, tolerance):
+        """convert tolerances to units of the transformed parameters"""
+        if not tolerance:
+            return None
+        unknown = set(tolerance) - set(self.active_parameters)
+        if len(unknown) > 0:
+            raise ValueError('tolerance given for unknown or constant '
+                             'parameters ' + ', '.join(sorted(unknown)))
+        lattice = []
+        for p in self._paramlist:
+            tol = tolerance.get(p, 0)
+            if tol < 0:
+                raise ValueError(f'negative tolerance for parameter {p}')
+            if isinstance(self.parameters[p], ParameterInt):
+                lattice.append(int(tol))
+            else:
+                # allow for rounding errors of the division
+                steps = tol / self.parameters[p].resolution
+                lattice.append(int(steps + 1e-9))
+        return lattice
+
+    def _lattice_coarsening(self, coarsening):
+        """the levels of the coarsening schedule from coarse to fine and
+        the spacings of the transformed active parameters"""
+        if not coarsening:
+            return None
+        if any(c <= 0 or c >= 1 for c in coarsening):
+            raise ValueError('lattice coarsening must be between 0 and 1')
+        schedule = []
+        for c in sorted(coarsening, reverse=True):
+            spacing = []
+            for p in self._active_paramlist:
+                param = self.parameters[p]
+                steps = param.transform(param.maxv) - \
+                    param.transform(param.minv)
+                spacing.append(max(1, int(c * steps)))
+            schedule.append((c, spacing))
+        return schedule
+
     def _create_study(self, param_dict):
         self._log.debug(f'creating study {self.study}')
         response = self._proxy.post('create_study',
@@ -131,7 +263,14 @@ class ObjectiveFunction:
     @property
     def basedir(self):
         """the basedirectory"""
-        return self._basedir
+        return Path(self._basedir)
+
+    @property
+    def cachedir(self):
+        """the directory in which the caches are kept"""
+        if self._cachedir is None:
+            return self.basedir
+        return Path(self._cachedir)
 
     def scenario_name(self, scenario=None):
         """return scenario name
@@ -166,6 +305,41 @@ class ObjectiveFunction:
             sdir.mkdir()
         return sdir
 
+    @property
+    def fanout(self):
+        """the number of directory levels of the fan-out layout"""
+        return self._fanout
+
+    def run_path(self, name, runid, scenario=None):
+        """get the name of a file associated with a run
+
+        :param name: the name of the file
+        :type name: str
+        :param runid: the run ID
+        :type runid: int
+        :param scenario: when not None override default scenario
+        :type scenario: str
+
+        create the directory containing the file if it does not exist
+        """
+        path = partitioned_path(self.scenario_dir(scenario), name, runid,
+                                self.fanout)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def cache_dir(self, scenario=None):
+        """get the directory containing the cache of the scenario
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+
+        create the directory if it does not exist
+        """
+        cdir = self.cachedir / self.scenario_name(scenario)
+        if not cdir.exists():
+            cdir.mkdir(parents=True)
+        return cdir
+
     def cache(self, scenario=None):
         """return the cache associated with a scenario
 
@@ -173,15 +347,81 @@ class ObjectiveFunction:
         :type scenario: str
 
         create a sqlite database containing a cache of lookup table
-        entries that are in the COMPLETED state
+        entries that are in the COMPLETED state. When the study cache is
+        enabled all scenarios share a single database. When warm_cache is
+        enabled a new empty cache is seeded from the server.
         """
         name = self.scenario_name(scenario)
         if name not in self._cache:
-            self._cache[name] = ObjFunCache(
-                self.scenario_dir(scenario) / 'cache.sqlite',
-                self.parameters.keys(), self.RESULT_TYPE)
+            limits = {'max_entries': self._cache_max_entries,
+                      'max_size': self._cache_max_size,
+                      'payloads': self._inline_results}
+            if self._use_study_cache:
+                if self._study_cache is None:
+                    self._study_cache = ObjFunStudyCache(
+                        self.cachedir / 'study_cache.sqlite',
+                        self.parameters.keys(), self.RESULT_TYPE)
+                self._cache[name] = self._study_cache.scenario(
+                    name, **limits)
+            else:
+                self._cache[name] = ObjFunCache(
+                    self.cache_dir(scenario) / 'cache.sqlite',
+                    self.parameters.keys(), self.RESULT_TYPE, **limits)
+            if self._warm_cache and len(self._cache[name]) == 0:
+                self.warm_cache(scenario)
         return self._cache[name]
 
+    def completed_runs(self, scenario=None):
+        """the completed runs stored on the server
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :return: list of the completed runs as returned by the server, ie
+                 the parameter values are transformed
+        """
+        scenario = self.scenario_name(scenario)
+        response = self._proxy.get(
+            f'studies/{self.study}/scenarios/{scenario}/runs')
+        if response.status_code != 200:
+            raise RuntimeError('[HTTP {0}]: Content: {1}'.format(
+                response.status_code, response.content))
+        completed = LookupState.COMPLETED.name
+        return [run for run in response.json()['data']
+                if run.get('state') == completed and 'values' in run]
+
+    def warm_cache(self, scenario=None):
+        """seed the cache with the completed runs stored on the server
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :return: the number of runs added to the cache
+        """
+        scenario = self.scenario_name(scenario)
+        cache = self.cache(scenario)
+        added = 0
+        for run in self.completed_runs(scenario):
+            try:
+                cache[run['values']] = {'id': run['id'],
+                                        'value': run['value']}
+                added += 1
+            except RuntimeError:
+                # the entry is already cached
+                pass
+        self._log.info(f'added {added} runs to cache of scenario {scenario}')
+        return added
+
+    def snapshot(self, scenario=None):
+        """return a columnar snapshot of the cache associated with a scenario
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+
+        write a memory-mapped, read-only snapshot of the cache which is
+        suitable for bulk reads of large scenarios
+        """
+        return self.cache(scenario).snapshot(
+            self.cache_dir(scenario) / 'cache.columnar')
+
     @property
     def study(self):
         """the study"""
@@ -279,6 +519,60 @@ class ObjectiveFunction:
                 values.append(params[p])
         return numpy.array(values)
 
+    def reset_coarsening(self):
+        """start the lattice coarsening schedule from the coarsest level
+
+        call this whenever the optimiser is restarted
+        """
+        self._coarse_level = 0
+        self._coarse_last = None
+
+    def coarse_params(self, x):
+        """map a point onto the current level of the coarsening schedule
+
+        :param x: vector containing parameter values
+        :return: a dictionary of parameters
+
+        The active parameters are rounded to multiples of the spacing of the
+        current level in units of the stored values so that the coarse
+        lattice is a subset of the stored values. The schedule moves to a
+        finer level once the spacing is larger than COARSEN_RATIO times the
+        largest step, relative to the parameter ranges, between successive
+        points. Once all levels are used up the parameters are passed on
+        unchanged. The optimiser proposes the same sequence of points each
+        time it is restarted so that it sees the same levels each time.
+        """
+        params = self.values2params(x)
+        if self._coarsening is None:
+            return params
+        active = numpy.array([params[p] for p in self._active_paramlist],
+                             dtype=float)
+        if self._coarse_last is not None:
+            span = self.upper_bounds - self.lower_bounds
+            step = numpy.max(numpy.abs(active - self._coarse_last) / span)
+            while step > 0 and \
+                    self._coarse_level < len(self._coarsening) and \
+                    self._coarsening[self._coarse_level][0] > \
+                    self.COARSEN_RATIO * step:
+                self._coarse_level += 1
+                self._log.info(
+                    f'refining lattice to level {self._coarse_level}')
+        self._coarse_last = active
+        if self._coarse_level == len(self._coarsening):
+            return params
+        spacing = self._coarsening[self._coarse_level][1]
+        for i, p in enumerate(self._active_paramlist):
+            param = self.parameters[p]
+            start = param.transform(param.minv)
+            top = param.transform(param.maxv) - start
+            # position on the lattice of the stored values
+            pos = params[p] - param.minv
+            if not isinstance(param, ParameterInt):
+                pos = pos / param.resolution
+            k = min(round(pos / spacing[i]), top // spacing[i])
+            params[p] = param.inv_transform(start + k * spacing[i])
+        return params
+
     def setDefaultScenario(self, name, runtype=None):
         """set the default scenario
 
@@ -303,22 +597,114 @@ class ObjectiveFunction:
         self._scenario = name
         self._runtype = runtype
 
-    def get_run_by_id(self, runid, scenario=None):
+    def get_run_by_id(self, runid, scenario=None, use_cache=True):
         """get a run with a particular ID
 
         :param runid: the run ID
         :type runid: int
         :param scenario: when not None override default scenario
         :type scenario: str
+        :param use_cache: when False always query the server
+        :type use_cache: bool
+        :return: the run as returned by the server, ie the state is the
+                 name of the LookupState and the parameter values are in
+                 their internal (transformed) representation
+
+        Completed runs are served from the cache using the same format.
+        Completed runs fetched from the server are added to the cache.
         """
         scenario = self.scenario_name(scenario)
 
+        if use_cache:
+            try:
+                key, run = self.cache(scenario).get_by_id(runid)
+            except LookupError:
+                pass
+            else:
+                run['state'] = run['state'].name
+                run['values'] = key
+                return run
+
         response = self._proxy.get(
             f'studies/{self.study}/scenarios/{scenario}/runs/{runid}')
         if response.status_code != 200:
             raise RuntimeError('[HTTP {0}]: Content: {1}'.format(
                 response.status_code, response.content))
-        return response.json()
+        run = response.json()
+        if isinstance(run, dict) and 'values' in run and \
+           run.get('state') == LookupState.COMPLETED.name:
+            self._cache_run(scenario, run['values'], run)
+        return run
+
+    def _cache_run(self, scenario, transformed_params, run):
+        """store a completed run in the cache"""
+        try:
+            self.cache(scenario)[transformed_params] = run
+        except RuntimeError:
+            # the entry is already cached
+            return
+        if scenario in self._neighbours:
+            self._neighbours[scenario].add(transformed_params)
+
+    def neighbours(self, scenario=None):
+        """the index of the completed runs used for tolerance based lookups
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :rtype: NeighbourIndex
+
+        The index is built from the cache when it is first used. Runs
+        cached by other processes are added once the cache changes.
+        """
+        scenario = self.scenario_name(scenario)
+        if self._tolerance is None:
+            raise RuntimeError('no tolerances set')
+        cache = self.cache(scenario)
+        if scenario not in self._neighbours:
+            # runs cached while scanning are added by the next update
+            self._neighbours_journal[scenario] = (
+                cache.journal_position, cache.data_version)
+            index = NeighbourIndex(self._paramlist, self._tolerance)
+            for key, run in cache.entries():
+                index.add(key)
+            self._neighbours[scenario] = index
+        else:
+            position, version = self._neighbours_journal[scenario]
+            if cache.data_version != version:
+                version = cache.data_version
+                cache.refresh()
+                position, keys = cache.inserted(position)
+                for key in keys:
+                    self._neighbours[scenario].add(key)
+                self._neighbours_journal[scenario] = (position, version)
+        return self._neighbours[scenario]
+
+    def _cached_run(self, scenario, transformed_params):
+        """look up a run in the cache
+
+        When tolerances are set and there is no exact match the nearest
+        completed run within the tolerances is returned. The parameters of
+        that run are reported in the neighbour entry of the run.
+
+        :raises LookupError: if there is no matching run in the cache
+        """
+        try:
+            return self.cache(scenario)[transformed_params]
+        except LookupError:
+            if self._tolerance is None:
+                raise
+        index = self.neighbours(scenario)
+        for key in index.candidates(transformed_params):
+            try:
+                run = self.cache(scenario)[key]
+            except LookupError:
+                # the run has been evicted from the cache
+                index.remove(key)
+                continue
+            run['neighbour'] = self._inv_transform_parameters(key)
+            self._log.debug(f'reusing run {run["id"]}')
+            return run
+        raise LookupError('no neighbouring run')
 
     def getState(self, runid, scenario=None):
         """get state of a particular run
@@ -327,8 +713,15 @@ class ObjectiveFunction:
         :type runid: int
         :param scenario: when not None override default scenario
         :type scenario: str
+
+        Completed runs are served from the cache.
         """
         scenario = self.scenario_name(scenario)
+        try:
+            self.cache(scenario).get_by_id(runid)
+            return LookupState.COMPLETED
+        except LookupError:
+            pass
         response = self._proxy.get(
             f'studies/{self.study}/scenarios/{scenario}/runs/{runid}/state')
         if response.status_code == 404:
@@ -440,23 +833,33 @@ class ObjectiveFunction:
 
         return res
 
-    def get_run(self, parameters, scenario=None):
+    def get_run(self, parameters, scenario=None, use_cache=True):
         """get a run with a particular parameter set
 
         :param parmeters: dictionary containing parameter values
         :param scenario: when not None override default scenario
         :type scenario: str
+        :param use_cache: when False neither read nor update the cache
+        :type use_cache: bool
         """
         scenario = self.scenario_name(scenario)
 
         transformed_params = self._transform_parameters(parameters)
 
-        try:
-            run = self.cache(scenario)[transformed_params]
-            return run
-        except LookupError:
-            pass
+        if use_cache:
+            try:
+                run = self.cache(scenario)[transformed_params]
+                return run
+            except LookupError:
+                pass
 
+        run = self._post_run(scenario, transformed_params)
+        if run['state'] == LookupState.COMPLETED and use_cache:
+            self._cache_run(scenario, transformed_params, run)
+        return run
+
+    def _post_run(self, scenario, transformed_params):
+        """get or create the run with the transformed parameters"""
         response = self._proxy.post(
             f'studies/{self.study}/scenarios/{scenario}/get_run',
             json={'parameters': transformed_params})
@@ -465,10 +868,95 @@ class ObjectiveFunction:
                 response.status_code, response.content))
         run = response.json()
         run['state'] = LookupState.__members__[run['state']]
-        if run['state'] == LookupState.COMPLETED:
-            self.cache(scenario)[transformed_params] = run
         return run
 
+    def get_runs(self, parameters, scenario=None, use_cache=True,
+                 max_workers=None):
+        """get the runs of a list of parameter sets
+
+        :param parameters: list of dictionaries containing parameter values
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :param use_cache: when False neither read nor update the cache
+        :type use_cache: bool
+        :param max_workers: the maximum number of concurrent requests,
+                            defaults to MAX_WORKERS
+        :type max_workers: int
+        :return: list of runs in the order of the parameter sets
+
+        Runs that are not cached are looked up or created concurrently.
+        Parameter sets that map to the same run are only requested once.
+        """
+        scenario = self.scenario_name(scenario)
+        if max_workers is None:
+            max_workers = self.MAX_WORKERS
+
+        transformed = [self._transform_parameters(p) for p in parameters]
+        runs = [None] * len(transformed)
+        missing = {}
+        for i, tp in enumerate(transformed):
+            if use_cache:
+                try:
+                    runs[i] = self.cache(scenario)[tp]
+                    continue
+                except LookupError:
+                    pass
+            key = tuple(sorted(tp.items()))
+            missing.setdefault(key, []).append(i)
+
+        if len(missing) > 0:
+            keys = list(missing.keys())
+            with ThreadPoolExecutor(
+                    max_workers=min(max_workers, len(keys))) as pool:
+                fetched = list(pool.map(
+                    lambda k: self._post_run(scenario, dict(k)), keys))
+            for key, run in zip(keys, fetched):
+                if run['state'] == LookupState.COMPLETED and use_cache:
+                    self._cache_run(scenario, dict(key), run)
+                for i in missing[key]:
+                    runs[i] = run
+        return runs
+
+    def misfit(self, run):
+        """the scalar misfit of a completed run
+
+        :param run: a completed run as returned by :meth:`get_result`
+        :rtype: float
+        """
+        raise NotImplementedError  # pragma: no cover
+
+    def evaluate_batch(self, X, scenario=None, mask=None):
+        """evaluate a batch of points
+
+        :param X: array of shape (number of points, number of active
+                  parameters)
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :param mask: when not None only evaluate the points for which mask
+                     is True, eg the most promising points according to a
+                     surrogate
+        :return: array of the misfits of the points, NaN for points whose
+                 runs are not completed or that are not evaluated, and the
+                 list of runs, None for points that are not evaluated
+
+        All points are registered in one go so that the model runs for the
+        whole batch can proceed concurrently. Points that are not known
+        yet are registered as new runs.
+        """
+        if mask is None:
+            mask = numpy.ones(len(X), dtype=bool)
+        selected = numpy.flatnonzero(mask)
+        params = [self.values2params(X[i]) for i in selected]
+        values = numpy.full(len(X), numpy.nan)
+        runs = [None] * len(X)
+        for i, p, run in zip(selected, params,
+                             self.get_runs(params, scenario=scenario)):
+            if run['state'] == LookupState.COMPLETED:
+                run = self.get_result(p, scenario=scenario)
+                values[i] = self.misfit(run)
+            runs[i] = run
+        return values, runs
+
     def lookup_run(self, parameters, scenario=None):
         """look up parameters
 
@@ -481,11 +969,18 @@ class ObjectiveFunction:
         transformed_params = self._transform_parameters(parameters)
 
         try:
-            run = self.cache(scenario)[transformed_params]
+            run = self._cached_run(scenario, transformed_params)
             return run
         except LookupError:
             pass
 
+        run = self._post_lookup(scenario, transformed_params)
+        if run.get('state') == LookupState.COMPLETED:
+            self._cache_run(scenario, transformed_params, run)
+        return run
+
+    def _post_lookup(self, scenario, transformed_params):
+        """look up the transformed parameters on the server"""
         response = self._proxy.post(
             f'studies/{self.study}/scenarios/{scenario}/lookup_run',
             json={'parameters': transformed_params})
@@ -495,10 +990,44 @@ class ObjectiveFunction:
         run = response.json()
         if 'state' in run:
             run['state'] = LookupState.__members__[run['state']]
-            if run['state'] == LookupState.COMPLETED:
-                self.cache(scenario)[transformed_params] = run
         return run
 
+    def lookup_runs(self, parameters, scenarios, max_workers=None):
+        """look up parameters in several scenarios
+
+        :param parmeters: dictionary containing parameter values
+        :param scenarios: list of scenario names
+        :param max_workers: the maximum number of concurrent requests,
+                            defaults to MAX_WORKERS
+        :type max_workers: int
+        :return: list of runs in the order of the scenarios
+
+        The scenarios whose runs are not cached are looked up concurrently.
+        """
+        if max_workers is None:
+            max_workers = self.MAX_WORKERS
+        transformed_params = self._transform_parameters(parameters)
+
+        runs = [None] * len(scenarios)
+        missing = []
+        for i, scenario in enumerate(scenarios):
+            try:
+                runs[i] = self._cached_run(scenario, transformed_params)
+            except LookupError:
+                missing.append(i)
+
+        if len(missing) > 0:
+            with ThreadPoolExecutor(
+                    max_workers=min(max_workers, len(missing))) as pool:
+                fetched = list(pool.map(
+                    lambda i: self._post_lookup(
+                        scenarios[i], transformed_params), missing))
+            for i, run in zip(missing, fetched):
+                if run.get('state') == LookupState.COMPLETED:
+                    self._cache_run(scenarios[i], transformed_params, run)
+                runs[i] = run
+        return runs
+
     def get_result(self, parameters, scenario=None):
         """look up parameters
 
@@ -513,7 +1042,19 @@ class ObjectiveFunction:
         """
 
         run = self.lookup_run(parameters, scenario=scenario)
+        return self.run_result(run, scenario=scenario)
+
+    def run_result(self, run, scenario=None):
+        """get the result of a looked up run
 
+        :param run: the run returned by :meth:`lookup_run`
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :raises PreliminaryRun: when lookup fails
+        :raises NewRun: when preliminary run has been called again
+        :raises Waiting: when completed entries are required
+        :return: the run with the result
+        """
         if 'status' in run:
             if run['status'] == 'waiting':
                 raise Waiting
@@ -526,6 +1067,34 @@ class ObjectiveFunction:
 
         return run
 
+    def _encode_payload(self, data):
+        """encode the result of a run to bytes"""
+        raise NotImplementedError  # pragma: no cover
+
+    def _decode_payload(self, payload):
+        """decode the result of a run from bytes"""
+        raise NotImplementedError  # pragma: no cover
+
+    def _load_inline(self, scenario, run, load):
+        """get the result of a completed run
+
+        :param scenario: the scenario name
+        :param run: the run
+        :param load: function used to load the result from the run
+
+        When inline results are enabled the result is taken from the
+        payload stored in the cache. Otherwise the result is loaded and
+        stored in the cache.
+        """
+        if 'payload' in run:
+            return self._decode_payload(run['payload'])
+        data = load(run)
+        if self._inline_results:
+            payload = self._encode_payload(data)
+            if len(payload) <= self.INLINE_MAX_SIZE:
+                self.cache(scenario).set_payload(run['id'], payload)
+        return data
+
     def _set_data(self, scenario, run, result):
         raise NotImplementedError  # pragma: no cover
 
@@ -538,9 +1107,46 @@ class ObjectiveFunction:
         :type scenario: str
         :param force: force setting results irrespective of state
         :type force: bool
+
+        When write behind is enabled the result is staged and uploaded
+        in the background.
         """
         scenario = self.scenario_name(scenario)
-        run = self.get_run(parameters, scenario=scenario)
+
+        if self._uploader is not None:
+            # only completed runs are cached
+            transformed_params = self._transform_parameters(parameters)
+            try:
+                self.cache(scenario)[transformed_params]
+            except LookupError:
+                pass
+            else:
+                if not force:
+                    raise RuntimeError(
+                        'parameter set is in wrong state '
+                        f'{LookupState.COMPLETED}')
+                # the cached value is out of date
+                del self.cache(scenario)[transformed_params]
+            self._uploader.stage(scenario, parameters, result, force=force)
+            return
+
+        state = self._set_result(scenario, parameters, result, force=force)
+        if state == LookupState.COMPLETED:
+            # the cached value is out of date
+            try:
+                del self.cache(scenario)[
+                    self._transform_parameters(parameters)]
+            except LookupError:
+                pass
+
+    def _set_result(self, scenario, parameters, result, force=False,
+                    use_cache=True):
+        """store the result and upload it
+
+        :return: the state of the run before the result was set
+        """
+        run = self.get_run(parameters, scenario=scenario,
+                           use_cache=use_cache)
 
         state = run['state']
         if (state.value > LookupState.CONFIGURED.value
@@ -552,9 +1158,13 @@ class ObjectiveFunction:
 
         data = self._set_data(scenario, run, result)
         data['force'] = force
+        self._put_value(scenario, run['id'], data)
+        return state
+
+    def _put_value(self, scenario, runid, data):
+        """upload the value of a run to the server"""
         response = self._proxy.put(
-            f'studies/{self.study}/scenarios/{scenario}/runs/'
-            f'{run["id"]}/value',
+            f'studies/{self.study}/scenarios/{scenario}/runs/{runid}/value',
             json=data)
         if response.status_code == 403:
             raise RuntimeError(response.content)
@@ -562,11 +1172,202 @@ class ObjectiveFunction:
             raise RuntimeError('[HTTP {0}]: Content: {1}'.format(
                 response.status_code, response.content))
 
+    def flush(self):
+        """wait until all results have been uploaded and write the
+        buffered access times of the caches
+
+        :raises RuntimeError: when uploads failed
+        """
+        if self._uploader is not None:
+            self._uploader.flush()
+        for cache in self._cache.values():
+            cache.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def start_replay(self, name):
+        """replay the results of a previous run of an optimiser
+
+        :param name: the name of the optimiser
+        :type name: str
+
+        Call this method each time the optimiser is started. The points
+        evaluated by the optimiser and their results are recorded in a
+        journal in basedir. While the optimiser proposes the recorded
+        points the recorded results are returned without looking them up.
+        """
+        path = self.basedir / f'replay_{self.scenario_name()}_{name}.pickle'
+        if self._replay is None or self._replay.path != path:
+            self._replay = ReplayJournal(path)
+        self._replay.rewind()
+        self.reset_coarsening()
+
+    def stop_replay(self):
+        """stop recording and replaying results"""
+        self._replay = None
+
+    def completed(self, scenario=None, limit=None):
+        """the completed runs in the cache
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :param limit: when not None only return this many runs with the
+                      largest run IDs, ie the most recently created runs
+        :type limit: int
+        :return: array of the active parameter values of the completed runs
+                 with the configured constant parameter values and array
+                 of their misfits
+
+        The results are only read for the selected runs.
+        """
+        scenario = self.scenario_name(scenario)
+        constant = {p: c.transform(c.value)
+                    for p, c in self.constant_parameters.items()}
+        selected = []
+        for key, run in list(self.cache(scenario).entries()):
+            if any(key[p] != constant[p] for p in self.constant_parameters):
+                # the run belongs to different constant parameters
+                continue
+            selected.append((run['id'], key))
+        selected.sort(key=lambda s: s[0])
+        if limit is not None:
+            selected = selected[len(selected) - limit:] if limit > 0 else []
+        X = []
+        values = []
+        for runid, key in selected:
+            params = self._inv_transform_parameters(key)
+            X.append(self.params2values(params, include_constant=False))
+            values.append(
+                self.misfit(self.get_result(params, scenario=scenario)))
+        X = numpy.array(X, dtype=float).reshape(
+            len(X), self.num_active_params)
+        return X, numpy.array(values, dtype=float)
+
+    def best_completed(self, scenario=None):
+        """the completed run with the lowest misfit in the cache
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :return: the active parameter values and the misfit of the best
+                 completed run or None if there are no completed runs
+        """
+        X, values = self.completed(scenario=scenario)
+        if len(values) == 0:
+            return None
+        i = numpy.argmin(values)
+        return X[i], values[i]
+
+    def warm_start(self, name, x0):
+        """the starting point of an optimiser
+
+        :param name: the name of the optimiser
+        :type name: str
+        :param x0: the starting point used when there are no completed runs
+        :return: the active parameter values of the best completed run
+
+        The optimiser is restarted many times and needs to start from the
+        same point each time. The starting point is therefore chosen when
+        this method is first called and stored in basedir. Remove the file
+        to choose a new starting point.
+        """
+        path = self.basedir / \
+            f'warm_start_{self.scenario_name()}_{name}.npy'
+        if path.exists():
+            return numpy.load(path)
+        best = self.best_completed()
+        if best is not None:
+            self._log.info(f'warm start from {best[0]} with misfit {best[1]}')
+            x0 = best[0]
+        x0 = numpy.array(x0, dtype=float)
+        numpy.save(path, x0)
+        return x0
+
+    def fd_points(self, x):
+        """the points used to compute the gradient at x
+
+        :param x: vector containing the active parameter values
+        :return: array of points whose first row is x rounded to the
+                 stored values followed by pairs of points for each active
+                 parameter
+
+        The step is a multiple of the resolution of the parameter, or 1 for
+        integer parameters, so that the perturbed points lie on the lattice
+        of stored values. The central scheme steps in both directions, the
+        forward scheme pairs x with a step in one direction. Steps are
+        reversed or shortened at the bounds.
+        """
+        params = self.values2params(x)
+        base = []
+        points = []
+        for p in self._active_paramlist:
+            param = self.parameters[p]
+            if isinstance(param, ParameterInt):
+                step = 1
+                v = int(round(params[p]))
+            else:
+                step = self._fd_step
+                v = params[p]
+            dbval = param.transform(v)
+            base.append(param.inv_transform(dbval))
+            bottom = param.transform(param.minv)
+            top = param.transform(param.maxv)
+            if self._fd_scheme == 'central':
+                pair = (max(dbval - step, bottom), min(dbval + step, top))
+            elif dbval + step <= top:
+                pair = (dbval, dbval + step)
+            else:
+                pair = (max(dbval - step, bottom), dbval)
+            points.append([param.inv_transform(d) for d in pair])
+        base = numpy.array(base, dtype=float)
+        X = [base]
+        for i, pair in enumerate(points):
+            for v in pair:
+                xi = base.copy()
+                xi[i] = v
+                X.append(xi)
+        return numpy.array(X)
+
+    def gradient(self, x, scenario=None):
+        """compute the gradient of the misfit using finite differences
+
+        :param x: vector containing the active parameter values
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :raises NewRun: when some of the points are waiting to be run
+        :raises Waiting: when some of the points are being run
+        :return: the run at x and the gradient
+
+        The runs for x and all perturbed points are registered in one go so
+        that they can be run concurrently.
+        """
+        if self._fd_scheme is None:
+            raise RuntimeError(
+                'ObjectiveFunction only supports derivative '
+                'free optimisations')
+        X = self.fd_points(x)
+        values, runs = self.evaluate_batch(X, scenario=scenario)
+        if numpy.any(numpy.isnan(values)):
+            if any(r['state'] in [LookupState.PROVISIONAL, LookupState.NEW]
+                   for r in runs):
+                raise NewRun
+            raise Waiting
+        n = len(X) // 2
+        grad = numpy.zeros(n)
+        for i in range(n):
+            lo, hi = 1 + 2 * i, 2 + 2 * i
+            grad[i] = (values[hi] - values[lo]) / (X[hi, i] - X[lo, i])
+        return runs[0], grad
+
     def __call__(self, x, grad=None):
         """look up parameters
 
         :param x: vector containing parameter values
-        :param grad: vector of length 0
+        :param grad: vector of length 0 or, when a finite difference scheme
+                     is set, a vector that is filled with the gradient
         :type grad: numpy.ndarray
         :raises NewRun: when lookup fails
         :raises Waiting: when completed entries are required
@@ -575,10 +1376,18 @@ class ObjectiveFunction:
         :rtype: float
         """
         if grad is not None and grad.size > 0:
-            raise RuntimeError(
-                'ObjectiveFunction only supports derivative '
-                'free optimisations')
-        return self.get_result(self.values2params(x))
+            run, grad[:] = self.gradient(x)
+            return run
+        params = self.coarse_params(x)
+        if self._replay is not None:
+            run = self._replay.replay(x)
+            if run is not None:
+                return run
+        run = self.get_result(params)
+        if self._replay is not None:
+            self._replay.record(
+                x, run, completed=run.get('state') == LookupState.COMPLETED)
+        return run
 
 
 if __name__ == '__main__':
@@ -35,17 +35,19 @@ class ObjectiveFunctionMisfit(ObjectiveFunction):
     :type prelim: bool
     :param url_base: base URL for ObjectiveFunction server API,
                      defaults to 'http://localhost:5000/api/'
+    :param kwds: further keyword arguments are passed to
+                 :class:`ObjectiveFunction_client.ObjectiveFunction`
     """
     def __init__(self, appname: str, secret: str,
                  study: str, basedir: Path,  # noqa C901
                  parameters: Mapping[str, Parameter],
                  scenario=None, prelim=True,
-                 url_base='http://localhost:5000/api/'):
+                 url_base='http://localhost:5000/api/', **kwds):
         """constructor"""
 
         super().__init__(appname, secret, study, basedir,
                          parameters, scenario=scenario, prelim=prelim,
-                         url_base=url_base, runtype=RunType.MISFIT)
+                         url_base=url_base, runtype=RunType.MISFIT, **kwds)
 
     def setDefaultScenario(self, name):
         """set the default scenario
@@ -55,10 +57,10 @@ class ObjectiveFunctionMisfit(ObjectiveFunction):
         """
         return super().setDefaultScenario(name, runtype=RunType.MISFIT)
 
-    def get_result(self, parameters, scenario=None):
-        """look up parameters
+    def run_result(self, run, scenario=None):
+        """get the result of a looked up run
 
-        :param parms: dictionary containing parameter values
+        :param run: the run returned by :meth:`lookup_run`
         :param scenario: when not None override default scenario
         :type scenario: str
         :raises PreliminaryRun: when lookup fails
@@ -68,13 +70,17 @@ class ObjectiveFunctionMisfit(ObjectiveFunction):
                  return a random value otherwise
         """
 
-        run = super().get_result(parameters, scenario=scenario)
+        run = super().run_result(run, scenario=scenario)
         if run['state'] != LookupState.COMPLETED:
             run['misfit'] = 100 * random.random()
         else:
             run['misfit'] = run['value']
         return run
 
+    def misfit(self, run):
+        """the misfit of a completed run"""
+        return run['misfit']
+
     def _set_data(self, scenario, run, result):
         return {'value': result}
 
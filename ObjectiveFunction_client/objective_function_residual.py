@@ -2,6 +2,7 @@ __all__ = ['ObjectiveFunctionResidual']
 
 import numpy.random
 import numpy
+from io import BytesIO
 from typing import Mapping
 from pathlib import Path
 import logging
@@ -9,6 +10,8 @@ import logging
 from .objective_function import ObjectiveFunction
 from .parameter import Parameter
 from .common import RunType, LookupState
+from .array_cache import ArrayCache
+from .storage import STORES, CODECS, load_result
 
 
 class ObjectiveFunctionResidual(ObjectiveFunction):
@@ -36,19 +39,50 @@ class ObjectiveFunctionResidual(ObjectiveFunction):
     :type prelim: bool
     :param url_base: base URL for ObjectiveFunction server API,
                      defaults to 'http://localhost:5000/api/'
+    :param residual_cache_size: the maximum number of bytes of memory-mapped
+                                residual arrays kept for repeated lookups,
+                                defaults to 100MB
+    :type residual_cache_size: int
+    :param result_store: how the residuals are stored, either 'file' for
+                         one file per run or 'chunked' for a single file
+                         per scenario. Default='file'
+    :type result_store: str
+    :param result_dtype: when not None store the residuals with reduced
+                         precision, eg float32 or float16
+    :param result_compression: compress the stored residuals, one of none,
+                               deflate or shuffle. Default='none'
+    :type result_compression: str
+    :param kwds: further keyword arguments are passed to
+                 :class:`ObjectiveFunction_client.ObjectiveFunction`
     """
+
+    RESULT_TYPE = "text"
+
     def __init__(self, appname: str, secret: str,
                  study: str, basedir: Path,  # noqa C901
                  parameters: Mapping[str, Parameter],
                  scenario=None, prelim=True,
-                 url_base='http://localhost:5000/api/'):
+                 url_base='http://localhost:5000/api/',
+                 residual_cache_size=100 * 1024 * 1024,
+                 result_store='file', result_dtype=None,
+                 result_compression='none', **kwds):
         """constructor"""
 
+        if result_store not in STORES:
+            raise ValueError(f'unknown result store {result_store}')
+        if result_compression not in CODECS:
+            raise ValueError(f'unknown compression {result_compression}')
+        self._result_store = result_store
+        self._result_dtype = result_dtype
+        self._result_compression = result_compression
+        self._stores = {}
+
         super().__init__(appname, secret, study, basedir,
                          parameters, scenario=scenario, prelim=prelim,
-                         url_base=url_base, runtype=RunType.PATH)
+                         url_base=url_base, runtype=RunType.PATH, **kwds)
 
         self._num_residuals = None
+        self._residuals = ArrayCache(residual_cache_size)
 
     @property
     def num_residuals(self):
@@ -58,6 +92,21 @@ class ObjectiveFunctionResidual(ObjectiveFunction):
         else:
             return self._num_residuals
 
+    def store(self, scenario=None):
+        """the result store of a scenario
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        """
+        name = self.scenario_name(scenario)
+        if name not in self._stores:
+            self._stores[name] = STORES[self._result_store](
+                self.scenario_dir(scenario), 'residuals',
+                dtype=self._result_dtype,
+                compression=self._result_compression,
+                fanout=self.fanout)
+        return self._stores[name]
+
     def setDefaultScenario(self, name):
         """set the default scenario
 
@@ -66,10 +115,10 @@ class ObjectiveFunctionResidual(ObjectiveFunction):
         """
         return super().setDefaultScenario(name, runtype=RunType.PATH)
 
-    def get_result(self, parameters, scenario=None):
-        """look up parameters
+    def run_result(self, run, scenario=None):
+        """get the result of a looked up run
 
-        :param parms: dictionary containing parameter values
+        :param run: the run returned by :meth:`lookup_run`
         :param scenario: when not None override default scenario
         :type scenario: str
         :raises PreliminaryRun: when lookup fails
@@ -79,23 +128,51 @@ class ObjectiveFunctionResidual(ObjectiveFunction):
                  return a random value otherwise
         """
 
-        run = super().get_result(parameters, scenario=scenario)
+        run = super().run_result(run, scenario=scenario)
         if run['state'] != LookupState.COMPLETED:
             run['residual'] = 100 * numpy.random.rand(self.num_residuals)
         else:
-            with open(run['value'], 'rb') as f:
-                run['residual'] = numpy.load(f)
+            run['residual'] = self._load_residual(
+                self.scenario_name(scenario), run)
+            run.pop('payload', None)
             if self._num_residuals is None:
                 self._num_residuals = run['residual'].size
         return run
 
+    def misfit(self, run):
+        """the sum of the squared residuals of a completed run"""
+        return float(numpy.sum(numpy.square(run['residual'])))
+
+    def _load_residual(self, scenario, run):
+        """load the residuals of a completed run
+
+        The residuals are memory-mapped read-only and kept in a bounded
+        cache keyed by the run ID.
+        """
+        key = (scenario, run['id'])
+        try:
+            return self._residuals.get(key)
+        except KeyError:
+            pass
+        residual = self._load_inline(
+            scenario, run, lambda r: load_result(r['value']))
+        self._residuals.put(key, residual)
+        return residual
+
+    def _encode_payload(self, data):
+        payload = BytesIO()
+        numpy.save(payload, data)
+        return payload.getvalue()
+
+    def _decode_payload(self, payload):
+        return numpy.load(BytesIO(payload))
+
     def _set_data(self, scenario, run, result):
-        fname = self.scenario_dir(scenario) / f'residuals_{run["id"]}.npy'
-        with open(fname, 'wb') as f:
-            numpy.save(f, result)
+        ref = self.store(scenario).save(run['id'], result)
+        self._residuals.pop((scenario, run['id']))
         if self._num_residuals is None:
             self._num_residuals = result.size
-        return {'value': str(fname)}
+        return {'value': ref}
 
     def __call__(self, x, grad=None):
         """look up parameters
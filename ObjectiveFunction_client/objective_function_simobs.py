@@ -2,6 +2,7 @@ __all__ = ['ObjectiveFunctionSimObs']
 
 from typing import Mapping, Sequence
 from pathlib import Path
+from io import BytesIO
 import numpy
 import pandas
 import logging
@@ -9,6 +10,8 @@ import logging
 from .parameter import Parameter
 from .objective_function import ObjectiveFunction
 from .common import RunType, LookupState
+from .storage import locate, load_result, FileStore
+from .linalg import solve_lower
 
 
 class ObjectiveFunctionSimObs(ObjectiveFunction):
@@ -31,20 +34,84 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
                    PreliminaryRun exception otherwise a
                    NewRun exception is raised. Default=True
     :type prelim: bool
+    :param simobs_format: the format used for storing simulated
+                          observations, either 'json' or 'binary'. The
+                          binary format stores an array of the values in
+                          the order of the observation names which are
+                          stored once for the study. Default='json'
+    :type simobs_format: str
+    :param return_numpy: when True return the simulated observations as an
+                         array in the order of the observation names
+                         instead of a pandas Series
+    :type return_numpy: bool
+    :param compress_requests: when True gzip the observation names sent to
+                              the server
+    :type compress_requests: bool
+    :param targets: when not None a mapping of observation names to target
+                    values used to compute residuals
+    :param weights: a mapping of observation names to the weights of the
+                    residuals, missing observations get a weight of 1
+    :param covariance: the covariance matrix of the observations ordered
+                       like the observation names, cannot be combined with
+                       weights
+    :type covariance: numpy.ndarray
+    :param kwds: further keyword arguments are passed to
+                 :class:`ObjectiveFunction_client.ObjectiveFunction`
     """
 
+    RESULT_TYPE = "text"
+    FORMATS = ('json', 'binary')
+    # the name of the file holding the study-level observation name index
+    OBSERVATION_INDEX = 'observation_names.npy'
+
     def __init__(self, appname: str, secret: str,
                  study: str, basedir: Path,  # noqa C901
                  parameters: Mapping[str, Parameter],
                  observationNames: Sequence[str],
                  scenario=None, prelim=True,
-                 url_base='http://localhost:5000/api/'):
+                 url_base='http://localhost:5000/api/',
+                 simobs_format='json', return_numpy=False,
+                 compress_requests=False, targets=None, weights=None,
+                 covariance=None, **kwds):
         """constructor"""
 
+        if simobs_format not in self.FORMATS:
+            raise ValueError(f'unknown simobs format {simobs_format}')
+        self._simobs_format = simobs_format
+        self._return_numpy = return_numpy
+        self._compress_requests = compress_requests
+        self._stores = {}
+        self._index_checked = False
+
         self._obsNames = observationNames
+        self._obsIndex = pandas.Index(observationNames)
         super().__init__(appname, secret, study, basedir,
                          parameters, scenario=scenario, prelim=prelim,
-                         url_base=url_base, runtype=RunType.PATH)
+                         url_base=url_base, runtype=RunType.PATH, **kwds)
+
+        self._targets = None
+        self._weights = None
+        self._covariance = None
+        self._cholesky = None
+        if targets is not None:
+            self._targets = self._align(targets, 'target')
+            if weights is not None and covariance is not None:
+                raise ValueError('specify either weights or covariance')
+            if weights is not None:
+                weights = pandas.Series(weights, dtype=float)
+                if len(weights.index.difference(self._obsIndex)) > 0:
+                    raise ValueError('weights for unknown observations')
+                self._weights = self._align(
+                    weights.reindex(self._obsIndex, fill_value=1.),
+                    'weight')
+            if covariance is not None:
+                covariance = numpy.asarray(covariance, dtype=float)
+                if covariance.shape != (self.num_residuals,) * 2:
+                    raise ValueError('shape of covariance matrix does not '
+                                     'match number of observations')
+                self._covariance = covariance
+        elif weights is not None or covariance is not None:
+            raise ValueError('weights or covariance require targets')
 
     def _create_study(self, param_dict):
         super()._create_study(param_dict)
@@ -52,7 +119,8 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
         # add observation names
         response = self._proxy.put(
             f'studies/{self.study}/observation_names',
-            json={'obsnames': self.observationNames})
+            json={'obsnames': list(self.observationNames)},
+            compress=self._compress_requests)
         if response.status_code == 404:
             raise RuntimeError(response.content)
         elif response.status_code != 201:
@@ -75,11 +143,11 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
                 f'{self.study} does not match')
             error = True
         else:
-            for o in obsnames:
-                if o not in self.observationNames:
-                    self._log.error(
-                        f'observation name {o} missing from configuration')
-                    error = True
+            missing = self._obsIndex.get_indexer(obsnames) < 0
+            for o in numpy.asarray(obsnames, dtype=object)[missing]:
+                self._log.error(
+                    f'observation name {o} missing from configuration')
+                error = True
         if error:
             raise RuntimeError('configuration does not match database')
 
@@ -93,6 +161,94 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
         """the number of residuals"""
         return len(self._obsNames)
 
+    def _align(self, values, name):
+        """align a mapping of observation names to values with the
+        observation names
+
+        :return: array of values in the order of the observation names
+        """
+        values = pandas.Series(values, dtype=float)
+        indexer = values.index.get_indexer(self._obsIndex)
+        if not values.index.is_unique or len(values) != self.num_residuals \
+           or (indexer < 0).any():
+            msg = f'observation names of {name}s do not match'
+            self._log.error(msg)
+            raise RuntimeError(msg)
+        return values.to_numpy()[indexer]
+
+    @property
+    def targets(self):
+        """array of targets in the order of the observation names or None"""
+        return self._targets
+
+    @property
+    def cholesky(self):
+        """the lower Cholesky factor of the covariance matrix
+
+        the factor is computed when it is first accessed
+        """
+        if self._cholesky is None and self._covariance is not None:
+            self._cholesky = numpy.linalg.cholesky(self._covariance)
+        return self._cholesky
+
+    def residuals(self, simobs):
+        """compute the residuals of simulated observations
+
+        :param simobs: the simulated observations, either an array in the
+                       order of the observation names or a Series
+        :return: the differences between the simulated observations and the
+                 targets multiplied by the weights or whitened by solving
+                 with the Cholesky factor of the covariance matrix
+        :rtype: numpy.ndarray
+        """
+        if self._targets is None:
+            raise RuntimeError('no targets set')
+        diff = self._simobs_values(simobs) - self._targets
+        if self._weights is not None:
+            return diff * self._weights
+        if self._covariance is not None:
+            return solve_lower(self.cholesky, diff)
+        return diff
+
+    @property
+    def observation_index(self):
+        """the name of the file holding the observation name index"""
+        return self.basedir / self.OBSERVATION_INDEX
+
+    def _check_index(self):
+        """store the observation name index or check the stored index
+
+        The values of simulated observations stored in binary format are
+        in the order of the observation name index.
+        """
+        if self._index_checked:
+            return
+        names = numpy.array(self.observationNames, dtype=str)
+        fname = self.observation_index
+        if fname.exists():
+            if not numpy.array_equal(numpy.load(fname), names):
+                msg = f'observation names do not match index {fname}'
+                self._log.error(msg)
+                raise RuntimeError(msg)
+        else:
+            tmpname = fname.with_suffix('.tmp')
+            with open(tmpname, 'wb') as f:
+                numpy.save(f, names)
+            tmpname.replace(fname)
+        self._index_checked = True
+
+    def store(self, scenario=None):
+        """the store of simulated observations in binary format
+
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        """
+        name = self.scenario_name(scenario)
+        if name not in self._stores:
+            self._stores[name] = FileStore(
+                self.scenario_dir(scenario), 'simobs', fanout=self.fanout)
+        return self._stores[name]
+
     def setDefaultScenario(self, name):
         """set the default scenario
 
@@ -102,23 +258,60 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
         return super().setDefaultScenario(name, runtype=RunType.PATH)
 
     def _check_simobs(self, simobs):
+        """check the simulated observations
+
+        :return: the simulated observations as a Series in the order of the
+                 observation names
+        """
         simobs = pandas.Series(simobs)
+        if simobs.index.equals(self._obsIndex):
+            return simobs
         error = False
         if len(simobs) != self.num_residuals:
             self._log.error("length of observations does not match")
             error = True
-        for n in self.observationNames:
-            if n not in simobs.index:
-                self._log.error(f"observation {n} missing from simobs")
-                error = True
+        if not simobs.index.is_unique:
+            self._log.error("duplicate observations in simobs")
+            raise RuntimeError("observation names do not match")
+        # a single hash based lookup of all names
+        indexer = simobs.index.get_indexer(self._obsIndex)
+        for n in self._obsIndex[indexer < 0]:
+            self._log.error(f"observation {n} missing from simobs")
+            error = True
         if error:
             raise RuntimeError("observation names do not match")
-        return simobs
+        return pandas.Series(simobs.to_numpy()[indexer], index=self._obsIndex)
 
-    def get_result(self, parameters, scenario=None):
-        """look up parameters
+    def _simobs_values(self, simobs):
+        """the values of simulated observations in the order of the
+        observation names
 
-        :param parms: dictionary containing parameter values
+        :param simobs: the simulated observations, either an array in the
+                       order of the observation names, a Series or a
+                       dictionary
+        """
+        if isinstance(simobs, numpy.ndarray):
+            if simobs.shape != (self.num_residuals,):
+                raise RuntimeError("length of observations does not match")
+            return simobs
+        return self._check_simobs(simobs).to_numpy()
+
+    def _load_simobs(self, run):
+        """load the values of the simulated observations of a run"""
+        ref = locate(run['value'])
+        if ref.endswith('.json'):
+            return self._simobs_values(pandas.read_json(ref, typ='series'))
+        self._check_index()
+        values = load_result(ref)
+        # the values are stored in the order of the index
+        if values.shape != (self.num_residuals,):
+            raise RuntimeError("length of observations does not match")
+        return values
+
+    def run_result(self, run, scenario=None):
+        """get the result of a looked up run
+
+        :param run: the run returned by :meth:`lookup_run`
         :param scenario: when not None override default scenario
         :type scenario: str
         :raises NewRun: when lookup fails
@@ -128,20 +321,48 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
         :rtype: numpy.arraynd
         """
 
-        run = super().get_result(parameters, scenario=scenario)
+        run = super().run_result(run, scenario=scenario)
         if run['state'] != LookupState.COMPLETED:
-            result = pandas.Series(
-                100 * numpy.random.rand(self.num_residuals),
-                index=self.observationNames)
+            values = 100 * numpy.random.rand(self.num_residuals)
+        else:
+            values = self._load_inline(
+                self.scenario_name(scenario), run, self._load_simobs)
+            run.pop('payload', None)
+        if self._return_numpy:
+            run['simobs'] = values
         else:
-            result = pandas.read_json(run['value'], typ='series')
-            self._check_simobs(result)
-        run['simobs'] = result
+            run['simobs'] = pandas.Series(values, index=self._obsIndex)
+        if self._targets is not None:
+            run['residual'] = self.residuals(values)
         return run
 
+    def misfit(self, run):
+        """the sum of the squared residuals of a completed run
+
+        :raises RuntimeError: when no targets are set
+        """
+        if 'residual' not in run:
+            raise RuntimeError('the misfit requires targets')
+        return float(numpy.sum(numpy.square(run['residual'])))
+
+    def _encode_payload(self, data):
+        payload = BytesIO()
+        numpy.save(payload, data)
+        return payload.getvalue()
+
+    def _decode_payload(self, payload):
+        return numpy.load(BytesIO(payload))
+
     def _set_data(self, scenario, run, result):
-        result = self._check_simobs(result)
-        fname = self.scenario_dir(scenario) / f'simobs_{run["id"]}.json'
+        if self._simobs_format == 'binary':
+            self._check_index()
+            ref = self.store(scenario).save(
+                run['id'], self._simobs_values(result))
+            return {'value': ref}
+        result = pandas.Series(self._simobs_values(result),
+                               index=self._obsIndex)
+        fname = self.run_path(f'simobs_{run["id"]}.json', run['id'],
+                              scenario=scenario)
         result.to_json(fname)
         return {'value': str(fname)}
 
@@ -154,10 +375,14 @@ class ObjectiveFunctionSimObs(ObjectiveFunction):
         :raises NewRun: when lookup fails
         :raises Waiting: when completed entries are required
         :return: returns the value if lookup succeeds and state is completed
-                 return a random value otherwise
-        :rtype: float
+                 return a random value otherwise. When targets are set the
+                 residuals are returned, otherwise the simulated
+                 observations
         """
-        return super().__call__(x, grad=grad)['simobs']
+        run = super().__call__(x, grad=grad)
+        if self._targets is not None:
+            return run['residual']
+        return run['simobs']
 
 
 if __name__ == '__main__':
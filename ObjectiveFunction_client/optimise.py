@@ -1,11 +1,15 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import nlopt
+import numpy
 import sys
 import logging
 
 from .config import ObjFunConfig
 from .common import PreliminaryRun, NewRun, Waiting
+from .design import latin_hypercube
+from .surrogate import GaussianProcess
 
 # In case we are using a stochastic method, use a "deterministic"
 # sequence of pseudorandom numbers, to be repeatable:
@@ -16,6 +20,8 @@ class NLConfig(ObjFunConfig):
     optCfgStr = """
     [nlopt]
     algorithm = string()
+    multistart = integer(min=1, default=1)
+    seed = integer(default=1)
     """
 
     def __init__(self, fname: Path) -> None:
@@ -46,42 +52,157 @@ class NLConfig(ObjFunConfig):
             self._opt.set_xtol_rel(1e-2)
         return self._opt
 
-
-def main():
-    logging.basicConfig(level=logging.INFO)
+    @property
+    def multistart(self):
+        """the number of optimisers started from different points"""
+        return self.cfg['nlopt']['multistart']
+
+    def start_points(self, num=None, warm_start=False, screen=None):
+        """the points the optimisers are started from
+
+        :param num: the number of points, defaults to multistart
+        :type num: int
+        :param warm_start: start the first optimiser from the best completed
+                           run instead of the parameter values
+        :type warm_start: bool
+        :param screen: when not None draw screen times as many candidates
+                       and keep the most promising ones according to a
+                       surrogate of the completed runs
+        :type screen: int
+
+        The first point is given by the parameter values. The remaining
+        points are a Latin hypercube sample of the parameter space. The
+        sample is seeded so that the same points are generated each time.
+        Screened points depend on the runs completed so far, they are
+        stored in basedir when first chosen. Remove the file to choose
+        new points.
+        """
+        if num is None:
+            num = self.multistart
+        objfun = self.objectiveFunction
+        x0 = objfun.params2values(self.values, include_constant=False)
+        if warm_start:
+            x0 = objfun.warm_start('nlopt', x0)
+        if num == 1:
+            return numpy.array([x0])
+        if screen is None:
+            sample = latin_hypercube(num - 1, objfun.lower_bounds,
+                                     objfun.upper_bounds,
+                                     seed=self.cfg['nlopt']['seed'])
+            return numpy.vstack([x0, sample])
+
+        path = objfun.basedir / f'multistart_{objfun.scenario_name()}.npy'
+        if path.exists():
+            sample = numpy.load(path)
+        else:
+            sample = latin_hypercube(screen * (num - 1), objfun.lower_bounds,
+                                     objfun.upper_bounds,
+                                     seed=self.cfg['nlopt']['seed'])
+            surrogate = GaussianProcess.from_objective(objfun)
+            sample = sample[surrogate.rank(sample)[:num - 1]]
+            numpy.save(path, sample)
+        return numpy.vstack([x0, sample[:num - 1]])
+
+
+def optimise(cfg, x0, replay=None):
+    """run the optimiser from x0
+
+    :param cfg: the optimiser configuration
+    :type cfg: NLConfig
+    :param x0: the starting point
+    :param replay: the name of the replay journal, no replay if None
+    :return: tuple of status, optimum, minimum value and result code where
+             status is one of done, new or waiting
+    """
     log = logging.getLogger('ObjectiveFunction_client.optimise')
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument('config', type=Path,
-                        help='name of configuration file')
-    args = parser.parse_args()
-
-    cfg = NLConfig(args.config)
     opt = cfg.optimiser
 
     # run optimiser twice to detect whether new parameter set is stable
     for i in range(2):
-        # start with lower bounds
+        if replay is not None:
+            cfg.objectiveFunction.start_replay(replay)
+        else:
+            cfg.objectiveFunction.reset_coarsening()
         try:
-            x = opt.optimize(
-                cfg.objectiveFunction.params2values(cfg.values,
-                                                    include_constant=False))
+            x = opt.optimize(x0)
         except PreliminaryRun:
             log.info('new parameter set')
             continue
         except NewRun:
-            print('new')
-            sys.exit(1)
+            return 'new', None, None, None
         except Waiting:
-            print('waiting')
-            sys.exit(2)
+            return 'waiting', None, None, None
 
         minf = opt.last_optimum_value()
         results = opt.last_optimize_result()
 
         if results == 1:
             break
+    return 'done', x, minf, results
+
 
+def _optimise_start(config, x0, replay):
+    """run one of the optimisers of a multi-start optimisation"""
+    logging.basicConfig(level=logging.INFO)
+    return optimise(NLConfig(config), x0, replay=replay)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger('ObjectiveFunction_client.optimise')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config', type=Path,
+                        help='name of configuration file')
+    parser.add_argument('--no-replay', action='store_true', default=False,
+                        help='do not replay results of previous runs')
+    parser.add_argument('-m', '--multistart', type=int, metavar='K',
+                        help='run K optimisers from different starting '
+                        'points, overrides the configuration')
+    parser.add_argument('-w', '--warm-start', action='store_true',
+                        default=False,
+                        help='start from the best completed run')
+    parser.add_argument('-s', '--screen', type=int, metavar='N',
+                        help='choose the starting points from N times as '
+                        'many candidates using a surrogate of the completed '
+                        'runs')
+    args = parser.parse_args()
+
+    cfg = NLConfig(args.config)
+    num = cfg.multistart if args.multistart is None else args.multistart
+    if num < 1:
+        parser.error('the number of starting points must be positive')
+    if args.screen is not None and args.screen < 1:
+        parser.error('the screening factor must be positive')
+    starts = cfg.start_points(num, warm_start=args.warm_start,
+                              screen=args.screen)
+
+    if num == 1:
+        outcomes = [optimise(cfg, starts[0],
+                             replay=None if args.no_replay else 'nlopt')]
+    else:
+        # each optimiser uses its own objective function instance so that
+        # the model runs of all starting points proceed concurrently
+        with ProcessPoolExecutor(max_workers=num) as pool:
+            futures = [pool.submit(_optimise_start, args.config, x0,
+                                   None if args.no_replay else f'nlopt{k}')
+                       for k, x0 in enumerate(starts)]
+            outcomes = [f.result() for f in futures]
+
+    status = [o[0] for o in outcomes]
+    if 'new' in status:
+        print('new')
+        sys.exit(1)
+    if 'waiting' in status:
+        print('waiting')
+        sys.exit(2)
+
+    for k, (_, x, minf, results) in enumerate(outcomes):
+        log.info(f'start {k}: minimum value {minf} at {x}')
+    best = min(range(num), key=lambda k: outcomes[k][2])
+    _, x, minf, results = outcomes[best]
+    if num > 1:
+        log.info(f'best result from start {best}')
     log.info(f"minimum value {minf}")
     log.info(f"result code {results}")
     log.info(f"optimum at {x}")
@@ -1,3 +1,5 @@
+import gzip
+import json
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
@@ -78,7 +80,15 @@ class Proxy:
             self.url(url), **kwds, auth=self.token_auth)
         return response
 
-    def put(self, url, **kwds):
+    def put(self, url, compress=False, **kwds):
+        if compress and 'json' in kwds:
+            # send the JSON payload gzip compressed
+            kwds['data'] = gzip.compress(
+                json.dumps(kwds.pop('json')).encode())
+            headers = dict(kwds.pop('headers', None) or {})
+            headers['Content-Type'] = 'application/json'
+            headers['Content-Encoding'] = 'gzip'
+            kwds['headers'] = headers
         response = self.session.put(
             self.url(url), **kwds, auth=self.token_auth)
         return response
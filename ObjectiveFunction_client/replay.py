@@ -0,0 +1,123 @@
+__all__ = ['ReplayJournal']
+
+import logging
+import os
+import pickle
+from pathlib import Path
+import numpy
+
+
+class ReplayJournal:
+    """journal of the points evaluated by an optimiser and their results
+
+    :param path: the name of the journal file
+    :type path: Path
+
+    A deterministic optimiser that is restarted proposes the same sequence
+    of points. The journal records the sequence of points together with the
+    runs returned for them. After rewinding the journal the recorded runs
+    are replayed as long as the optimiser proposes the recorded points.
+    Once the optimiser diverges from the recorded trajectory the remainder
+    of the journal is discarded and new evaluations are recorded.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """constructor"""
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+        self._path = Path(path)
+        self._entries = []
+        self._offsets = []
+        self._pos = 0
+        self._recording = True
+        self._replayed = 0
+        self._load()
+
+    def _load(self):
+        if not self._path.exists():
+            return
+        end = 0
+        with self._path.open('rb') as f:
+            while True:
+                offset = f.tell()
+                try:
+                    x, run = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                end = f.tell()
+                self._offsets.append(offset)
+                self._entries.append((x, run))
+        if self._path.stat().st_size > end:
+            # remove an incomplete entry left behind by a crash
+            with self._path.open('ab') as f:
+                f.truncate(end)
+
+    def _truncate(self, num):
+        """discard all entries from num onwards"""
+        self._log.info(f'optimiser diverged after {num} evaluations')
+        with self._path.open('ab') as f:
+            f.truncate(self._offsets[num])
+        del self._entries[num:]
+        del self._offsets[num:]
+
+    @property
+    def path(self) -> Path:
+        """the name of the journal file"""
+        return self._path
+
+    @property
+    def replayed(self) -> int:
+        """the number of results replayed since the journal was loaded"""
+        return self._replayed
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rewind(self) -> None:
+        """start replaying from the beginning of the journal
+
+        call this whenever the optimiser is restarted
+        """
+        self._pos = 0
+        self._recording = True
+
+    def replay(self, x):
+        """get the recorded run if x is the next point of the trajectory
+
+        :param x: the point proposed by the optimiser
+        :return: the recorded run or None
+        """
+        if self._pos >= len(self._entries):
+            return None
+        rx, run = self._entries[self._pos]
+        if numpy.array_equal(rx, x):
+            self._pos += 1
+            self._replayed += 1
+            return run
+        self._truncate(self._pos)
+        return None
+
+    def record(self, x, run, completed=True):
+        """record the run returned for x
+
+        :param x: the point proposed by the optimiser
+        :param run: the run
+        :param completed: whether the run is completed. The result of a run
+                          that is not completed is not reproducible, so
+                          recording stops until the journal is rewound
+        :type completed: bool
+        """
+        if not self._recording or self._pos != len(self._entries):
+            return
+        if not completed:
+            self._recording = False
+            return
+        x = numpy.array(x, dtype=float)
+        with self._path.open('ab') as f:
+            offset = f.tell()
+            pickle.dump((x, run), f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._offsets.append(offset)
+        self._entries.append((x, run))
+        self._pos += 1
@@ -0,0 +1,412 @@
+__all__ = ['ResultStore', 'FileStore', 'ChunkedStore', 'load_result',
+           'encode', 'decode', 'CODECS', 'partitioned_path', 'locate',
+           'relayout']
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from io import BytesIO
+import fcntl
+import hashlib
+import os
+import re
+import numpy
+from numpy.lib import format as npformat
+
+
+CODECS = ('none', 'deflate', 'shuffle')
+# the maximum number of directory levels of the fan-out layout
+MAX_FANOUT = 4
+# the names of files associated with a particular run
+RUN_FILE = re.compile(r'^[A-Za-z]+_(\d+)\.(npy|npz|json)$')
+FANOUT_DIR = re.compile(r'^[0-9a-f]{2}$')
+
+
+def partition(runid: int, levels: int):
+    """the subdirectories of a run in a fan-out layout
+
+    :param runid: the run ID
+    :type runid: int
+    :param levels: the number of directory levels
+    :type levels: int
+    :return: list of directory names
+
+    The directory names are derived from a hash of the run ID so that runs
+    are spread evenly, each level has up to 256 subdirectories.
+    """
+    if not 0 <= levels <= MAX_FANOUT:
+        raise ValueError(f'fan-out must be between 0 and {MAX_FANOUT}')
+    digest = hashlib.sha1(str(runid).encode()).hexdigest()
+    return [digest[2 * i:2 * i + 2] for i in range(levels)]
+
+
+def partitioned_path(directory: Path, name: str, runid: int,
+                     levels: int = 0) -> Path:
+    """the name of a file associated with a run
+
+    :param directory: the scenario directory
+    :type directory: Path
+    :param name: the name of the file
+    :type name: str
+    :param runid: the run ID
+    :type runid: int
+    :param levels: the number of directory levels of the fan-out layout,
+                   0 for a flat directory
+    :type levels: int
+    """
+    return Path(directory).joinpath(*partition(runid, levels), name)
+
+
+def locate(ref: str) -> str:
+    """find the file of a run which may have been moved to a different
+    fan-out layout
+
+    :param ref: the name of the file when it was stored
+    :type ref: str
+    :return: the name of the file, ref if it cannot be found
+    """
+    path = Path(ref)
+    if path.exists():
+        return ref
+    m = RUN_FILE.match(path.name)
+    if m is None:
+        return ref
+    runid = int(m.group(1))
+    parts = tuple(partition(runid, MAX_FANOUT))
+    # strip the fan-out directories to get the scenario directory
+    base = path.parent
+    for levels in range(MAX_FANOUT, 0, -1):
+        if path.parent.parts[-levels:] == parts[:levels]:
+            base = path.parent.parents[levels - 1]
+            break
+    for levels in range(MAX_FANOUT + 1):
+        candidate = partitioned_path(base, path.name, runid, levels)
+        if candidate.exists():
+            return str(candidate)
+    return ref
+
+
+def relayout(directory: Path, levels: int) -> int:
+    """move the files of runs to a different fan-out layout
+
+    :param directory: the scenario directory
+    :type directory: Path
+    :param levels: the number of directory levels of the new layout
+    :type levels: int
+    :return: the number of files moved
+
+    Empty fan-out directories are removed.
+    """
+    directory = Path(directory)
+    partition(0, levels)
+    moved = 0
+    for root, dirs, files in os.walk(directory, topdown=False):
+        root = Path(root)
+        depth = len(root.relative_to(directory).parts)
+        if depth > 0 and (depth > MAX_FANOUT or not all(
+                FANOUT_DIR.match(d)
+                for d in root.relative_to(directory).parts)):
+            continue
+        for name in files:
+            m = RUN_FILE.match(name)
+            if m is None:
+                continue
+            target = partitioned_path(directory, name, int(m.group(1)),
+                                      levels)
+            if target == root / name:
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(root / name, target)
+            moved += 1
+        if depth > 0 and not any(root.iterdir()):
+            root.rmdir()
+    return moved
+
+
+def encode(data: numpy.ndarray, dtype=None, codec: str = 'none') -> bytes:
+    """encode an array as an .npz archive
+
+    :param data: the array to encode
+    :param dtype: when not None the array is stored with this dtype
+    :param codec: the compression codec, one of none, deflate or shuffle.
+                  shuffle splits the array into byte planes before
+                  compressing which works well for smooth floating point data
+    :return: the archive
+
+    The dtype of the original array is stored alongside the data so that
+    :func:`decode` can restore it.
+    """
+    if codec not in CODECS:
+        raise ValueError(f'unknown codec {codec}')
+    data = numpy.asarray(data)
+    stored = data if dtype is None else data.astype(dtype)
+    shape = numpy.array(stored.shape, dtype=numpy.int64)
+    stored_dtype = numpy.array(str(stored.dtype))
+    if codec == 'shuffle':
+        itemsize = stored.itemsize
+        stored = numpy.ascontiguousarray(stored).reshape(-1)
+        stored = stored.view(numpy.uint8).reshape((-1, itemsize)).T.copy()
+    out = BytesIO()
+    save = numpy.savez if codec == 'none' else numpy.savez_compressed
+    save(out, data=stored, shape=shape, codec=numpy.array(codec),
+         stored=stored_dtype, dtype=numpy.array(str(data.dtype)))
+    return out.getvalue()
+
+
+def decode(f) -> numpy.ndarray:
+    """decode an array encoded by :func:`encode`
+
+    :param f: file name or file-like object of the archive
+    :return: the array with its original dtype
+    """
+    with numpy.load(f) as archive:
+        data = archive['data']
+        shape = tuple(archive['shape'])
+        codec = str(archive['codec'])
+        stored = numpy.dtype(str(archive['stored']))
+        dtype = numpy.dtype(str(archive['dtype']))
+    if codec == 'shuffle':
+        data = data.T.copy().view(stored)
+    return data.reshape(shape).astype(dtype, copy=False)
+
+
+class ResultStore(ABC):
+    """store arrays associated with runs
+
+    :param directory: the directory in which the results are stored
+    :type directory: Path
+    :param prefix: the prefix used for file names
+    :type prefix: str
+    :param dtype: when not None store results with reduced precision, eg
+                  float32 or float16
+    :param compression: the compression codec, one of none, deflate or
+                        shuffle. Default='none'
+    :type compression: str
+    :param fanout: the number of directory levels used to spread files of
+                   individual runs, 0 for a flat directory
+    :type fanout: int
+
+    A store saves the result of a run and returns a reference string which
+    is stored on the server. The reference is used to load the result
+    again. Results stored with reduced precision or compression are
+    converted back to their original dtype when loaded. Such results
+    cannot be memory-mapped.
+    """
+
+    def __init__(self, directory: Path, prefix: str, dtype=None,
+                 compression: str = 'none', fanout: int = 0) -> None:
+        """constructor"""
+        if compression not in CODECS:
+            raise ValueError(f'unknown compression {compression}')
+        partition(0, fanout)
+        self._fanout = fanout
+        self._directory = Path(directory)
+        self._prefix = prefix
+        self._dtype = None if dtype is None else numpy.dtype(dtype)
+        self._compression = compression
+
+    @property
+    def directory(self) -> Path:
+        """the directory in which the results are stored"""
+        return self._directory
+
+    @property
+    def prefix(self) -> str:
+        """the prefix used for file names"""
+        return self._prefix
+
+    @property
+    def dtype(self):
+        """the dtype used for storing results, None to keep the dtype"""
+        return self._dtype
+
+    @property
+    def compression(self) -> str:
+        """the compression codec"""
+        return self._compression
+
+    @property
+    def fanout(self) -> int:
+        """the number of directory levels of the fan-out layout"""
+        return self._fanout
+
+    @property
+    def encoded(self) -> bool:
+        """whether results are stored with reduced precision or compressed"""
+        return self.dtype is not None or self.compression != 'none'
+
+    @abstractmethod
+    def save(self, runid: int, data: numpy.ndarray) -> str:
+        """save the result of a run
+
+        :param runid: the run ID
+        :type runid: int
+        :param data: the array to store
+        :return: reference to the stored result
+        """
+        pass  # pragma: no cover
+
+    @classmethod
+    @abstractmethod
+    def handles(cls, ref: str) -> bool:
+        """whether the reference points to a result of this store type"""
+        pass  # pragma: no cover
+
+    @classmethod
+    @abstractmethod
+    def load(cls, ref: str, mmap: bool = True) -> numpy.ndarray:
+        """load a result
+
+        :param ref: the reference returned by save
+        :type ref: str
+        :param mmap: when True memory-map the array read-only if possible
+        :type mmap: bool
+        """
+        pass  # pragma: no cover
+
+
+class FileStore(ResultStore):
+    """store each result in its own .npy file
+
+    Encoded results are stored in .npz files. Files are found when they
+    have been moved to a different fan-out layout.
+    """
+
+    def path(self, runid: int) -> Path:
+        """the name of the file of a particular run"""
+        suffix = '.npz' if self.encoded else '.npy'
+        return partitioned_path(self.directory,
+                                f'{self.prefix}_{runid}{suffix}', runid,
+                                self.fanout)
+
+    def save(self, runid: int, data: numpy.ndarray) -> str:
+        fname = self.path(runid)
+        fname.parent.mkdir(parents=True, exist_ok=True)
+        # replace the file atomically, it may be memory-mapped elsewhere
+        tmpname = fname.with_suffix('.tmp')
+        with open(tmpname, 'wb') as f:
+            if self.encoded:
+                f.write(encode(data, dtype=self.dtype,
+                               codec=self.compression))
+            else:
+                numpy.save(f, data)
+        tmpname.replace(fname)
+        return str(fname)
+
+    @classmethod
+    def handles(cls, ref: str) -> bool:
+        return not ChunkedStore.handles(ref)
+
+    @classmethod
+    def load(cls, ref: str, mmap: bool = True) -> numpy.ndarray:
+        ref = locate(ref)
+        if ref.endswith('.npz'):
+            return decode(ref)
+        if mmap:
+            return numpy.load(ref, mmap_mode='r')
+        return numpy.load(ref)
+
+
+class ChunkedStore(ResultStore):
+    """append all results to a single file
+
+    Each result is appended to the data file as a complete .npy record. The
+    reference of a result is the name of the data file and the offset of
+    the record separated by '@'. An index file records the run ID, offset
+    and length of each record. Writers hold an exclusive lock on the data
+    file while appending so that several processes can share one store.
+    Encoded results are appended as .npz archives, their reference also
+    contains the length of the record separated by '+'.
+    """
+
+    SUFFIX = '.npystore'
+    INDEX_SUFFIX = '.npyindex'
+
+    @property
+    def data_file(self) -> Path:
+        """the name of the data file"""
+        return self.directory / f'{self.prefix}{self.SUFFIX}'
+
+    @property
+    def index_file(self) -> Path:
+        """the name of the index file"""
+        return self.directory / f'{self.prefix}{self.INDEX_SUFFIX}'
+
+    def save(self, runid: int, data: numpy.ndarray) -> str:
+        with open(self.data_file, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                if self.encoded:
+                    f.write(encode(data, dtype=self.dtype,
+                                   codec=self.compression))
+                else:
+                    numpy.save(f, data)
+                f.flush()
+                os.fsync(f.fileno())
+                length = f.tell() - offset
+                with open(self.index_file, 'a') as idx:
+                    idx.write(f'{runid} {offset} {length}\n')
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        if self.encoded:
+            return f'{self.data_file}@{offset}+{length}'
+        return f'{self.data_file}@{offset}'
+
+    def index(self):
+        """a dictionary mapping run IDs to the offset and length of the
+        most recently stored record of the run"""
+        index = {}
+        if self.index_file.exists():
+            with open(self.index_file, 'r') as idx:
+                for line in idx:
+                    runid, offset, length = map(int, line.split())
+                    index[runid] = (offset, length)
+        return index
+
+    @classmethod
+    def handles(cls, ref: str) -> bool:
+        path, sep, offset = ref.rpartition('@')
+        return sep == '@' and path.endswith(cls.SUFFIX) and \
+            all(o.isdigit() for o in offset.split('+', 1))
+
+    @classmethod
+    def load(cls, ref: str, mmap: bool = True) -> numpy.ndarray:
+        path, sep, offset = ref.rpartition('@')
+        offset, sep, length = offset.partition('+')
+        with open(path, 'rb') as f:
+            f.seek(int(offset))
+            if length:
+                return decode(BytesIO(f.read(int(length))))
+            if not mmap:
+                return numpy.load(f)
+            version = npformat.read_magic(f)
+            if version == (1, 0):
+                header = npformat.read_array_header_1_0(f)
+            else:
+                header = npformat.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+            data_offset = f.tell()
+        if dtype.hasobject:
+            raise RuntimeError(f'cannot memory-map object array {ref}')
+        if numpy.prod(shape) == 0:
+            return numpy.empty(shape, dtype=dtype)
+        return numpy.memmap(path, dtype=dtype, mode='r', offset=data_offset,
+                            shape=shape,
+                            order='F' if fortran_order else 'C')
+
+
+STORES = {'file': FileStore,
+          'chunked': ChunkedStore}
+
+
+def load_result(ref: str, mmap: bool = True) -> numpy.ndarray:
+    """load a result given its reference
+
+    :param ref: the reference of the result
+    :type ref: str
+    :param mmap: when True memory-map the array read-only if possible
+    :type mmap: bool
+    """
+    for store in STORES.values():
+        if store.handles(ref):
+            return store.load(ref, mmap=mmap)
@@ -0,0 +1,143 @@
+__all__ = ['GaussianProcess']
+
+import numpy
+
+from .linalg import solve_lower
+
+
+class GaussianProcess:
+    """Gaussian process regression of the misfit
+
+    :param lower: the lower bounds of the parameters
+    :param upper: the upper bounds of the parameters
+    :param lengthscale: the length scale of the squared exponential kernel
+                        relative to the parameter ranges
+    :type lengthscale: float
+    :param noise: the noise variance relative to the signal variance
+    :type noise: float
+
+    The surrogate is used to decide which of the points proposed by an
+    optimiser are worth a model run. The prior mean is the mean of the
+    observed values and the signal variance is estimated from the
+    observations. Points are added incrementally by extending the Cholesky
+    factor of the kernel matrix.
+    """
+
+    # the default maximum number of runs used to fit the surrogate
+    MAX_POINTS = 500
+
+    def __init__(self, lower, upper, lengthscale=0.2, noise=1e-6) -> None:
+        """constructor"""
+        self._lower = numpy.asarray(lower, dtype=float)
+        self._upper = numpy.asarray(upper, dtype=float)
+        if self._lower.shape != self._upper.shape:
+            raise ValueError('lower and upper bounds differ in shape')
+        if lengthscale <= 0:
+            raise ValueError('the length scale must be positive')
+        self._lengthscale = lengthscale
+        self._noise = noise
+        n = len(self._lower)
+        self._X = numpy.zeros((0, n))
+        self._y = numpy.zeros(0)
+        self._L = numpy.zeros((0, 0))
+
+    @classmethod
+    def from_objective(cls, objfun, scenario=None, max_points=MAX_POINTS,
+                       **kwds):
+        """fit a surrogate to the completed runs in the cache
+
+        :param objfun: the objective function
+        :param scenario: when not None override default scenario
+        :type scenario: str
+        :param max_points: the maximum number of runs, the most recently
+                           created runs are used
+        :type max_points: int
+        :param kwds: further keyword arguments are passed to the
+                     constructor
+
+        Computing the misfit of a run may require reading its result
+        file, only the results of the selected runs are read.
+        """
+        surrogate = cls(objfun.lower_bounds, objfun.upper_bounds, **kwds)
+        surrogate.fit(*objfun.completed(scenario=scenario, limit=max_points))
+        return surrogate
+
+    def __len__(self) -> int:
+        return len(self._y)
+
+    def _unit(self, X):
+        X = numpy.atleast_2d(numpy.asarray(X, dtype=float))
+        return (X - self._lower) / (self._upper - self._lower)
+
+    def _kernel(self, A, B):
+        d2 = numpy.sum((A[:, numpy.newaxis, :] - B[numpy.newaxis, :, :]) ** 2,
+                       axis=2)
+        return numpy.exp(-0.5 * d2 / self._lengthscale ** 2)
+
+    def fit(self, X, y):
+        """fit the surrogate to the observations, replacing previous ones
+
+        :param X: array of shape (number of points, number of parameters)
+        :param y: the observed values
+        """
+        U = self._unit(X).reshape(len(y), len(self._lower))
+        self._X = U
+        self._y = numpy.asarray(y, dtype=float)
+        K = self._kernel(U, U) + self._noise * numpy.eye(len(U))
+        self._L = numpy.linalg.cholesky(K) if len(U) > 0 else K
+
+    def add(self, x, y):
+        """add an observation
+
+        :param x: the point
+        :param y: the observed value
+
+        Points that have already been observed are ignored.
+        """
+        u = self._unit(x)
+        if numpy.any(numpy.all(self._X == u, axis=1)):
+            # the model is deterministic, the point is already known
+            return
+        k = self._kernel(self._X, u)[:, 0]
+        n = len(self._y)
+        row = solve_lower(self._L, k)
+        # nearly repeated points would make the factor singular
+        d = numpy.sqrt(max(1 + self._noise - row @ row, self._noise))
+        L = numpy.zeros((n + 1, n + 1))
+        L[:n, :n] = self._L
+        L[n, :n] = row
+        L[n, n] = d
+        self._L = L
+        self._X = numpy.vstack([self._X, u])
+        self._y = numpy.append(self._y, float(y))
+
+    def predict(self, X):
+        """predict the values at some points
+
+        :param X: array of shape (number of points, number of parameters)
+        :return: arrays of the predicted mean and standard deviation
+        """
+        U = self._unit(X)
+        if len(self._y) == 0:
+            return numpy.zeros(len(U)), numpy.full(len(U), numpy.inf)
+        mean = numpy.mean(self._y)
+        r = solve_lower(self._L, self._y - mean)
+        variance = max(r @ r / len(self._y), 1e-12)
+        V = solve_lower(self._L, self._kernel(self._X, U))
+        mu = mean + V.T @ r
+        var = variance * numpy.maximum(1 - numpy.sum(V ** 2, axis=0), 0)
+        return mu, numpy.sqrt(var)
+
+    def rank(self, X, kappa=2.):
+        """rank points by the lower confidence bound of their value
+
+        :param X: array of shape (number of points, number of parameters)
+        :param kappa: the number of standard deviations subtracted from the
+                      mean, larger values favour exploration
+        :type kappa: float
+        :return: the indices of the points starting with the most promising
+        """
+        mu, sigma = self.predict(X)
+        if len(self._y) == 0:
+            return numpy.arange(len(mu))
+        return numpy.argsort(mu - kappa * sigma, kind='stable')
@@ -0,0 +1,200 @@
+__all__ = ['ResultUploader']
+
+import fcntl
+import json
+import logging
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+class ResultUploader:
+    """upload results of runs in a background thread
+
+    :param objfun: the objective function used to upload the results
+    :param directory: the staging directory
+    :type directory: Path
+    :param retries: the number of times a failed upload is retried
+    :type retries: int
+    :param backoff: the delay in seconds before the first retry, the delay
+                    is doubled for each subsequent retry
+    :type backoff: float
+
+    Results are staged in the staging directory and recorded in a journal
+    before they are queued for upload. Completed and failed uploads are
+    also recorded in the journal. Each uploader uses its own journal which
+    it keeps locked. Uploads recorded in the journal of a process that no
+    longer holds the lock are recovered and uploaded when a new uploader is
+    created.
+    """
+
+    RETRIES = 5
+    BACKOFF = 1.
+
+    def __init__(self, objfun, directory: Path, retries=None,
+                 backoff=None) -> None:
+        """constructor"""
+        self._log = logging.getLogger(
+            f'ObjectiveFunction_client.{self.__class__.__name__}')
+        self._objfun = objfun
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._retries = self.RETRIES if retries is None else retries
+        self._backoff = self.BACKOFF if backoff is None else backoff
+
+        self._lock = threading.Lock()
+        self._errors = []
+        self._queue = queue.Queue()
+
+        self._journal_name = self._directory / \
+            'journal_{0}_{1}_{2}.jsonl'.format(
+                socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._journal = self._journal_name.open('a')
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._recover()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def directory(self) -> Path:
+        """the staging directory"""
+        return self._directory
+
+    @property
+    def journal(self) -> Path:
+        """the name of the journal of this process"""
+        return self._journal_name
+
+    @property
+    def pending(self) -> int:
+        """the number of uploads that have not completed"""
+        return self._queue.unfinished_tasks
+
+    def _staged(self, key):
+        return self._directory / f'{key}.pickle'
+
+    def _write(self, entry):
+        with self._lock:
+            self._journal.write(json.dumps(entry) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    @staticmethod
+    def _pending(journal):
+        """the staged entries of a journal without a completion record"""
+        entries = {}
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be incomplete after a crash
+                continue
+            if entry['op'] == 'stage':
+                entries[entry['key']] = entry
+            else:
+                entries.pop(entry['key'], None)
+        return list(entries.values())
+
+    def _recover(self):
+        """queue uploads that were not completed by a previous uploader"""
+        entries = []
+        for fname in sorted(self._directory.glob('journal_*.jsonl')):
+            if fname != self._journal_name:
+                with fname.open('r') as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        # the journal belongs to a running process
+                        continue
+                    if os.fstat(f.fileno()).st_nlink == 0:
+                        # the journal was recovered by another process
+                        continue
+                    recovered = self._pending(f)
+                    for entry in recovered:
+                        self._write(entry)
+                    fname.unlink()
+                entries += recovered
+        for entry in entries:
+            self._log.info(f'recovering upload {entry["key"]}')
+            self._queue.put(entry)
+
+    def stage(self, scenario, parameters, result, force=False):
+        """stage a result and queue it for upload
+
+        :param scenario: the scenario name
+        :type scenario: str
+        :param parameters: dictionary of parameters
+        :param result: result value to set
+        :param force: force setting results irrespective of state
+        :type force: bool
+        """
+        key = uuid.uuid4().hex
+        fname = self._staged(key)
+        tmpname = fname.with_suffix('.tmp')
+        with tmpname.open('wb') as f:
+            pickle.dump((parameters, result), f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmpname.replace(fname)
+        entry = {'op': 'stage', 'key': key, 'scenario': scenario,
+                 'force': force}
+        self._write(entry)
+        self._queue.put(entry)
+
+    def _upload(self, entry):
+        key = entry['key']
+        fname = self._staged(key)
+        with fname.open('rb') as f:
+            parameters, result = pickle.load(f)
+        delay = self._backoff
+        for attempt in range(self._retries + 1):
+            try:
+                self._objfun._set_result(
+                    entry['scenario'], parameters, result,
+                    force=entry['force'], use_cache=False)
+                break
+            except Exception as e:
+                if attempt == self._retries:
+                    raise
+                self._log.warning(
+                    f'uploading {key} failed, retrying in {delay}s: {e}')
+                time.sleep(delay)
+                delay *= 2
+        self._write({'op': 'done', 'key': key})
+        fname.unlink()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                self._upload(entry)
+            except Exception as e:
+                # keep the staged result for inspection
+                self._log.error(f'uploading {entry["key"]} failed: {e}')
+                self._write({'op': 'failed', 'key': entry['key']})
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """wait until all queued uploads have been processed
+
+        :raises RuntimeError: when uploads failed
+        """
+        self._queue.join()
+        with self._lock:
+            errors = self._errors
+            self._errors = []
+            # all entries are resolved, start a new journal
+            self._journal.truncate(0)
+        if len(errors) > 0:
+            raise RuntimeError(
+                f'{len(errors)} uploads failed, first error: {errors[0]}')
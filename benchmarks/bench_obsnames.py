@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""measure the cost of handling large numbers of observation names
+
+usage: python3 benchmarks/bench_obsnames.py [-n NUM [NUM ...]]
+
+The server is mocked using requests_mock. For each number of observation
+names the script reports the time taken to create and load a study, to
+check simulated observations given in a different order and the size of
+the observation name payload with and without compression.
+"""
+
+import argparse
+import gzip
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy
+import pandas
+import requests_mock
+
+from ObjectiveFunction_client import ObjectiveFunctionSimObs, ParameterFloat
+
+BASEURL = 'http://bench.invalid/api/'
+STUDY = 'bench'
+
+
+def bench(num, basedir):
+    names = [f'obs{i:07d}' for i in range(num)]
+    params = {'a': ParameterFloat(0, -1, 1)}
+
+    with requests_mock.Mocker() as m:
+        m.get(BASEURL + 'token', json={'token': 'token'})
+        m.post(BASEURL + f'studies/{STUDY}/create_scenario',
+               status_code=201)
+        m.get(BASEURL + f'studies/{STUDY}/parameters',
+              json={p: params[p].to_dict for p in params})
+        m.get(BASEURL + f'studies/{STUDY}/observation_names',
+              json={'obsnames': names[::-1]})
+
+        t0 = time.perf_counter()
+        objfun = ObjectiveFunctionSimObs(
+            'app', 'secret', STUDY, basedir, params, names,
+            scenario='s', url_base=BASEURL)
+        t1 = time.perf_counter()
+
+        simobs = pandas.Series(numpy.random.rand(num), index=names[::-1])
+        objfun._check_simobs(simobs)
+        t2 = time.perf_counter()
+
+    payload = json.dumps({'obsnames': names}).encode()
+    return t1 - t0, t2 - t1, len(payload), len(gzip.compress(payload))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--num', type=int, nargs='+',
+                        default=[10**4, 10**5, 10**6],
+                        help='numbers of observation names, '
+                        'default=10^4 10^5 10^6')
+    args = parser.parse_args()
+
+    print(f'{"names":>10} {"load [s]":>10} {"check [s]":>10} '
+          f'{"payload":>12} {"gzipped":>12}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for num in args.num:
+            load, check, size, csize = bench(num, Path(tmp))
+            print(f'{num:10d} {load:10.3f} {check:10.3f} '
+                  f'{size:12d} {csize:12d}')
+
+
+if __name__ == '__main__':
+    main()
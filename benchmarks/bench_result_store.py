@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""compare the open/read latency of the result store backends
+
+usage: python3 benchmarks/bench_result_store.py [-n NUM] [-s SIZE] [DIR]
+
+DIR should be on the file system the results will be kept on, eg a
+parallel file system. By default a temporary directory is used.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy
+
+from ObjectiveFunction_client.storage import STORES, load_result
+
+
+def bench(store, num, size):
+    data = numpy.random.rand(size)
+    t0 = time.perf_counter()
+    refs = [store.save(i, data) for i in range(num)]
+    t1 = time.perf_counter()
+    for ref in refs:
+        load_result(ref, mmap=True)[0]
+    t2 = time.perf_counter()
+    for ref in refs:
+        load_result(ref, mmap=False)
+    t3 = time.perf_counter()
+    return (t1 - t0) / num, (t2 - t1) / num, (t3 - t2) / num
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', type=Path, nargs='?',
+                        help='directory to write results to')
+    parser.add_argument('-n', '--num', type=int, default=1000,
+                        help='number of results, default=1000')
+    parser.add_argument('-s', '--size', type=int, default=10000,
+                        help='number of residuals per result, default=10000')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        print(f'{"store":10} {"write":>12} {"mmap read":>12} {"read":>12}')
+        for name, store in STORES.items():
+            sdir = Path(tmp) / name
+            sdir.mkdir()
+            times = bench(store(sdir, 'residuals'), args.num, args.size)
+            print(f'{name:10} ' + ' '.join(
+                f'{t * 1e6:10.1f}us' for t in times))
+
+
+if __name__ == '__main__':
+    main()
@@ -269,6 +269,156 @@ class TestObjectiveFunctionScenario(TestObjectiveFunctionBase):
         with pytest.raises(RuntimeError):
             objectiveA.get_run_by_id(rid)
 
+    def test_get_runs(self, requests_mock, baseurl, objectiveA):
+        def get_run(request, context):
+            a = request.json()['parameters']['a']
+            context.status_code = 201
+            return {'id': a, 'state': LookupState.NEW.name}
+        post = requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run', json=get_run)
+        params = [{'a': a, 'b': 1., 'c': -2.} for a in [0., 0.5, 0.]]
+        runs = objectiveA.get_runs(params)
+        assert [r['id'] for r in runs] == [
+            objectiveA.parameters['a'].transform(p['a']) for p in params]
+        assert all(r['state'] == LookupState.NEW for r in runs)
+        # duplicate parameter sets are only requested once
+        assert post.call_count == 2
+
+    def test_get_runs_fail(self, requests_mock, baseurl, objectiveA,
+                           valuesA):
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run', status_code=400)
+        with pytest.raises(RuntimeError):
+            objectiveA.get_runs([valuesA])
+
+    def test_evaluate_batch_pending(self, requests_mock, baseurl,
+                                    objectiveA):
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={'id': 1, 'state': LookupState.NEW.name})
+        values, runs = objectiveA.evaluate_batch(
+            numpy.array([[0., 1., -2.], [0.5, 1., -2.]]))
+        assert numpy.all(numpy.isnan(values))
+        assert len(runs) == 2
+
+    def test_get_run_by_id_cached(self, objectiveA, vA, ivA):
+        rid = 1
+        value = 10 if objectiveA.RESULT_TYPE == 'real' else 'result_1.npy'
+        objectiveA.cache()[ivA] = {'id': rid, 'value': value}
+        run = objectiveA.get_run_by_id(rid)
+        assert run == {'id': rid, 'state': LookupState.COMPLETED.name,
+                       'value': value, 'values': ivA}
+
+    def test_get_run_by_id_completed(
+            self, requests_mock, baseurl, objectiveA, vA, ivA):
+        rid = 1
+        value = 10 if objectiveA.RESULT_TYPE == 'real' else 'result_1.npy'
+        response = {'id': rid, 'state': LookupState.COMPLETED.name,
+                    'values': ivA, 'value': value}
+        get = requests_mock.register_uri(
+            'GET',
+            baseurl + f'studies/{self.study}/scenarios/{self.scenario}/'
+            f'runs/{rid}',
+            status_code=200, json=response)
+        # the server response is returned unchanged
+        run = objectiveA.get_run_by_id(rid)
+        assert run == response
+        assert objectiveA.cache()[ivA]['id'] == rid
+        # the cached run has the same format
+        assert objectiveA.get_run_by_id(rid) == response
+        assert get.call_count == 1
+
+    def test_get_run_by_id_active(
+            self, requests_mock, baseurl, objectiveA, ivA):
+        rid = 1
+        response = {'id': rid, 'state': LookupState.ACTIVE.name,
+                    'values': ivA}
+        requests_mock.register_uri(
+            'GET',
+            baseurl + f'studies/{self.study}/scenarios/{self.scenario}/'
+            f'runs/{rid}',
+            status_code=200, json=response)
+        assert objectiveA.get_run_by_id(rid) == response
+        with pytest.raises(LookupError):
+            objectiveA.cache().get_by_id(rid)
+
+    def test_study_cache(
+            self, objfun, requests_mock, requests_objfun_new, rundir,
+            baseurl, paramsA, ivA):
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/observation_names',
+            status_code=201)
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           study_cache=True)
+        objective.cache()[ivA] = {'id': 1, 'value': 10}
+        assert (rundir / 'study_cache.sqlite').exists()
+        assert not (objective.scenario_dir() / 'cache.sqlite').exists()
+        assert objective.getState(1) == LookupState.COMPLETED
+
+    def test_study_cache_max_size(
+            self, objfun, requests_objfun_new, rundir, baseurl, paramsA):
+        with pytest.raises(ValueError):
+            objfun('test', 'test_secret', self.study, rundir, paramsA,
+                   scenario=self.scenario, url_base=baseurl,
+                   study_cache=True, cache_max_size=1024)
+
+    def test_cachedir(
+            self, objfun, requests_mock, requests_objfun_new, rundir,
+            tmp_path, baseurl, paramsA, ivA):
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/observation_names',
+            status_code=201)
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           cachedir=tmp_path / 'cache')
+        objective.cache()[ivA] = {'id': 1, 'value': 10}
+        cdir = tmp_path / 'cache' / objective.scenario_name()
+        assert (cdir / 'cache.sqlite').exists()
+        assert not (objective.scenario_dir() / 'cache.sqlite').exists()
+
+    def test_warm_cache(
+            self, objfun, requests_mock, requests_objfun_new, rundir,
+            tmp_path, baseurl, paramsA, vA, ivA):
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/observation_names',
+            status_code=201)
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           cachedir=tmp_path, warm_cache=True)
+        value = 10. if objective.RESULT_TYPE == 'real' else 'result_1.npy'
+        ivB = dict(ivA, a=0)
+        runs = requests_mock.register_uri(
+            'GET', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs', status_code=200, json={'data': [
+                {'id': 1, 'state': 'COMPLETED', 'values': ivA,
+                 'value': value},
+                {'id': 2, 'state': 'ACTIVE', 'values': ivB}]})
+        cache = objective.cache()
+        assert runs.call_count == 1
+        assert len(cache) == 1
+        assert cache[ivA]['value'] == value
+        # a populated cache is not seeded again
+        assert objective.warm_cache() == 0
+
+    def test_warm_cache_fail(self, requests_mock, baseurl, objectiveA):
+        requests_mock.register_uri(
+            'GET', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs', status_code=400)
+        with pytest.raises(RuntimeError):
+            objectiveA.warm_cache()
+
+    def test_getState_cached(self, objectiveA, ivA):
+        rid = 1
+        objectiveA.cache()[ivA] = {'id': rid, 'value': 10}
+        assert objectiveA.getState(rid) == LookupState.COMPLETED
+
     def test_getState_none(self, requests_mock, baseurl, objectiveA):
         rid = 1
         requests_mock.register_uri(
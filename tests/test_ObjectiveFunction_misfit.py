@@ -1,7 +1,11 @@
 import pytest
+import numpy
 
 from ObjectiveFunction_client import ObjectiveFunctionMisfit
 from ObjectiveFunction_client import LookupState
+from ObjectiveFunction_client import ParameterFloat, ParameterInt
+from ObjectiveFunction_client import NewRun, Waiting
+from ObjectiveFunction_client.cache import ObjFunCache
 
 from test_ObjectiveFunction import (  # noqa: F401
     test_create_fail_create_study, test_create_fail_study,
@@ -133,3 +137,267 @@ class TestObjectiveFunctionScenarioMisfit(TOFS):
             f'{self.scenario}/runs/{runid}/value', status_code=201)
 
         objectiveA.set_result(valuesA, resval, force=True)
+
+    def test_set_result_write_behind(
+            self, requests_mock, baseurl, objfun, requests_objfun_new,
+            rundir, paramsA, valuesA, result):
+        resval = result['resvalue']
+        runid = 1
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': runid})
+        put = requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs/{runid}/value', status_code=201)
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/observation_names',
+            status_code=201)
+        with objfun('test', 'test_secret', self.study, rundir, paramsA,
+                    scenario=self.scenario, url_base=baseurl,
+                    write_behind=True) as objective:
+            objective.set_result(valuesA, resval)
+        assert put.call_count == 1
+
+    def test_set_result_write_behind_cached(
+            self, objfun, requests_mock, requests_objfun_new, baseurl,
+            rundir, paramsA, valuesA, result):
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/observation_names',
+            status_code=201)
+        objective = objfun('test', 'test_secret', self.study, rundir,
+                           paramsA, scenario=self.scenario, url_base=baseurl,
+                           write_behind=True)
+        objective.cache()[objective._transform_parameters(valuesA)] = {
+            'id': 1, 'value': result['dbvalue']}
+        with pytest.raises(RuntimeError):
+            objective.set_result(valuesA, result['resvalue'])
+
+    def test_call_replay(self, requests_mock, baseurl, objectiveA, result):
+        lookup = requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                result['dbname']: result['dbvalue'],
+                'id': 1})
+        x = numpy.array([0., 1., -2.])
+        objectiveA.start_replay('test')
+        res = objectiveA(x)
+        assert lookup.call_count == 1
+        # the replayed result does not need the cache
+        objectiveA.cache().con.execute('delete from lookup;')
+        objectiveA.start_replay('test')
+        self._compare(objectiveA(x), res)
+        assert lookup.call_count == 1
+        # a different point is looked up
+        objectiveA(x + 0.5)
+        assert lookup.call_count == 2
+        objectiveA.stop_replay()
+        objectiveA.cache().con.execute('delete from lookup;')
+        objectiveA(x)
+        assert lookup.call_count == 3
+
+
+@pytest.mark.parametrize('scheme', ['forward', 'central'])
+def test_gradient(requests_mock, request_token, requests_objfun_new,
+                  baseurl, study, tmpdir, scheme):
+    params = {'a': ParameterFloat(0, -1, 1, 0.5),
+              'b': ParameterInt(1, 0, 2)}
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, params, scenario='s',
+        url_base=baseurl, fd_scheme=scheme, fd_step=1)
+
+    def get_run(request, context):
+        p = request.json()['parameters']
+        context.status_code = 201
+        # misfit = 3 a + 2 b**2
+        value = 3 * params['a'].inv_transform(p['a']) + 2 * p['b'] ** 2
+        return {'id': p['a'] * 10 + p['b'],
+                'state': LookupState.COMPLETED.name, 'value': value}
+    post = requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/get_run',
+        json=get_run)
+
+    grad = numpy.zeros(2)
+    value = objective(numpy.array([0.1, 2]), grad)
+    assert value == 8
+    # the forward step is reversed at the upper bound of b
+    assert numpy.allclose(grad, [3, 6])
+    # all distinct points are registered once
+    count = {'forward': 3, 'central': 4}[scheme]
+    assert post.call_count == count
+
+    # the points are looked up in the cache
+    objective(numpy.array([0.1, 2]), grad)
+    assert post.call_count == count
+
+
+@pytest.mark.parametrize('scheme', ['forward', 'central'])
+@pytest.mark.parametrize('minv', [1, -10])
+def test_fd_points_int_bounds(request_token, requests_objfun_new, baseurl,
+                              study, tmpdir, scheme, minv):
+    params = {'b': ParameterInt(minv, minv, minv + 10)}
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, params, scenario='s',
+        url_base=baseurl, fd_scheme=scheme)
+    # at the lower bound the steps stay within the bounds
+    X = objective.fd_points([minv])
+    assert X[:, 0].tolist() == [minv, minv, minv + 1]
+    # at the upper bound the step is shortened or reversed
+    X = objective.fd_points([minv + 10])
+    assert X[:, 0].tolist() == [minv + 10, minv + 9, minv + 10]
+
+
+def test_gradient_pending(requests_mock, request_token, requests_objfun_new,
+                          baseurl, study, tmpdir):
+    params = {'a': ParameterFloat(0, -1, 1, 0.5)}
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, params, scenario='s',
+        url_base=baseurl, fd_scheme='central')
+    state = {'state': LookupState.NEW.name}
+    requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/get_run',
+        json=lambda r, c: dict(state, id=1), status_code=201)
+    with pytest.raises(NewRun):
+        objective(numpy.array([0.]), numpy.zeros(1))
+    state['state'] = LookupState.ACTIVE.name
+    with pytest.raises(Waiting):
+        objective(numpy.array([0.]), numpy.zeros(1))
+
+
+def test_gradient_options(request_token, requests_objfun_new, baseurl,
+                          study, tmpdir, paramsA):
+    with pytest.raises(ValueError):
+        ObjectiveFunctionMisfit('test', 'test_secret', study, tmpdir,
+                                paramsA, url_base=baseurl, fd_scheme='wrong')
+    with pytest.raises(ValueError):
+        ObjectiveFunctionMisfit('test', 'test_secret', study, tmpdir,
+                                paramsA, url_base=baseurl, fd_step=0)
+
+
+def test_warm_start(request_token, requests_objfun_new, baseurl, study,
+                    tmpdir, paramsC):
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, paramsC, scenario='s',
+        url_base=baseurl)
+    assert objective.best_completed() is None
+    for i, (a, b, value) in enumerate([(0., 1., 5.), (0.5, 1., 2.),
+                                       (-0.5, 1., 3.), (0.2, 1.5, 1.)]):
+        key = objective._transform_parameters({'a': a, 'b': b, 'c': -1.})
+        key['b'] = paramsC['b'].transform(b)
+        objective.cache()[key] = {'id': i, 'value': value}
+    # the last run has a different value of the constant parameter
+    x, misfit = objective.best_completed()
+    assert misfit == 2.
+    assert numpy.allclose(x, [0.5, -1.])
+
+    # only the most recently created runs
+    X, values = objective.completed(limit=2)
+    assert values.tolist() == [2., 3.]
+    assert objective.completed(limit=0)[1].size == 0
+
+    x0 = objective.warm_start('test', [0., -2.])
+    assert numpy.allclose(x0, [0.5, -1.])
+    # the starting point does not change once it is chosen
+    key = objective._transform_parameters({'a': 0.1, 'c': -1.})
+    objective.cache()[key] = {'id': 10, 'value': 0.}
+    assert numpy.allclose(objective.warm_start('test', [0., -2.]), x0)
+    assert numpy.allclose(objective.warm_start('other', [0., -2.]),
+                          [0.1, -1.])
+
+
+def test_lookup_neighbour(requests_mock, request_token, requests_objfun_new,
+                          baseurl, study, tmpdir, paramsA, valuesA):
+    with pytest.raises(ValueError):
+        ObjectiveFunctionMisfit(
+            'test', 'test_secret', study, tmpdir, paramsA, scenario='s',
+            url_base=baseurl, tolerance={'d': 0.1})
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, paramsA, scenario='s',
+        url_base=baseurl, tolerance={'a': 0.01})
+    lookup = requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/lookup_run',
+        status_code=201, json={'state': LookupState.COMPLETED.name,
+                               'id': 1, 'value': 10.})
+    run = objective.get_result(valuesA)
+    assert 'neighbour' not in run
+    assert lookup.call_count == 1
+
+    # a parameter set within the tolerance reuses the completed run
+    run = objective.get_result(dict(valuesA, a=0.005))
+    assert run['misfit'] == 10.
+    assert run['neighbour']['a'] == pytest.approx(0.)
+    assert lookup.call_count == 1
+
+    # other parameters need to match exactly
+    objective.get_result(dict(valuesA, a=0.005, b=1.1))
+    assert lookup.call_count == 2
+    objective.get_result(dict(valuesA, a=0.02))
+    assert lookup.call_count == 3
+
+
+def test_lookup_neighbour_other_process(
+        request_token, requests_objfun_new, baseurl, study, tmpdir,
+        paramsA, valuesA):
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, paramsA, scenario='s',
+        url_base=baseurl, tolerance={'a': 0.01})
+    for runid, a in [(1, 0.), (2, 0.008)]:
+        key = objective._transform_parameters(dict(valuesA, a=a))
+        objective.cache()[key] = {'id': runid, 'value': float(runid)}
+    assert len(objective.neighbours()) == 2
+
+    # runs cached by another process are found
+    other = ObjFunCache(objective.cache_dir() / 'cache.sqlite',
+                        paramsA.keys(), 'real')
+    key = objective._transform_parameters(dict(valuesA, a=0.5))
+    other[key] = {'id': 3, 'value': 3.}
+    run = objective._cached_run(
+        's', objective._transform_parameters(dict(valuesA, a=0.505)))
+    assert run['id'] == 3
+
+    # when the nearest run has been removed the next one is used
+    del other[objective._transform_parameters(valuesA)]
+    run = objective._cached_run(
+        's', objective._transform_parameters(dict(valuesA, a=0.003)))
+    assert run['id'] == 2
+    assert len(objective.neighbours()) == 2
+
+
+def test_coarse_params(requests_mock, request_token, requests_objfun_new,
+                       baseurl, study, tmpdir, paramsA):
+    with pytest.raises(ValueError):
+        ObjectiveFunctionMisfit(
+            'test', 'test_secret', study, tmpdir, paramsA, scenario='s',
+            url_base=baseurl, coarsening=[1.5])
+    objective = ObjectiveFunctionMisfit(
+        'test', 'test_secret', study, tmpdir, paramsA, scenario='s',
+        url_base=baseurl, coarsening=[0.01, 0.1])
+
+    # the coarsest level rounds to a tenth of the parameter ranges
+    params = objective.coarse_params([0.13, 1.07, -2.3])
+    assert params == pytest.approx({'a': 0.2, 'b': 1.0, 'c': -2.5})
+    # repeated points do not refine the lattice
+    params = objective.coarse_params([0.13, 1.07, -2.3])
+    assert params['a'] == pytest.approx(0.2)
+
+    # a step of less than ten times the spacing refines the lattice
+    params = objective.coarse_params([0.515, 1.061, -2.3])
+    assert params == pytest.approx({'a': 0.52, 'b': 1.06, 'c': -2.3})
+
+    # full resolution after the last level
+    x = [0.5151, 1.061, -2.3]
+    assert objective.coarse_params(x) == dict(zip('abc', x))
+
+    # runs are looked up with the coarse values
+    objective.reset_coarsening()
+    lookup = requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/lookup_run',
+        status_code=201, json={'state': LookupState.COMPLETED.name,
+                               'id': 1, 'value': 10.})
+    assert objective([0.13, 1.07, -2.3]) == 10.
+    assert lookup.last_request.json()['parameters']['a'] == \
+        paramsA['a'].transform(0.2)
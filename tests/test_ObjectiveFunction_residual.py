@@ -1,7 +1,13 @@
 import pytest
 import numpy
+from pathlib import Path
+from argparse import Namespace
 
 from ObjectiveFunction_client import ObjectiveFunctionResidual
+from ObjectiveFunction_client import LookupState
+from ObjectiveFunction_client.manage_cache import migrate_results
+from ObjectiveFunction_client.storage import ChunkedStore, load_result, \
+    relayout
 
 from test_ObjectiveFunction import (  # noqa: F401
     test_create_fail_create_study, test_create_fail_study,
@@ -47,3 +53,130 @@ class TestObjectiveFunctionScenarioResidual(TOFSM):
         super().test_set_result(
             requests_mock, baseurl, objectiveA, valuesA, result)
         assert objectiveA.num_residuals == 10
+
+    def test_get_result_mmap(
+            self, requests_mock, baseurl, objectiveA, valuesA, result):
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                result['dbname']: result['dbvalue'],
+                'id': 1})
+        res = objectiveA.get_result(valuesA)
+        assert isinstance(res['residual'], numpy.memmap)
+        self._compare(res['residual'], result['resvalue'])
+        # the second lookup is served from the cache and the array cache
+        ncalls = requests_mock.call_count
+        again = objectiveA.get_result(valuesA)
+        assert again['residual'] is res['residual']
+        assert requests_mock.call_count == ncalls
+
+    def test_get_result_inline(
+            self, requests_mock, baseurl, objfun, requests_objfun_new,
+            rundir, paramsA, valuesA, result):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           inline_results=True)
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                result['dbname']: result['dbvalue'],
+                'id': 1})
+        objective.get_result(valuesA)
+        key = objective._transform_parameters(valuesA)
+        assert 'payload' in objective.cache()[key]
+        # the result file is no longer needed
+        Path(result['dbvalue']).unlink()
+        objective._residuals.clear()
+        self._compare(objective.get_result(valuesA)['residual'],
+                      result['resvalue'])
+
+    @pytest.mark.parametrize("store", ['file', 'chunked'])
+    def test_set_result_compressed(
+            self, requests_mock, baseurl, objfun, requests_objfun_new,
+            rundir, paramsA, valuesA, store):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           result_store=store, result_dtype='float32',
+                           result_compression='shuffle')
+        resval = numpy.linspace(0, 1, 100)
+        runid = 1
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': runid})
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs/{runid}/value', status_code=201)
+        objective.set_result(valuesA, resval)
+        ref = requests_mock.last_request.json()['value']
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                'value': ref,
+                'id': runid})
+        res = objective.get_result(valuesA)['residual']
+        assert res.dtype == numpy.float64
+        assert numpy.allclose(res, resval, rtol=1e-6)
+
+    def test_migrate_results(
+            self, requests_mock, baseurl, objfun, requests_objfun_new,
+            tmp_path, paramsA, valuesA):
+        objective = objfun('test', 'test_secret',
+                           self.study, tmp_path, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           result_store='chunked', fanout=1)
+        resval = numpy.arange(10.)
+        fnames = []
+        for runid in [1, 2]:
+            fnames.append(objective.scenario_dir() / f'residuals_{runid}.npy')
+            numpy.save(fnames[-1], resval + runid)
+        key = objective._transform_parameters(valuesA)
+        keyB = dict(key, a=key['a'] + 1)
+        # only the first run is cached
+        objective.cache()[key] = {'id': 1, 'value': str(fnames[0])}
+        # the files have been moved since the runs were completed
+        relayout(objective.scenario_dir(), 1)
+        assert not fnames[0].exists()
+        requests_mock.register_uri(
+            'GET', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs', status_code=200, json={'data': [
+                {'id': 1, 'state': 'COMPLETED', 'values': key,
+                 'value': str(fnames[0])},
+                {'id': 2, 'state': 'COMPLETED', 'values': keyB,
+                 'value': str(fnames[1])},
+                {'id': 3, 'state': 'ACTIVE', 'values': key}]})
+        puts = {}
+        for runid in [1, 2]:
+            puts[runid] = requests_mock.register_uri(
+                'PUT', baseurl + f'studies/{self.study}/scenarios/'
+                f'{self.scenario}/runs/{runid}/value', status_code=201)
+
+        migrate_results(objective, None, Namespace(remove=True))
+        for runid in [1, 2]:
+            ref = puts[runid].last_request.json()['value']
+            assert ChunkedStore.handles(ref)
+            assert numpy.array_equal(load_result(ref), resval + runid)
+            if runid == 1:
+                # the cache entry is kept and refers to the migrated result
+                assert objective.cache()[key]['value'] == ref
+        # the uncached run is not added to the cache
+        with pytest.raises(LookupError):
+            objective.cache().get_by_id(2)
+        assert len(list(objective.scenario_dir().rglob('*.npy'))) == 0
+
+    def test_unknown_compression(
+            self, objfun, requests_objfun_new, rundir, paramsA, baseurl):
+        with pytest.raises(ValueError):
+            objfun('test', 'test_secret', self.study, rundir, paramsA,
+                   scenario=self.scenario, url_base=baseurl,
+                   result_compression='unknown')
@@ -1,9 +1,14 @@
 import pytest
+import gzip
+import json
 import pandas
 import numpy
+from pathlib import Path
 from functools import partial
 
 from ObjectiveFunction_client import ObjectiveFunctionSimObs
+from ObjectiveFunction_client import LookupState
+from ObjectiveFunction_client.storage import partition
 
 from test_ObjectiveFunction import (  # noqa: F401
     test_create_fail_create_study, test_create_fail_study)
@@ -154,3 +159,251 @@ class TestObjectiveFunctionScenarioSimObs(
         super().test_set_result(
             requests_mock, baseurl, objectiveA, valuesA, result)
         assert objectiveA.num_residuals == 3
+
+    def test_get_result_inline(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, result):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           inline_results=True)
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                result['dbname']: result['dbvalue'],
+                'id': 1})
+        objective.get_result(valuesA)
+        # the result file is no longer needed
+        Path(result['dbvalue']).unlink()
+        res = objective.get_result(valuesA)['simobs']
+        self._compare(res[result['resvalue'].index], result['resvalue'])
+
+    def test_set_result_fanout(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, result):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           fanout=2)
+        runid = 3
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': runid})
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs/{runid}/value', status_code=201)
+        objective.set_result(valuesA, result['resvalue'])
+        ref = Path(requests_mock.last_request.json()['value'])
+        assert ref == objective.scenario_dir().joinpath(
+            *partition(runid, 2), f'simobs_{runid}.json')
+        assert ref.exists()
+
+    @pytest.mark.parametrize("return_numpy", [True, False])
+    def test_set_result_binary(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, result, return_numpy):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           simobs_format='binary', return_numpy=return_numpy)
+        runid = 5
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': runid})
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs/{runid}/value', status_code=201)
+        # the input is reordered
+        objective.set_result(valuesA, result['resvalue'][::-1])
+        ref = requests_mock.last_request.json()['value']
+        assert ref.endswith(f'simobs_{runid}.npy')
+        assert objective.observation_index.exists()
+
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                'value': ref, 'id': runid})
+        res = objective.get_result(valuesA)['simobs']
+        expected = result['resvalue'][objective.observationNames]
+        if return_numpy:
+            assert isinstance(res, numpy.ndarray)
+            assert numpy.all(res == expected.to_numpy())
+        else:
+            self._compare(res, expected)
+
+    @pytest.mark.parametrize("simobs_format", ['json', 'binary'])
+    def test_set_result_array(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, result, simobs_format):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           simobs_format=simobs_format)
+        runid = 6
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': runid})
+        requests_mock.register_uri(
+            'PUT', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/runs/{runid}/value', status_code=201)
+        # the array is in the order of the observation names
+        expected = result['resvalue'][objective.observationNames]
+        objective.set_result(valuesA, expected.to_numpy())
+        ref = requests_mock.last_request.json()['value']
+
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                'value': ref, 'id': runid})
+        res = objective.get_result(valuesA)['simobs']
+        self._compare(res, expected)
+
+    @pytest.mark.parametrize("simobs_format", ['json', 'binary'])
+    def test_set_result_array_fail(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, simobs_format):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           simobs_format=simobs_format)
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/get_run',
+            status_code=201, json={
+                'state': LookupState.ACTIVE.name,
+                'id': 1})
+        with pytest.raises(RuntimeError):
+            objective.set_result(valuesA, numpy.arange(2.))
+
+    def test_binary_index_mismatch(
+            self, objfun, requests_objfun_simobs_new, rundir, paramsA,
+            baseurl):
+        objective = objfun('test', 'test_secret',
+                           self.study, rundir, paramsA,
+                           scenario=self.scenario, url_base=baseurl,
+                           simobs_format='binary')
+        numpy.save(objective.observation_index,
+                   numpy.array(sorted(objective.observationNames)[::-1]))
+        with pytest.raises(RuntimeError):
+            objective._check_index()
+
+    def test_unknown_format(
+            self, objfun, requests_objfun_simobs_new, rundir, paramsA,
+            baseurl):
+        with pytest.raises(ValueError):
+            objfun('test', 'test_secret', self.study, rundir, paramsA,
+                   scenario=self.scenario, url_base=baseurl,
+                   simobs_format='xml')
+
+    def test_check_simobs(self, objectiveA, obsnames):
+        simobs = {n: float(i) for i, n in enumerate(obsnames[::-1])}
+        res = objectiveA._check_simobs(simobs)
+        assert list(res.index) == obsnames
+        for n in obsnames:
+            assert res[n] == simobs[n]
+
+    @pytest.mark.parametrize("simobs", [
+        {'simA': 1., 'simB': 2.},
+        {'simA': 1., 'simB': 2., 'simD': 3.},
+        pandas.Series([1., 2., 3.], index=['simA', 'simA', 'simB'])])
+    def test_check_simobs_fail(self, objectiveA, simobs):
+        with pytest.raises(RuntimeError):
+            objectiveA._check_simobs(simobs)
+
+    def test_create_study_compressed(
+            self, requests_mock, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, baseurl, obsnames):
+        objfun('test', 'test_secret', self.study, rundir, paramsA,
+               scenario=self.scenario, url_base=baseurl,
+               compress_requests=True)
+        request = [r for r in requests_mock.request_history
+                   if r.path.endswith('observation_names')][-1]
+        assert request.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(request.body)) == {
+            'obsnames': obsnames}
+
+    def _objective_targets(self, objfun, rundir, paramsA, baseurl,
+                           obsnames, **kwds):
+        targets = {n: float(i + 1) for i, n in enumerate(obsnames)}
+        return objfun('test', 'test_secret', self.study, rundir, paramsA,
+                      scenario=self.scenario, url_base=baseurl,
+                      targets=targets, **kwds)
+
+    def test_residuals(self, objfun, requests_objfun_simobs_new, rundir,
+                       paramsA, baseurl, obsnames):
+        objective = self._objective_targets(
+            objfun, rundir, paramsA, baseurl, obsnames,
+            weights={obsnames[0]: 2.})
+        simobs = pandas.Series({n: 1. for n in obsnames[::-1]})
+        expected = (1. - numpy.arange(1, 4)) * numpy.array([2., 1., 1.])
+        assert numpy.allclose(objective.residuals(simobs), expected)
+        assert numpy.allclose(
+            objective.residuals(numpy.ones(3)), expected)
+
+    def test_residuals_covariance(
+            self, objfun, requests_objfun_simobs_new, rundir, paramsA,
+            baseurl, obsnames):
+        a = numpy.array([[2., 0.5, 0.], [0.5, 1., 0.2], [0., 0.2, 3.]])
+        objective = self._objective_targets(
+            objfun, rundir, paramsA, baseurl, obsnames, covariance=a)
+        simobs = numpy.array([0., 5., -1.])
+        res = objective.residuals(simobs)
+        diff = simobs - numpy.arange(1, 4)
+        # the sum of squares is the Mahalanobis distance
+        assert numpy.isclose(res @ res, diff @ numpy.linalg.solve(a, diff))
+        assert objective.cholesky is objective.cholesky
+        assert numpy.allclose(objective.cholesky @ res, diff)
+
+    def test_residuals_call(
+            self, requests_mock, baseurl, objfun, requests_objfun_simobs_new,
+            rundir, paramsA, valuesA, result, obsnames):
+        objective = self._objective_targets(
+            objfun, rundir, paramsA, baseurl, obsnames)
+        requests_mock.register_uri(
+            'POST', baseurl + f'studies/{self.study}/scenarios/'
+            f'{self.scenario}/lookup_run',
+            status_code=201, json={
+                'state': LookupState.COMPLETED.name,
+                result['dbname']: result['dbvalue'],
+                'id': 1})
+        res = objective(list(valuesA.values()))
+        expected = result['resvalue'][obsnames].to_numpy() - \
+            numpy.arange(1, 4)
+        assert numpy.allclose(res, expected)
+
+    def test_residuals_no_targets(self, objectiveA):
+        with pytest.raises(RuntimeError):
+            objectiveA.residuals(numpy.ones(3))
+
+    @pytest.mark.parametrize("kwds", [
+        {'weights': {'simX': 1.}},
+        {'weights': {'simA': 1.}, 'covariance': numpy.eye(3)},
+        {'covariance': numpy.eye(2)}])
+    def test_residuals_wrong_options(
+            self, objfun, requests_objfun_simobs_new, rundir, paramsA,
+            baseurl, obsnames, kwds):
+        with pytest.raises(ValueError):
+            self._objective_targets(
+                objfun, rundir, paramsA, baseurl, obsnames, **kwds)
+
+    def test_residuals_wrong_targets(
+            self, objfun, requests_objfun_simobs_new, rundir, paramsA,
+            baseurl):
+        with pytest.raises(RuntimeError):
+            self._objective_targets(
+                objfun, rundir, paramsA, baseurl, ['simA', 'simB'])
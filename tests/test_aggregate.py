@@ -0,0 +1,78 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client import ObjectiveFunctionMisfit
+from ObjectiveFunction_client import AggregateObjectiveFunction
+from ObjectiveFunction_client import LookupState
+from ObjectiveFunction_client import PreliminaryRun, NewRun, Waiting
+
+
+@pytest.fixture
+def objfun(request_token, requests_objfun_new, baseurl, study, tmp_path,
+           paramsA):
+    return ObjectiveFunctionMisfit('test', 'test_secret', study, tmp_path,
+                                   paramsA, scenario='s0', url_base=baseurl)
+
+
+def register(requests_mock, baseurl, study, scenario, response):
+    return requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/{scenario}/lookup_run',
+        status_code=201, json=response)
+
+
+def test_aggregate_options(objfun):
+    with pytest.raises(ValueError):
+        AggregateObjectiveFunction(objfun, [])
+    with pytest.raises(ValueError):
+        AggregateObjectiveFunction(objfun, ['s1', 's2'], weights=[1.])
+    with pytest.raises(ValueError):
+        AggregateObjectiveFunction(objfun, ['s1'], weights=[-1.])
+    agg = AggregateObjectiveFunction(objfun, ['s1', 's2'])
+    assert agg.scenarios == ['s1', 's2']
+    assert numpy.all(agg.weights == 1)
+    # the default scenario is unchanged
+    assert objfun.scenario_name() == 's0'
+
+
+def test_aggregate(requests_mock, baseurl, study, objfun, valuesA):
+    posts = [register(requests_mock, baseurl, study, s,
+                      {'state': LookupState.COMPLETED.name,
+                       'id': 1, 'value': v})
+             for s, v in [('s1', 2.), ('s2', 3.)]]
+    agg = AggregateObjectiveFunction(objfun, ['s1', 's2'], weights=[1, 2])
+    result = agg.get_result(valuesA)
+    assert result['misfit'] == 8.
+    assert result['runs']['s2']['misfit'] == 3.
+    assert agg((0, 1, -2)) == 8.
+    # the completed runs are cached
+    assert [p.call_count for p in posts] == [1, 1]
+
+
+@pytest.mark.parametrize('statuses,event', [
+    (['provisional', 'new'], PreliminaryRun),
+    (['waiting', 'new'], NewRun),
+    (['waiting', None], Waiting)])
+def test_aggregate_events(requests_mock, baseurl, study, objfun, valuesA,
+                          statuses, event):
+    posts = []
+    for i, status in enumerate(statuses):
+        if status is None:
+            response = {'state': LookupState.COMPLETED.name, 'id': 1,
+                        'value': 1.}
+        else:
+            response = {'status': status}
+        posts.append(register(requests_mock, baseurl, study, f's{i + 1}',
+                              response))
+    agg = AggregateObjectiveFunction(objfun, ['s1', 's2'])
+    with pytest.raises(event):
+        agg.get_result(valuesA)
+    # all scenarios are looked up
+    assert [p.call_count for p in posts] == [1, 1]
+
+
+def test_aggregate_combine_residual(objfun):
+    agg = AggregateObjectiveFunction(objfun, ['s1', 's2'], weights=[1, 4])
+    result = agg._combine({'s1': {'residual': numpy.array([1., 2.])},
+                           's2': {'residual': numpy.array([1.])}})
+    assert numpy.allclose(result['residual'], [1, 2, 2])
+    assert result['misfit'] == 9.
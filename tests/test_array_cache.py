@@ -0,0 +1,79 @@
+import pytest
+import numpy
+import threading
+
+from ObjectiveFunction_client.array_cache import ArrayCache
+
+
+def test_wrong_size():
+    with pytest.raises(ValueError):
+        ArrayCache(-1)
+
+
+@pytest.fixture
+def cache():
+    return ArrayCache(3 * 80)
+
+
+def test_get_missing(cache):
+    with pytest.raises(KeyError):
+        cache.get(1)
+    assert cache.misses == 1
+
+
+def test_put_get(cache):
+    a = numpy.arange(10.)
+    cache.put(1, a)
+    assert cache.get(1) is a
+    assert cache.hits == 1
+    assert cache.nbytes == a.nbytes
+    assert 1 in cache
+
+
+def test_evict_lru(cache):
+    for i in range(3):
+        cache.put(i, numpy.arange(10.))
+    cache.get(0)
+    cache.put(3, numpy.arange(10.))
+    assert len(cache) == 3
+    assert 1 not in cache
+    assert 0 in cache
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_too_large(cache):
+    cache.put(1, numpy.arange(100.))
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_replace_pop_clear(cache):
+    cache.put(1, numpy.arange(10.))
+    cache.put(1, numpy.arange(5.))
+    assert cache.nbytes == 40
+    cache.pop(1)
+    cache.pop(1)
+    assert cache.nbytes == 0
+    cache.put(2, numpy.arange(5.))
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_threads(cache):
+    def worker(offset):
+        for i in range(2000):
+            key = (offset + i) % 20
+            cache.put(key, numpy.zeros(4))
+            cache.pop((key + 7) % 20)
+            try:
+                cache.get((key + 3) % 20)
+            except KeyError:
+                pass
+    threads = [threading.Thread(target=worker, args=(k, ))
+               for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.nbytes == 32 * len(cache)
+    assert cache.nbytes <= cache.max_bytes
@@ -0,0 +1,114 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client import ObjectiveFunctionMisfit, LookupState
+from ObjectiveFunction_client.batch import CMAES, BatchDriver
+from ObjectiveFunction_client.design import latin_hypercube
+from ObjectiveFunction_client.surrogate import GaussianProcess
+
+
+def sphere(X):
+    return numpy.sum((numpy.asarray(X) - 0.25) ** 2, axis=1)
+
+
+@pytest.fixture
+def cmaes():
+    return CMAES([0.8, -0.8, 0.5], 0.3, [-1, -1, -1], [1, 1, 1], seed=1,
+                 max_generations=200, xtol=1e-4)
+
+
+def test_cmaes(cmaes):
+    assert cmaes.popsize == 7
+    while not cmaes.done:
+        X = cmaes.ask()
+        assert X.shape == (cmaes.popsize, 3)
+        assert numpy.all(X >= -1) and numpy.all(X <= 1)
+        cmaes.tell(X, sphere(X))
+    x, f = cmaes.best
+    assert cmaes.generation < 200
+    assert numpy.allclose(x, 0.25, atol=1e-3)
+    assert f < 1e-5
+
+
+class FakeObjFun:
+    """complete the runs of every other batch"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def evaluate_batch(self, X, mask=None):
+        self.calls += 1
+        values = sphere(X)
+        if self.calls % 2 == 1:
+            values[:] = numpy.nan
+        if mask is not None:
+            values[~mask] = numpy.nan
+        return values, [{} for x in X]
+
+
+def test_batch_driver(tmp_path, cmaes):
+    checkpoint = tmp_path / 'batch.pickle'
+    objfun = FakeObjFun()
+    driver = BatchDriver(objfun, cmaes, checkpoint)
+    assert driver.step() == 'new'
+    batch = driver.batch
+    assert checkpoint.exists()
+
+    # restart from the checkpoint, the same batch is evaluated
+    driver = BatchDriver(objfun, None, checkpoint)
+    assert numpy.array_equal(driver.batch, batch)
+    assert driver.step() == 'new'
+    assert driver.optimiser.generation == 1
+
+    driver = BatchDriver(objfun, None, checkpoint)
+    objfun.calls += 1
+    assert driver.step() == 'waiting'
+
+
+def test_batch_driver_screen(tmp_path, cmaes):
+    checkpoint = tmp_path / 'batch.pickle'
+    objfun = FakeObjFun()
+    X = latin_hypercube(20, [-1, -1, -1], [1, 1, 1], seed=2)
+    surrogate = GaussianProcess([-1, -1, -1], [1, 1, 1], lengthscale=0.5)
+    surrogate.fit(X, sphere(X))
+    driver = BatchDriver(objfun, cmaes, checkpoint, surrogate=surrogate,
+                         screen=3)
+    assert driver.step() == 'new'
+    batch = driver.batch
+    mask, predicted = driver._screened
+    assert mask.sum() == 3
+    assert mask[surrogate.rank(batch)[:3]].all()
+
+    # the screening and the surrogate are restored from the checkpoint
+    driver = BatchDriver(objfun, None, checkpoint, screen=3)
+    assert numpy.array_equal(driver._screened[0], mask)
+    assert len(driver.surrogate) == 20
+    assert numpy.array_equal(driver.surrogate._L, surrogate._L)
+    assert driver.step() == 'new'
+    assert len(driver.surrogate) == 23
+    assert driver.optimiser.generation == 1
+
+    # the updated surrogate is checkpointed
+    driver = BatchDriver(objfun, None, checkpoint, screen=3)
+    assert len(driver.surrogate) == 23
+
+
+def test_evaluate_batch(requests_mock, request_token, requests_objfun_new,
+                        baseurl, study, tmp_path, paramsA):
+    def get_run(request, context):
+        a = request.json()['parameters']['a']
+        context.status_code = 201
+        if a == 0:
+            return {'id': 1, 'state': LookupState.ACTIVE.name}
+        return {'id': 2, 'state': LookupState.COMPLETED.name, 'value': 5.}
+    requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/get_run',
+        json=get_run)
+    objfun = ObjectiveFunctionMisfit('test', 'test_secret', study, tmp_path,
+                                     paramsA, scenario='s', url_base=baseurl)
+    values, runs = objfun.evaluate_batch(
+        numpy.array([[-1., 1., -2.], [0.5, 1., -2.]]))
+    assert numpy.isnan(values[0])
+    assert values[1] == 5.
+    assert runs[0]['state'] == LookupState.ACTIVE
+    assert runs[1]['misfit'] == 5.
@@ -0,0 +1,45 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client.bloom import BloomFilter
+
+
+@pytest.mark.parametrize("capacity,error_rate",
+                         [(0, 0.01), (10, 0), (10, 1)])
+def test_wrong_args(capacity, error_rate):
+    with pytest.raises(ValueError):
+        BloomFilter(capacity, error_rate)
+
+
+@pytest.fixture
+def keys():
+    rng = numpy.random.default_rng(1)
+    return numpy.unique(rng.integers(0, 10**9, size=(1000, 3)), axis=0)
+
+
+@pytest.fixture
+def bloom(keys):
+    bloom = BloomFilter(len(keys))
+    bloom.add(keys)
+    return bloom
+
+
+def test_len(bloom, keys):
+    assert len(bloom) == len(keys)
+    assert not bloom.full
+
+
+def test_no_false_negatives(bloom, keys):
+    assert numpy.all(bloom.contains(keys))
+    assert keys[0] in bloom
+
+
+def test_false_positive_rate(bloom, keys):
+    assert bloom.false_positive_rate == pytest.approx(0.01, rel=0.2)
+    other = keys + 10**9
+    assert numpy.mean(bloom.contains(other)) < 0.03
+
+
+def test_full(bloom, keys):
+    bloom.add(keys[:1])
+    assert bloom.full
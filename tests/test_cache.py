@@ -1,6 +1,6 @@
 import pytest
 
-from ObjectiveFunction_client.cache import ObjFunCache
+from ObjectiveFunction_client.cache import ObjFunCache, ObjFunStudyCache
 from ObjectiveFunction_client import LookupState
 
 
@@ -98,3 +98,214 @@ def test_lookup_fail_same_value(cache_with_entry, entry):
     result['id'] = 10
     with pytest.raises(RuntimeError):
         cache_with_entry[value] = result
+
+
+def test_delete(cache_with_entry, entry):
+    value, result = entry
+    del cache_with_entry[value]
+    assert len(cache_with_entry) == 0
+    with pytest.raises(LookupError):
+        cache_with_entry[value]
+
+
+def test_set_value(cache_with_entry, entry):
+    value, result = entry
+    cache_with_entry.set_value(result['id'], 20.)
+    assert cache_with_entry[value]['value'] == 20.
+    with pytest.raises(LookupError):
+        cache_with_entry.set_value(2, 20.)
+
+
+def test_entries(cache_with_entry, entry):
+    value, result = entry
+    entries = list(cache_with_entry.entries())
+    assert len(entries) == 1
+    assert entries[0][0] == value
+    assert entries[0][1]['id'] == result['id']
+    assert list(cache_with_entry) == [value]
+
+
+def test_stats(cache_with_entry):
+    stats = cache_with_entry.stats()
+    assert stats['entries'] == 1
+    assert stats['size'] > 0
+    assert stats['max_entries'] is None
+
+
+@pytest.fixture
+def limited_cache():
+    return ObjFunCache(":memory:", ['a'], 'real', max_entries=3)
+
+
+def test_evict_max_entries(limited_cache):
+    for i in range(3):
+        limited_cache[{'a': i}] = {'id': i + 1, 'value': float(i)}
+    # looking up the first entry makes the second one the oldest
+    limited_cache[{'a': 0}]
+    limited_cache[{'a': 3}] = {'id': 4, 'value': 3.}
+    assert len(limited_cache) == 3
+    with pytest.raises(LookupError):
+        limited_cache[{'a': 1}]
+    limited_cache[{'a': 0}]
+
+
+def test_access_buffered(limited_cache):
+    limited_cache[{'a': 0}] = {'id': 1, 'value': 0.}
+    query = 'select accessed from lookup_access where id=1;'
+    accessed = limited_cache.con.execute(query).fetchone()[0]
+    # lookups do not write to the database
+    limited_cache[{'a': 0}]
+    assert not limited_cache.con.in_transaction
+    assert limited_cache.con.execute(query).fetchone()[0] == accessed
+    limited_cache.flush()
+    assert limited_cache.con.execute(query).fetchone()[0] > accessed
+
+
+def test_evict_max_size(rundir):
+    cache = ObjFunCache(rundir / 'limited.sqlite', ['a'], 'text',
+                        max_size=65536)
+    for i in range(1000):
+        cache[{'a': i}] = {'id': i + 1, 'value': 'x' * 200}
+    assert cache.size <= 65536
+    assert 0 < len(cache) < 1000
+    file_size = cache.stats()['file_size']
+    cache.vacuum()
+    assert cache.stats()['file_size'] < file_size
+
+
+def test_get_by_id(cache_with_entry, entry):
+    value, result = entry
+    key, run = cache_with_entry.get_by_id(result['id'])
+    assert key == value
+    assert run['value'] == result['value']
+    with pytest.raises(LookupError):
+        cache_with_entry.get_by_id(100)
+
+
+def test_filter_negative(cache_with_entry, entry):
+    value, result = entry
+    with pytest.raises(LookupError):
+        cache_with_entry[{'a': 100, 'b': 100}]
+    cache_with_entry[value]
+    stats = cache_with_entry.stats()
+    assert stats['filter_negatives'] + stats['filter_false_positives'] == 1
+    assert stats['filter_fpr'] is not None
+
+
+def test_filter_grows():
+    cache = ObjFunCache(":memory:", ['a'], 'real')
+    capacity = cache.stats()['filter_capacity']
+    for i in range(capacity + 1):
+        cache[{'a': i}] = {'id': i + 1, 'value': float(i)}
+    assert cache.stats()['filter_capacity'] == 2 * capacity
+    for i in range(capacity + 1):
+        assert cache[{'a': i}]['id'] == i + 1
+
+
+def test_filter_other_connection(rundir, cache, params):
+    other = ObjFunCache(rundir / 'cache.sqlite', params, 'real')
+    other[{'a': 5, 'b': 6}] = {'id': 5, 'value': 1.}
+    # the filter is updated at most every FILTER_REFRESH seconds
+    cache.FILTER_REFRESH = 60
+    with pytest.raises(LookupError):
+        cache[{'a': 5, 'b': 6}]
+    cache.FILTER_REFRESH = 0
+    assert cache[{'a': 5, 'b': 6}]['id'] == 5
+    # entries with smaller run IDs are found too
+    other[{'a': 1, 'b': 2}] = {'id': 2, 'value': 1.}
+    assert cache[{'a': 1, 'b': 2}]['id'] == 2
+
+
+def test_filter_miss_statements(cache_with_entry):
+    statements = []
+    cache_with_entry.con.set_trace_callback(statements.append)
+    with pytest.raises(LookupError):
+        cache_with_entry[{'a': 100, 'b': 100}]
+    # a definite miss does not access the database
+    assert statements == []
+    cache_with_entry.FILTER_REFRESH = 0
+    with pytest.raises(LookupError):
+        cache_with_entry[{'a': 100, 'b': 100}]
+    # without changes by other connections only the data version is read
+    assert statements == ['pragma data_version;']
+
+
+@pytest.fixture
+def study_cache(rundir, params):
+    return ObjFunStudyCache(rundir / 'study.sqlite', params, 'real')
+
+
+def test_study_cache_wrong_name(study_cache):
+    with pytest.raises(ValueError):
+        study_cache.scenario('wrong name')
+
+
+def test_study_cache_scenarios(study_cache, entry):
+    value, result = entry
+    cacheA = study_cache.scenario('scenA')
+    cacheB = study_cache.scenario('scenB')
+    assert cacheA.con is cacheB.con
+    cacheA[value] = result
+    assert len(cacheA) == 1
+    assert len(cacheB) == 0
+    with pytest.raises(LookupError):
+        cacheB[value]
+    # the same run ID and parameters may appear in another scenario
+    cacheB[value] = result
+    assert cacheB[value]['id'] == result['id']
+    with pytest.raises(RuntimeError):
+        cacheA[value] = result
+    assert study_cache.scenarios == ['scenA', 'scenB']
+
+
+def test_study_cache_delete(study_cache, entry):
+    value, result = entry
+    cacheA = study_cache.scenario('scenA')
+    cacheB = study_cache.scenario('scenB')
+    cacheA[value] = result
+    cacheB[value] = result
+    del cacheA[value]
+    assert len(cacheA) == 0
+    assert len(cacheB) == 1
+    assert cacheB.get_by_id(result['id'])[0] == value
+
+
+def test_study_cache_set_value(study_cache, entry):
+    value, result = entry
+    cacheA = study_cache.scenario('scenA')
+    cacheB = study_cache.scenario('scenB')
+    cacheA[value] = result
+    cacheB[value] = result
+    cacheA.set_value(result['id'], 20.)
+    assert cacheA[value]['value'] == 20.
+    assert cacheB[value]['value'] == result['value']
+
+
+def test_study_cache_reopen(rundir, study_cache, params, entry):
+    value, result = entry
+    study_cache.scenario('scenA')[value] = result
+    other = ObjFunStudyCache(rundir / 'study.sqlite', params, 'real')
+    assert other.scenario('scenA')[value]['id'] == result['id']
+
+
+def test_payloads_wrong_result_type():
+    with pytest.raises(ValueError):
+        ObjFunCache(":memory:", ['a'], 'real', payloads=True)
+
+
+def test_payloads_disabled(cache_with_entry, entry):
+    value, result = entry
+    assert 'payload' not in cache_with_entry[value]
+    with pytest.raises(RuntimeError):
+        cache_with_entry.set_payload(result['id'], b'data')
+
+
+def test_payloads():
+    cache = ObjFunCache(":memory:", ['a'], 'text', payloads=True)
+    cache[{'a': 1}] = {'id': 1, 'value': 'path'}
+    assert 'payload' not in cache[{'a': 1}]
+    cache.set_payload(1, b'\x00data')
+    assert cache[{'a': 1}]['payload'] == b'\x00data'
+    del cache[{'a': 1}]
+    cache[{'a': 1}] = {'id': 1, 'value': 'path'}
+    assert 'payload' not in cache[{'a': 1}]
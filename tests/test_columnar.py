@@ -0,0 +1,101 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client.cache import ObjFunCache
+from ObjectiveFunction_client.columnar import ObjFunColumnarCache
+from ObjectiveFunction_client import LookupState
+
+
+@pytest.fixture
+def rundir(tmpdir_factory):
+    res = tmpdir_factory.mktemp("of-columnar")
+    return res
+
+
+@pytest.fixture
+def entries():
+    entries = []
+    rid = 1
+    for a in range(5):
+        for b in range(3, -1, -1):
+            entries.append(({'a': a, 'b': b},
+                            {'id': rid, 'value': float(a * b)}))
+            rid += 1
+    return entries
+
+
+@pytest.fixture
+def snapshot(rundir, entries):
+    cache = ObjFunCache(":memory:", ['b', 'a'], 'real')
+    for key, run in entries:
+        cache[key] = run
+    return cache.snapshot(rundir / 'snapshot')
+
+
+def test_no_snapshot(rundir):
+    with pytest.raises(RuntimeError):
+        ObjFunColumnarCache(rundir / 'missing')
+
+
+def test_len(snapshot, entries):
+    assert len(snapshot) == len(entries)
+
+
+def test_sorted(snapshot):
+    keys = snapshot.keys_array()
+    assert numpy.all(numpy.lexsort(keys.T[::-1]) == numpy.arange(len(keys)))
+
+
+def test_mmap(snapshot):
+    assert isinstance(snapshot.ids, numpy.memmap)
+    assert not snapshot.values.flags.writeable
+
+
+def test_lookup(snapshot, entries):
+    for key, run in entries:
+        res = snapshot[key]
+        assert res['id'] == run['id']
+        assert res['value'] == run['value']
+        assert res['state'] == LookupState.COMPLETED
+
+
+def test_lookup_failure(snapshot):
+    with pytest.raises(LookupError):
+        snapshot[{'a': 10, 'b': 0}]
+
+
+def test_wrong_key(snapshot):
+    with pytest.raises(KeyError):
+        snapshot[{'a': 1}]
+
+
+def test_find(snapshot):
+    rows = snapshot.find({'a': numpy.array([1, 7]), 'b': numpy.array([2, 2])})
+    assert rows[1] == -1
+    assert snapshot.values[rows[0]] == 2.
+
+
+def test_find_all(snapshot, entries):
+    a = numpy.array([key['a'] for key, run in entries] + [-1, 5, 2])
+    b = numpy.array([key['b'] for key, run in entries] + [0, 0, 4])
+    rows = snapshot.find({'a': a, 'b': b})
+    assert numpy.all(rows[-3:] == -1)
+    for r, (key, run) in zip(rows, entries):
+        assert snapshot.ids[r] == run['id']
+
+
+def test_text_snapshot(rundir):
+    cache = ObjFunCache(":memory:", ['a'], 'text')
+    cache[{'a': 2}] = {'id': 1, 'value': 'some/path'}
+    cache[{'a': 1}] = {'id': 2, 'value': 'path'}
+    snapshot = cache.snapshot(rundir / 'text')
+    assert snapshot[{'a': 2}]['value'] == 'some/path'
+    assert list(snapshot) == [{'a': 1}, {'a': 2}]
+
+
+def test_empty_snapshot(rundir):
+    cache = ObjFunCache(":memory:", ['a'], 'real')
+    snapshot = cache.snapshot(rundir / 'empty')
+    assert len(snapshot) == 0
+    with pytest.raises(LookupError):
+        snapshot[{'a': 1}]
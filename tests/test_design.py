@@ -0,0 +1,80 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client import ObjectiveFunctionMisfit, LookupState
+from ObjectiveFunction_client import ParameterFloat, ParameterInt
+from ObjectiveFunction_client.design import latin_hypercube, halton
+from ObjectiveFunction_client.design import lattice_points, design
+
+
+def test_latin_hypercube():
+    lower = numpy.array([0., -1., 10.])
+    upper = numpy.array([1., 1., 20.])
+    num = 7
+    sample = latin_hypercube(num, lower, upper, seed=1)
+    assert sample.shape == (num, 3)
+    assert numpy.all(sample >= lower)
+    assert numpy.all(sample <= upper)
+    # each stratum of each parameter contains exactly one point
+    strata = numpy.floor((sample - lower) / (upper - lower) * num)
+    for i in range(3):
+        assert sorted(strata[:, i]) == list(range(num))
+
+
+def test_latin_hypercube_seed():
+    a = latin_hypercube(5, [0, 0], [1, 1], seed=42)
+    b = latin_hypercube(5, [0, 0], [1, 1], seed=42)
+    assert numpy.array_equal(a, b)
+
+
+@pytest.mark.parametrize('num,lower,upper', [
+    (0, [0], [1]),
+    (3, [0, 0], [1])])
+def test_latin_hypercube_fail(num, lower, upper):
+    with pytest.raises(ValueError):
+        latin_hypercube(num, lower, upper)
+
+
+def test_halton():
+    sample = halton(4, [0, 0], [1, 3])
+    assert numpy.allclose(sample[:, 0], [0.5, 0.25, 0.75, 0.125])
+    assert numpy.allclose(sample[:, 1], [1, 2, 1 / 3, 4 / 3])
+    # skipping points continues the sequence
+    assert numpy.allclose(halton(2, [0, 0], [1, 3], seed=2), sample[2:])
+
+
+@pytest.fixture
+def objectiveA(requests_mock, request_token, requests_objfun_new, baseurl,
+               study, tmp_path):
+    params = {'a': ParameterFloat(0, -1, 1, 0.5),
+              'b': ParameterInt(1, 0, 2),
+              'c': ParameterFloat(1, 0, 2, constant=True)}
+    return ObjectiveFunctionMisfit('test', 'test_secret', study, tmp_path,
+                                   params, scenario='s', url_base=baseurl)
+
+
+def test_lattice_points(objectiveA):
+    X = numpy.array([[0.1, 0.4], [-0.1, 0.2], [0.9, 1.6]])
+    points = lattice_points(objectiveA, X)
+    assert points == [{'a': 0., 'b': 0, 'c': 1.},
+                      {'a': 1., 'b': 2, 'c': 1.}]
+
+
+def test_design(requests_mock, baseurl, study, objectiveA):
+    def get_run(request, context):
+        context.status_code = 201
+        return {'id': 1, 'state': LookupState.NEW.name}
+    post = requests_mock.register_uri(
+        'POST', baseurl + f'studies/{study}/scenarios/s/get_run',
+        json=get_run)
+    points, runs = design(objectiveA, 20, method='halton')
+    # there are only 15 lattice points
+    assert len(points) <= 15
+    assert post.call_count == len(points)
+    assert len(runs) == len(points)
+
+    points, runs = design(objectiveA, 5, seed=1, register=False)
+    assert runs is None
+
+    with pytest.raises(ValueError):
+        design(objectiveA, 5, method='sobol')
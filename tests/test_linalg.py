@@ -0,0 +1,20 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client.linalg import solve_lower
+
+
+@pytest.mark.parametrize('n', [0, 1, 5, 300])
+def test_solve_lower(n):
+    rng = numpy.random.default_rng(n)
+    A = rng.random((n, n))
+    L = numpy.linalg.cholesky(A @ A.T + n * numpy.eye(n))
+    b = rng.random(n)
+    assert numpy.allclose(L @ solve_lower(L, b, block=64), b)
+    B = rng.random((n, 3))
+    assert numpy.allclose(L @ solve_lower(L, B, block=64), B)
+
+
+def test_solve_lower_shape():
+    with pytest.raises(ValueError):
+        solve_lower(numpy.eye(3), numpy.ones(2))
@@ -0,0 +1,60 @@
+import pytest
+
+from ObjectiveFunction_client.neighbours import NeighbourIndex
+
+
+@pytest.fixture
+def index():
+    index = NeighbourIndex(['a', 'b'], [2, 0])
+    for a, b in [(0, 0), (10, 0), (10, 1), (13, 1)]:
+        index.add({'a': a, 'b': b})
+    return index
+
+
+def test_index(index):
+    assert len(index) == 4
+    assert index.keys.shape == (4, 2)
+
+
+@pytest.mark.parametrize('key,neighbour', [
+    ({'a': 1, 'b': 0}, {'a': 0, 'b': 0}),
+    ({'a': 9, 'b': 0}, {'a': 10, 'b': 0}),
+    ({'a': 12, 'b': 1}, {'a': 13, 'b': 1}),
+    ({'a': 5, 'b': 0}, None),
+    ({'a': 0, 'b': 1}, None)])
+def test_query(index, key, neighbour):
+    assert index.query(key) == neighbour
+
+
+def test_query_empty():
+    index = NeighbourIndex(['a'], [1])
+    assert index.query({'a': 0}) is None
+
+
+def test_index_fail():
+    with pytest.raises(ValueError):
+        NeighbourIndex(['a', 'b'], [1])
+
+
+def test_candidates(index):
+    assert index.candidates({'a': 11, 'b': 1}) == [
+        {'a': 10, 'b': 1}, {'a': 13, 'b': 1}]
+    assert index.candidates({'a': 5, 'b': 1}) == []
+
+
+def test_add_remove(index):
+    index.add({'a': 10, 'b': 1})
+    assert len(index) == 4
+    index.remove({'a': 10, 'b': 1})
+    index.remove({'a': 7, 'b': 1})
+    assert len(index) == 3
+    assert index.query({'a': 11, 'b': 1}) == {'a': 13, 'b': 1}
+
+
+def test_query_many_parameters():
+    # more adjacent cells than occupied cells
+    names = [f'p{i}' for i in range(8)]
+    index = NeighbourIndex(names, [1] * 8)
+    index.add(dict.fromkeys(names, 0))
+    index.add(dict.fromkeys(names, 5))
+    assert index.query(dict.fromkeys(names, 1)) == dict.fromkeys(names, 0)
@@ -1,4 +1,6 @@
 import pytest
+import gzip
+import json
 
 from ObjectiveFunction_client.proxy import Proxy
 
@@ -25,3 +27,13 @@ def test_proxy_url_without(request_token, baseurl):
     p = Proxy('test', 'test_secret', url_base=baseurl[:-1])
     url = 'some/string'
     assert p.url(url) == baseurl + url
+
+
+def test_proxy_put_compressed(requests_mock, request_token, baseurl):
+    p = Proxy('test', 'test_secret', url_base=baseurl)
+    put = requests_mock.register_uri('PUT', baseurl + 'data',
+                                     status_code=201)
+    p.put('data', json={'a': [1, 2]}, compress=True)
+    request = put.last_request
+    assert request.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(request.body)) == {'a': [1, 2]}
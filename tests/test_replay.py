@@ -0,0 +1,62 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client.replay import ReplayJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = ReplayJournal(tmp_path / 'replay.pickle')
+    for i in range(3):
+        j.record(numpy.array([i, 0.5]), {'id': i, 'misfit': i * 2.})
+    return j
+
+
+def test_record(journal):
+    assert len(journal) == 3
+    # results are only recorded at the end of the trajectory
+    journal.rewind()
+    journal.record(numpy.array([9., 9.]), {'id': 9})
+    assert len(journal) == 3
+
+
+def test_replay(journal):
+    j = ReplayJournal(journal.path)
+    assert len(j) == 3
+    j.rewind()
+    for i in range(3):
+        assert j.replay(numpy.array([i, 0.5]))['misfit'] == i * 2.
+    assert j.replay(numpy.array([3, 0.5])) is None
+    assert j.replayed == 3
+    j.record(numpy.array([3, 0.5]), {'id': 3, 'misfit': 6.})
+    assert len(ReplayJournal(journal.path)) == 4
+
+
+def test_replay_diverge(journal):
+    journal.rewind()
+    assert journal.replay(numpy.array([0, 0.5])) is not None
+    assert journal.replay(numpy.array([1, 0.6])) is None
+    assert len(journal) == 1
+    journal.record(numpy.array([1, 0.6]), {'id': 4})
+    j = ReplayJournal(journal.path)
+    assert len(j) == 2
+    assert j.replay(numpy.array([0, 0.5]))['id'] == 0
+    assert j.replay(numpy.array([1, 0.6]))['id'] == 4
+
+
+def test_not_completed(journal):
+    journal.rewind()
+    for i in range(3):
+        journal.replay(numpy.array([i, 0.5]))
+    journal.record(numpy.array([3, 0.5]), {'id': 3}, completed=False)
+    journal.record(numpy.array([4, 0.5]), {'id': 4})
+    assert len(journal) == 3
+
+
+def test_incomplete_entry(journal):
+    with journal.path.open('ab') as f:
+        f.write(b'\x80\x04\x95')
+    size = journal.path.stat().st_size
+    j = ReplayJournal(journal.path)
+    assert len(j) == 3
+    assert journal.path.stat().st_size == size - 3
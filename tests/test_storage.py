@@ -0,0 +1,152 @@
+import pytest
+import numpy
+from io import BytesIO
+from pathlib import Path
+
+from ObjectiveFunction_client.storage import (
+    FileStore, ChunkedStore, load_result, encode, decode, CODECS,
+    partition, partitioned_path, locate, relayout)
+
+
+@pytest.fixture
+def rundir(tmpdir_factory):
+    res = tmpdir_factory.mktemp("of-storage")
+    return res
+
+
+@pytest.fixture(params=[FileStore, ChunkedStore])
+def store(request, rundir):
+    return request.param(rundir, 'residuals')
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load(store, mmap):
+    refs = {}
+    for i in range(1, 4):
+        refs[i] = store.save(i, numpy.arange(10.) * i)
+    for i in refs:
+        assert type(store).handles(refs[i])
+        data = load_result(refs[i], mmap=mmap)
+        assert numpy.all(data == numpy.arange(10.) * i)
+        assert isinstance(data, numpy.memmap) == mmap
+
+
+def test_save_2d(store):
+    a = numpy.asfortranarray(numpy.arange(12).reshape((3, 4)))
+    assert numpy.all(load_result(store.save(1, a)) == a)
+
+
+def test_save_empty(store):
+    assert load_result(store.save(1, numpy.array([]))).size == 0
+
+
+def test_file_store_path(rundir):
+    store = FileStore(rundir, 'residuals')
+    assert store.save(1, numpy.arange(3)) == str(rundir / 'residuals_1.npy')
+
+
+def test_chunked_store_single_file(rundir):
+    store = ChunkedStore(rundir, 'residuals')
+    refs = [store.save(i, numpy.arange(5)) for i in range(10)]
+    assert all(r.startswith(str(store.data_file) + '@') for r in refs)
+    index = store.index()
+    assert len(index) == 10
+    offset, length = index[9]
+    assert refs[9].endswith(f'@{offset}')
+    assert offset + length == store.data_file.stat().st_size
+
+
+@pytest.mark.parametrize("ref,chunked",
+                         [('a/residuals_1.npy', False),
+                          ('a/residuals.npystore@123', True),
+                          ('a/residuals.npystore@123+45', True),
+                          ('a/residuals_1.npz', False),
+                          ('a/residuals.npystore@x', False),
+                          ('a@b/residuals_1.npy', False)])
+def test_handles(ref, chunked):
+    assert ChunkedStore.handles(ref) == chunked
+    assert FileStore.handles(ref) != chunked
+
+
+@pytest.mark.parametrize("dtype", [None, 'float32', 'float16'])
+@pytest.mark.parametrize("codec", CODECS)
+def test_encode_decode(dtype, codec):
+    a = numpy.linspace(0, 1, 12).reshape((3, 4))
+    b = decode(BytesIO(encode(a, dtype=dtype, codec=codec)))
+    assert b.dtype == a.dtype
+    assert b.shape == a.shape
+    tol = 0 if dtype is None else numpy.finfo(dtype).eps
+    assert numpy.allclose(a, b, rtol=tol, atol=tol)
+
+
+def test_encode_unknown_codec():
+    with pytest.raises(ValueError):
+        encode(numpy.arange(3), codec='unknown')
+
+
+def test_shuffle_smaller():
+    a = numpy.sin(numpy.linspace(0, 10, 10000))
+    assert len(encode(a, dtype='float32', codec='shuffle')) < \
+        len(encode(a, dtype='float32', codec='deflate'))
+
+
+@pytest.mark.parametrize("cls", [FileStore, ChunkedStore])
+@pytest.mark.parametrize("codec", CODECS)
+def test_encoded_store(rundir, cls, codec):
+    store = cls(rundir, f'encoded_{codec}', dtype='float32',
+                compression=codec)
+    assert store.encoded
+    refs = {i: store.save(i, numpy.arange(10.) * i) for i in range(1, 4)}
+    # plain results can be stored alongside
+    plain = cls(rundir, f'encoded_{codec}').save(4, numpy.arange(3.))
+    for i in refs:
+        assert cls.handles(refs[i])
+        data = load_result(refs[i])
+        assert data.dtype == numpy.float64
+        assert numpy.all(data == numpy.arange(10.) * i)
+    assert numpy.all(load_result(plain) == numpy.arange(3.))
+
+
+def test_store_unknown_compression(rundir):
+    with pytest.raises(ValueError):
+        FileStore(rundir, 'residuals', compression='unknown')
+
+
+def test_partition():
+    assert partition(1, 0) == []
+    parts = partition(1, 4)
+    assert len(parts) == 4
+    assert all(len(p) == 2 for p in parts)
+    assert partition(1, 2) == parts[:2]
+    with pytest.raises(ValueError):
+        partition(1, 5)
+
+
+def test_file_store_fanout(rundir):
+    store = FileStore(rundir, 'fanout', fanout=2)
+    ref = store.save(7, numpy.arange(3))
+    assert ref == str(rundir.join(*partition(7, 2), 'fanout_7.npy'))
+    assert numpy.all(load_result(ref) == numpy.arange(3))
+
+
+@pytest.mark.parametrize("old,new", [(0, 2), (2, 0), (1, 3), (2, 2)])
+def test_relayout(tmp_path, old, new):
+    store = FileStore(tmp_path, 'residuals', fanout=old)
+    refs = {i: store.save(i, numpy.arange(3) * i) for i in range(20)}
+    (tmp_path / 'cache.sqlite').write_text('')
+    moved = relayout(tmp_path, new)
+    assert moved == (0 if old == new else 20)
+    assert (tmp_path / 'cache.sqlite').exists()
+    for i in refs:
+        assert Path(partitioned_path(
+            tmp_path, f'residuals_{i}.npy', i, new)).exists()
+        # the old references can still be read
+        assert numpy.all(load_result(refs[i]) == numpy.arange(3) * i)
+    if new == 0:
+        assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 0
+
+
+def test_locate_missing(tmp_path):
+    assert locate(str(tmp_path / 'residuals_1.npy')) == \
+        str(tmp_path / 'residuals_1.npy')
+    assert locate(str(tmp_path / 'other')) == str(tmp_path / 'other')
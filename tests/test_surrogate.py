@@ -0,0 +1,67 @@
+import pytest
+import numpy
+
+from ObjectiveFunction_client.surrogate import GaussianProcess
+
+
+def f(X):
+    X = numpy.atleast_2d(X)
+    return numpy.sum((X - 0.3) ** 2, axis=1)
+
+
+@pytest.fixture
+def points():
+    rng = numpy.random.default_rng(1)
+    return rng.random((30, 2)) * 2 - 1
+
+
+def test_empty():
+    gp = GaussianProcess([-1, -1], [1, 1])
+    assert len(gp) == 0
+    mu, sigma = gp.predict([[0, 0], [0.5, 0.5]])
+    assert numpy.all(numpy.isinf(sigma))
+    assert list(gp.rank([[0, 0], [0.5, 0.5]])) == [0, 1]
+
+
+def test_fit(points):
+    gp = GaussianProcess([-1, -1], [1, 1], lengthscale=0.5)
+    gp.fit(points, f(points))
+    assert len(gp) == 30
+    # the observations are interpolated
+    mu, sigma = gp.predict(points)
+    assert numpy.allclose(mu, f(points), atol=1e-3)
+    assert numpy.all(sigma < 1e-2)
+    # the uncertainty grows away from the observations
+    test = numpy.array([[0.3, 0.3], [5., 5.]])
+    mu, sigma = gp.predict(test)
+    assert abs(mu[0]) < 0.05
+    assert sigma[1] > sigma[0]
+
+
+def test_add(points):
+    gp1 = GaussianProcess([-1, -1], [1, 1], lengthscale=0.5)
+    gp1.fit(points, f(points))
+    gp2 = GaussianProcess([-1, -1], [1, 1], lengthscale=0.5)
+    gp2.fit(points[:10], f(points[:10]))
+    for x in points[10:]:
+        gp2.add(x, f(x)[0])
+    test = numpy.array([[0., 0.], [0.3, -0.2]])
+    for a, b in zip(gp1.predict(test), gp2.predict(test)):
+        assert numpy.allclose(a, b)
+    # repeated points are ignored
+    gp2.add(points[0], f(points[0])[0])
+    assert len(gp2) == 30
+
+
+def test_rank(points):
+    gp = GaussianProcess([-1, -1], [1, 1], lengthscale=0.5)
+    gp.fit(points, f(points))
+    candidates = numpy.array([[-0.9, -0.9], [0.3, 0.3], [0.9, 0.9]])
+    assert gp.rank(candidates, kappa=0)[0] == 1
+
+
+def test_options():
+    with pytest.raises(ValueError):
+        GaussianProcess([0], [1, 1])
+    with pytest.raises(ValueError):
+        GaussianProcess([0], [1], lengthscale=0)
@@ -0,0 +1,90 @@
+import pytest
+import json
+import pickle
+
+from ObjectiveFunction_client.uploader import ResultUploader
+
+
+class FakeObjFun:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.results = []
+
+    def _set_result(self, scenario, parameters, result, force=False,
+                    use_cache=True):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError('upload failed')
+        self.results.append((scenario, parameters, result, force))
+
+
+@pytest.fixture
+def staging(tmp_path):
+    return tmp_path / 'uploads'
+
+
+def test_upload(staging):
+    objfun = FakeObjFun()
+    uploader = ResultUploader(objfun, staging)
+    for i in range(5):
+        uploader.stage('s', {'a': i}, i * 10.)
+    uploader.flush()
+    assert uploader.pending == 0
+    assert objfun.results == [('s', {'a': i}, i * 10., False)
+                              for i in range(5)]
+    # staged results are removed and the journal is reset
+    assert list(staging.glob('*.pickle')) == []
+    assert uploader.journal.stat().st_size == 0
+
+
+def test_upload_retry(staging):
+    objfun = FakeObjFun(failures=2)
+    uploader = ResultUploader(objfun, staging, retries=2, backoff=0)
+    uploader.stage('s', {'a': 1}, 10., force=True)
+    uploader.flush()
+    assert objfun.results == [('s', {'a': 1}, 10., True)]
+
+
+def test_upload_fail(staging):
+    objfun = FakeObjFun(failures=2)
+    uploader = ResultUploader(objfun, staging, retries=1, backoff=0)
+    uploader.stage('s', {'a': 1}, 10.)
+    with pytest.raises(RuntimeError):
+        uploader.flush()
+    # the staged result is kept
+    assert len(list(staging.glob('*.pickle'))) == 1
+    # errors are only reported once
+    uploader.flush()
+
+
+def test_recover(staging):
+    staging.mkdir()
+    # journal left behind by a process that no longer exists
+    with open(staging / 'k1.pickle', 'wb') as f:
+        pickle.dump(({'a': 1}, 10.), f)
+    with open(staging / 'k2.pickle', 'wb') as f:
+        pickle.dump(({'a': 2}, 20.), f)
+    with open(staging / 'journal_host_0.jsonl', 'w') as f:
+        for key in ['k1', 'k2']:
+            f.write(json.dumps({'op': 'stage', 'key': key,
+                                'scenario': 's', 'force': False}) + '\n')
+        f.write(json.dumps({'op': 'done', 'key': 'k1'}) + '\n')
+        f.write('{"op": "do')
+
+    objfun = FakeObjFun()
+    uploader = ResultUploader(objfun, staging, backoff=0)
+    uploader.flush()
+    assert objfun.results == [('s', {'a': 2}, 20., False)]
+    assert not (staging / 'journal_host_0.jsonl').exists()
+
+
+def test_two_uploaders(staging):
+    objfun = FakeObjFun()
+    u1 = ResultUploader(objfun, staging)
+    u2 = ResultUploader(objfun, staging)
+    assert u1.journal != u2.journal
+    u1.stage('s', {'a': 1}, 10.)
+    u2.stage('s', {'a': 2}, 20.)
+    u1.flush()
+    u2.flush()
+    assert len(objfun.results) == 2